@@ -0,0 +1,205 @@
+"""
+转换流水线基准测试
+
+用合成EPUB分别计时各个阶段，报告吞吐量 (MB/s 和 章节/s)：
+    parse      EPUBParser.parse 以及解压、解码全部章节
+    convert    HTMLToMarkdownConverter.convert
+    resources  ResourceProcessor.process_resources
+    generate   OutputGenerator.generate (只写出Markdown，图片已在 resources 中计时)
+
+结果可以保存为JSON，并与保存的基线比较，任一阶段变慢超过阈值时退出码为1。
+
+用法:
+    python benchmarks/bench_pipeline.py [--chapters 50] [--script cjk] [--output result.json]
+    python benchmarks/bench_pipeline.py --baseline baseline.json [--threshold 0.15]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from epub2md import __version__  # noqa: E402
+from epub2md.epub_parser import EPUBParser  # noqa: E402
+from epub2md.converter import HTMLToMarkdownConverter, ENGINES  # noqa: E402
+from epub2md.resource import ResourceProcessor, IMAGE_MODES  # noqa: E402
+from epub2md.output import OutputGenerator  # noqa: E402
+from synthetic_epub import add_arguments, generate_epub, generator_options  # noqa: E402
+
+STAGES = ('parse', 'convert', 'resources', 'generate')
+
+
+def run_once(epub_path, work_dir, engine='html2text', image_mode='optimize', jobs=1):
+    """
+    运行一次完整的流水线，分别记录每个阶段的耗时和处理的数据量
+    
+    Args:
+        epub_path (str): EPUB文件路径
+        work_dir (str): 输出目录
+        engine (str): 转换引擎
+        image_mode (str): 图片处理方式
+        jobs (int): 并行数
+    
+    Returns:
+        dict: 阶段名到 {'seconds', 'bytes', 'chapters'} 的映射
+    """
+    timings = {}
+    
+    with EPUBParser(epub_path) as parser:
+        start = time.perf_counter()
+        book = parser.parse()
+        # 章节内容是惰性读取的，在这里解压解码，使 convert 只计转换本身
+        for chapter in book.chapters.values():
+            chapter.load()
+        timings['parse'] = {'seconds': time.perf_counter() - start, 'bytes': os.path.getsize(epub_path),
+                            'chapters': len(book.chapters)}
+        
+        start = time.perf_counter()
+        converted = HTMLToMarkdownConverter(book, jobs=jobs, engine=engine).convert()
+        timings['convert'] = {'seconds': time.perf_counter() - start,
+                              'bytes': sum(chapter.size() for chapter in book.chapters.values()),
+                              'chapters': len(book.chapters)}
+        
+        start = time.perf_counter()
+        processor = ResourceProcessor(book, os.path.join(work_dir, 'resources'), image_mode=image_mode, jobs=jobs)
+        processor.process_resources()
+        timings['resources'] = {'seconds': time.perf_counter() - start,
+                                'bytes': sum(image.size() for image in book.images.values()),
+                                'chapters': 0}
+        
+        start = time.perf_counter()
+        OutputGenerator(dict(converted, images={}), os.path.join(work_dir, 'output')).generate()
+        timings['generate'] = {'seconds': time.perf_counter() - start,
+                               'bytes': sum(len(md.encode('utf-8')) for md in converted['content'].values()),
+                               'chapters': len(converted['content'])}
+    
+    return timings
+
+
+def run_benchmark(epub_path, repeat=3, **options):
+    """
+    重复运行流水线，每个阶段取最短耗时
+    
+    Returns:
+        dict: 阶段名到 {'seconds', 'mb_per_s', 'chapters_per_s', 'bytes', 'chapters'} 的映射
+    """
+    best = {}
+    for _ in range(repeat):
+        work_dir = tempfile.mkdtemp(prefix='epub2md-bench-')
+        try:
+            timings = run_once(epub_path, work_dir, **options)
+        finally:
+            shutil.rmtree(work_dir)
+        for stage, timing in timings.items():
+            if stage not in best or timing['seconds'] < best[stage]['seconds']:
+                best[stage] = timing
+    
+    stages = {}
+    for stage in STAGES:
+        timing = best[stage]
+        seconds = max(timing['seconds'], 1e-9)
+        stages[stage] = {
+            'seconds': timing['seconds'],
+            'mb_per_s': timing['bytes'] / 1e6 / seconds,
+            'chapters_per_s': timing['chapters'] / seconds if timing['chapters'] else None,
+            'bytes': timing['bytes'],
+            'chapters': timing['chapters'],
+        }
+    return stages
+
+
+def compare(result, baseline, threshold):
+    """
+    与基线比较各阶段耗时
+    
+    Args:
+        result (dict): 本次结果
+        baseline (dict): 基线结果
+        threshold (float): 允许变慢的比例，如 0.1 表示 10%
+    
+    Returns:
+        list: (阶段, 基线耗时, 本次耗时, 比值, 是否退化)
+    """
+    rows = []
+    for stage in STAGES:
+        if stage not in baseline['stages']:
+            continue
+        before = baseline['stages'][stage]['seconds']
+        after = result['stages'][stage]['seconds']
+        ratio = after / before if before else float('inf')
+        rows.append((stage, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--epub', help='使用已有的EPUB文件代替合成的书')
+    parser.add_argument('--engine', choices=ENGINES, default='html2text', help='转换引擎')
+    parser.add_argument('--images-mode', choices=IMAGE_MODES, default='optimize', help='图片处理方式')
+    parser.add_argument('--jobs', type=int, default=1, help='并行数')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数，取最小值')
+    parser.add_argument('--output', help='将结果写入JSON文件')
+    parser.add_argument('--baseline', help='与基线JSON比较')
+    parser.add_argument('--threshold', type=float, default=0.1, help='判定为退化的变慢比例')
+    args = parser.parse_args()
+    
+    config = {'engine': args.engine, 'image_mode': args.images_mode, 'jobs': args.jobs, 'repeat': args.repeat}
+    temp_dir = tempfile.mkdtemp(prefix='epub2md-bench-')
+    try:
+        if args.epub:
+            epub_path = args.epub
+            config['epub'] = os.path.basename(args.epub)
+        else:
+            epub_path = os.path.join(temp_dir, 'synthetic.epub')
+            options = generator_options(args)
+            book = generate_epub(epub_path, **options)
+            config['synthetic'] = dict(options, image_size='%dx%d' % options['image_size'], **book)
+        
+        stages = run_benchmark(epub_path, repeat=args.repeat, engine=args.engine, image_mode=args.images_mode,
+                               jobs=args.jobs)
+    finally:
+        shutil.rmtree(temp_dir)
+    
+    result = {
+        'version': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': config,
+        'stages': stages,
+    }
+    
+    print(f"{'阶段':<10} {'耗时(ms)':>10} {'MB/s':>10} {'章节/s':>10}")
+    for stage in STAGES:
+        timing = stages[stage]
+        chapters_per_s = '-' if timing['chapters_per_s'] is None else f"{timing['chapters_per_s']:.1f}"
+        print(f"{stage:<10} {timing['seconds'] * 1000:>10.2f} {timing['mb_per_s']:>10.2f} {chapters_per_s:>10}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print("警告: 基线的配置与本次不同，比较结果可能没有意义")
+        
+        print(f"\n与基线比较 (阈值 {args.threshold:.0%}):")
+        regressed = False
+        for stage, before, after, ratio, slower in compare(result, baseline, args.threshold):
+            mark = '  退化' if slower else ''
+            print(f"{stage:<10} {before * 1000:>10.2f} -> {after * 1000:>10.2f} ms  {ratio:>6.2f}x{mark}")
+            regressed = regressed or slower
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
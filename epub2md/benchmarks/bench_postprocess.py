@@ -0,0 +1,96 @@
+"""
+Markdown后处理微基准测试
+
+比较单次逐行扫描的 _postprocess_markdown 与原来的四次正则替换在大型合成章节上的耗时，
+并确认两者输出一致。
+
+用法:
+    python benchmarks/bench_postprocess.py [--paragraphs 2000] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from epub2md.converter import HTMLToMarkdownConverter, _create_html2text  # noqa: E402
+
+
+def postprocess_regex(markdown):
+    """原来的实现: 四次整篇正则替换"""
+    markdown = re.sub(r'^(#+)(.*?)$', r'\1 \2', markdown, flags=re.MULTILINE)
+    markdown = re.sub(r'^(\s*[-*+])\s{2,}', r'\1 ', markdown, flags=re.MULTILINE)
+    markdown = re.sub(r'([^\n])\n([^\n])', r'\1\n\n\2', markdown)
+    markdown = re.sub(r'\n{3,}', '\n\n', markdown)
+    return markdown
+
+
+def make_chapter(paragraphs, seed=0):
+    """
+    生成合成章节，并用html2text转换为后处理之前的Markdown
+    
+    Args:
+        paragraphs (int): 段落数
+        seed (int): 随机种子
+    
+    Returns:
+        str: 未经后处理的Markdown
+    """
+    rnd = random.Random(seed)
+    words = ['epub', 'markdown', '转换', '章节', 'lorem', 'ipsum', '图片', 'dolor', 'sit', 'amet']
+    parts = ['<html><body>']
+    for i in range(paragraphs):
+        if i % 20 == 0:
+            parts.append('<h%d>Section %d</h%d>' % (i % 3 + 1, i, i % 3 + 1))
+        kind = rnd.random()
+        text = ' '.join(rnd.choice(words) for _ in range(rnd.randint(10, 80)))
+        if kind < 0.1:
+            parts.append('<ul>%s</ul>' % ''.join('<li>%s</li>' % w for w in text.split()[:5]))
+        elif kind < 0.15:
+            parts.append('<blockquote><p>%s</p></blockquote>' % text)
+        elif kind < 0.2:
+            parts.append('<p>%s<br/>%s</p>' % (text, text[:30]))
+        else:
+            parts.append('<p>%s <b>%s</b></p>' % (text, rnd.choice(words)))
+    parts.append('</body></html>')
+    return _create_html2text().handle(''.join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--paragraphs', type=int, default=2000, help='每个合成章节的段落数')
+    parser.add_argument('--chapters', type=int, default=3, help='合成章节数')
+    parser.add_argument('--repeat', type=int, default=5, help='重复次数，取最小值')
+    args = parser.parse_args()
+    
+    converter = HTMLToMarkdownConverter(None)
+    chapters = [make_chapter(args.paragraphs, seed) for seed in range(args.chapters)]
+    
+    for markdown in chapters:
+        if converter._postprocess_markdown(markdown, 'bench') != postprocess_regex(markdown):
+            sys.exit('输出不一致')
+    
+    def run_regex():
+        for markdown in chapters:
+            postprocess_regex(markdown)
+    
+    def run_fused():
+        for markdown in chapters:
+            converter._postprocess_markdown(markdown, 'bench')
+    
+    size = sum(len(markdown) for markdown in chapters)
+    regex_time = min(timeit.repeat(run_regex, number=1, repeat=args.repeat))
+    fused_time = min(timeit.repeat(run_fused, number=1, repeat=args.repeat))
+    
+    print(f"章节: {args.chapters} x {args.paragraphs} 段, 共 {size} 字符")
+    print(f"正则替换:   {regex_time * 1000:.2f} ms")
+    print(f"单次扫描:   {fused_time * 1000:.2f} ms")
+    print(f"加速比:     {regex_time / fused_time:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
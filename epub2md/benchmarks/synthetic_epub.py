@@ -0,0 +1,208 @@
+"""
+合成EPUB生成器
+
+按给定的章节数、章节大小、目录深度、图片数量和尺寸以及文字类型(拉丁或中日韩)生成
+EPUB文件，供基准测试使用。相同的参数和随机种子总是生成相同的内容。
+
+用法:
+    python benchmarks/synthetic_epub.py out.epub [--chapters 50] [--chapter-size 20] [--script cjk]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.epub_builder import build_epub, chapter_html  # noqa: E402
+
+LATIN_WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do',
+               'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua', 'markdown']
+CJK_CHARS = ('的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说'
+             '产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从')
+CJK_PUNCTUATION = '，，，。、；'
+SCRIPTS = ('latin', 'cjk')
+
+
+def make_sentence(rnd, script):
+    """生成一个句子"""
+    if script == 'cjk':
+        length = rnd.randint(8, 40)
+        chars = [rnd.choice(CJK_CHARS) for _ in range(length)]
+        for position in range(6, length - 2, rnd.randint(6, 12)):
+            chars[position] = rnd.choice(CJK_PUNCTUATION)
+        return ''.join(chars) + '。'
+    words = [rnd.choice(LATIN_WORDS) for _ in range(rnd.randint(6, 24))]
+    return ' '.join(words).capitalize() + '.'
+
+
+def chapter_title(index, script):
+    """章节标题"""
+    return '第%d章' % index if script == 'cjk' else 'Chapter %d' % index
+
+
+def make_chapter_body(rnd, index, size, toc_depth, script, image_hrefs):
+    """
+    生成章节正文
+    
+    Args:
+        rnd (random.Random): 随机数生成器
+        index (int): 章节序号
+        size (int): 正文的大致字符数
+        toc_depth (int): 目录深度，正文中按深度生成带id的小节标题
+        script (str): 'latin' 或 'cjk'
+        image_hrefs (list): 本章引用的图片路径(相对于章节)
+    
+    Returns:
+        tuple: (正文HTML, 小节列表 [(级别, id, 标题)])
+    """
+    parts = ['<h1>%s</h1>' % chapter_title(index, script)]
+    sections = []
+    # 每个章节有若干小节，深度为2时为二级标题，深度为3时每个二级小节下再有三级小节
+    section_count = 3 if toc_depth > 1 else 0
+    length = 0
+    paragraph = 0
+    images = list(image_hrefs)
+    
+    while True:
+        if section_count and paragraph % 8 == 0 and len(sections) < section_count * (toc_depth - 1):
+            level = 2 + len(sections) % max(toc_depth - 1, 1)
+            section_id = 's%d_%d' % (index, len(sections))
+            title = make_sentence(rnd, script)[:20]
+            sections.append((level, section_id, title))
+            parts.append('<h%d id="%s">%s</h%d>' % (level, section_id, title, level))
+        
+        text = ' '.join(make_sentence(rnd, script) for _ in range(rnd.randint(2, 6)))
+        kind = rnd.random()
+        if images and kind < 0.2:
+            parts.append('<p><img src="%s" alt=""/></p>' % images.pop())
+        elif kind < 0.3:
+            parts.append('<ul>%s</ul>' % ''.join('<li>%s</li>' % make_sentence(rnd, script) for _ in range(3)))
+        elif kind < 0.35:
+            parts.append('<blockquote><p>%s</p></blockquote>' % text)
+        else:
+            parts.append('<p>%s <b>%s</b> <i>%s</i></p>' % (text, make_sentence(rnd, script),
+                                                             make_sentence(rnd, script)))
+        length += len(text)
+        paragraph += 1
+        if length >= size and not images:
+            break
+    
+    return ''.join(parts), sections
+
+
+def make_image(index, width, height, fmt):
+    """生成一张确定性的图片 (曼德博集合)，返回编码后的数据"""
+    from PIL import Image
+    
+    offset = (index % 7) * 0.1
+    image = Image.effect_mandelbrot((width, height), (-2.0 + offset, -1.2, 0.8 - offset, 1.2), 64)
+    if fmt == 'JPEG':
+        image = Image.merge('RGB', (image, image.rotate(90, expand=False), image.transpose(Image.FLIP_LEFT_RIGHT)))
+    output = io.BytesIO()
+    image.save(output, fmt)
+    return output.getvalue()
+
+
+def generate_epub(path, chapters=20, chapter_size=20000, toc_depth=2, images=10, image_size=(800, 600),
+                  script='latin', seed=0):
+    """
+    生成合成EPUB
+    
+    Args:
+        path (str): 输出路径
+        chapters (int): 章节数
+        chapter_size (int): 每章正文的大致字符数
+        toc_depth (int): 目录深度 (1 为只有章节)
+        images (int): 图片数量，JPEG和PNG交替，平均分布在各章节中
+        image_size (tuple): 图片尺寸 (宽, 高)
+        script (str): 'latin' 或 'cjk'
+        seed (int): 随机种子
+    
+    Returns:
+        dict: 生成的书的统计信息
+    """
+    if script not in SCRIPTS:
+        raise ValueError(f"未知的文字类型: {script}")
+    rnd = random.Random(seed)
+    
+    image_items = []
+    for i in range(images):
+        fmt, ext, media_type = ('JPEG', 'jpg', 'image/jpeg') if i % 2 == 0 else ('PNG', 'png', 'image/png')
+        image_items.append(('img%d' % i, 'Images/img%d.%s' % (i, ext), media_type,
+                            make_image(i, image_size[0], image_size[1], fmt)))
+    
+    chapter_items = []
+    toc = []
+    html_bytes = 0
+    for index in range(1, chapters + 1):
+        chapter_images = ['../' + href for _, href, _, _ in image_items[index - 1::chapters]]
+        body, sections = make_chapter_body(rnd, index, chapter_size, toc_depth, script, chapter_images)
+        html = chapter_html(chapter_title(index, script), body)
+        href = 'Text/chapter%d.xhtml' % index
+        chapter_items.append(('chapter%d' % index, href, html))
+        html_bytes += len(html.encode('utf-8'))
+        
+        # 按标题级别构建嵌套目录
+        entry = (chapter_title(index, script), href, [])
+        stack = [(1, entry)]
+        for level, section_id, title in sections:
+            while stack[-1][0] >= level:
+                stack.pop()
+            child = (title, '%s#%s' % (href, section_id), [])
+            stack[-1][1][2].append(child)
+            stack.append((level, child))
+        toc.append(entry)
+    
+    build_epub(path, chapter_items, image_items, toc,
+               metadata={'title': 'Synthetic %s book' % script, 'creator': 'epub2md', 'language':
+                         'zh-CN' if script == 'cjk' else 'en'})
+    return {
+        'chapters': chapters,
+        'html_bytes': html_bytes,
+        'images': images,
+        'image_bytes': sum(len(item[3]) for item in image_items),
+        'epub_bytes': os.path.getsize(path),
+    }
+
+
+def add_arguments(parser):
+    """添加生成器的命令行参数"""
+    parser.add_argument('--chapters', type=int, default=20, help='章节数')
+    parser.add_argument('--chapter-size', type=int, default=20, help='每章正文的大致大小 (千字符)')
+    parser.add_argument('--toc-depth', type=int, default=2, help='目录深度')
+    parser.add_argument('--images', type=int, default=10, help='图片数量')
+    parser.add_argument('--image-size', default='800x600', help='图片尺寸，如 800x600')
+    parser.add_argument('--script', choices=SCRIPTS, default='latin', help='正文文字类型')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+
+
+def generator_options(args):
+    """从命令行参数取出 generate_epub 的参数"""
+    width, height = (int(value) for value in args.image_size.lower().split('x'))
+    return {
+        'chapters': args.chapters,
+        'chapter_size': args.chapter_size * 1000,
+        'toc_depth': args.toc_depth,
+        'images': args.images,
+        'image_size': (width, height),
+        'script': args.script,
+        'seed': args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('output', help='输出的EPUB路径')
+    add_arguments(parser)
+    args = parser.parse_args()
+    
+    stats = generate_epub(args.output, **generator_options(args))
+    print(f"已生成 {args.output}: {stats['chapters']} 章, HTML {stats['html_bytes'] / 1e6:.2f} MB, "
+          f"{stats['images']} 张图片 {stats['image_bytes'] / 1e6:.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,4 +2,40 @@
 epub2md - EPUB到Markdown转换工具
 """
 
+import sys
+
 __version__ = '0.1.0'
+
+# 库接口在第一次访问时才导入，import epub2md 和命令行启动不必加载转换流程
+_LAZY_EXPORTS = {
+    'Book': 'model',
+    'Chapter': 'model',
+    'ImageAsset': 'model',
+    'TocEntry': 'model',
+    'SearchIndex': 'search',
+    'convert_book': 'pipeline',
+    'iter_chapters': 'pipeline',
+    'convert_async': 'aio',
+    'convert_many_async': 'aio',
+    'iter_chapters_async': 'aio',
+}
+
+__all__ = ['__version__'] + list(_LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module('.' + module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+if sys.version_info < (3, 7):
+    # 模块级 __getattr__ 需要Python 3.7
+    from .model import Book, Chapter, ImageAsset, TocEntry  # noqa: E402,F401
+    from .pipeline import convert_book, iter_chapters  # noqa: E402,F401
+    from .search import SearchIndex  # noqa: E402,F401
+    from .aio import convert_async, convert_many_async, iter_chapters_async  # noqa: E402,F401
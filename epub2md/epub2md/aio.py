@@ -0,0 +1,113 @@
+"""
+异步接口 - 在asyncio程序中转换电子书而不阻塞事件循环
+"""
+
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from .pipeline import convert_book, iter_chapters
+
+# 异步转换时写入图片的默认并发线程数
+DEFAULT_IMAGE_JOBS = 4
+
+
+class _NullSemaphore:
+    """未指定并发限制时使用的空信号量"""
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+def _running_loop():
+    """当前协程所在的事件循环 (Python 3.6 没有 get_running_loop，协程中 get_event_loop 返回同一个循环)"""
+    get_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+    return get_running_loop()
+
+
+async def convert_async(input_file, output=None, semaphore=None, executor=None, **options):
+    """
+    异步转换一本EPUB电子书
+    
+    解析、转换和输出在执行器中进行，图片在多个线程中并发写入。多本书共用同一个
+    信号量即可限制同时在途的书籍数，避免CPU被过度占用。
+    
+    Args:
+        input_file (str): EPUB文件路径
+        output (str): 输出目录或文件名，默认使用输入文件名
+        semaphore (asyncio.Semaphore): 限制并发的信号量，为None时不限制
+        executor: 执行转换的执行器，默认为事件循环的默认执行器(线程池)；
+                  CPU密集的场景可以传入 ProcessPoolExecutor
+        **options: 传给 convert_book 的转换选项
+    
+    Returns:
+        str: 输出路径
+    """
+    options.setdefault('image_jobs', DEFAULT_IMAGE_JOBS)
+    loop = _running_loop()
+    async with semaphore or _NullSemaphore():
+        return await loop.run_in_executor(executor, functools.partial(convert_book, input_file, output, **options))
+
+
+async def convert_many_async(input_files, output_dir, limit=None, executor=None, **options):
+    """
+    异步批量转换多本电子书，同时最多转换 limit 本
+    
+    Args:
+        input_files (list): EPUB文件路径
+        output_dir (str): 输出目录
+        limit (int): 同时转换的书籍数，默认为CPU核数
+        executor: 执行转换的执行器
+        **options: 传给 convert_book 的转换选项
+    
+    Returns:
+        list: 每本书的输出路径或异常，顺序与 input_files 一致
+    """
+    from .batch import plan_outputs
+    
+    semaphore = asyncio.Semaphore(limit or os.cpu_count() or 1)
+    outputs = plan_outputs(input_files, output_dir, options.get('single_file', False))
+    os.makedirs(output_dir, exist_ok=True)
+    return await asyncio.gather(*[
+        convert_async(input_file, output, semaphore=semaphore, executor=executor, **options)
+        for input_file, output in zip(input_files, outputs)
+    ], return_exceptions=True)
+
+
+async def iter_chapters_async(epub_path, semaphore=None, executor=None, **options):
+    """
+    异步地按spine顺序逐个转换章节
+    
+    每个章节在执行器中转换，转换期间事件循环可以处理其他任务。迭代期间一直占用
+    信号量。生成器持有的缓存连接等对象只能在创建它们的线程中使用，因此生成器的
+    推进和关闭都在同一个线程中进行：默认为每次迭代创建一个单线程执行器，结束时关闭。
+    
+    Args:
+        epub_path (str): EPUB文件路径
+        semaphore (asyncio.Semaphore): 限制并发的信号量，为None时不限制
+        executor: 只有一个工作线程的线程执行器，为None时使用迭代专用的执行器；
+                  不能是进程池或有多个线程的线程池
+        **options: 传给 iter_chapters 的选项
+    
+    Yields:
+        Chapter: 转换后的章节
+    """
+    loop = _running_loop()
+    async with semaphore or _NullSemaphore():
+        with ExitStack() as stack:
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=1)
+                stack.callback(executor.shutdown, wait=False)
+            chapters = iter_chapters(epub_path, **options)
+            try:
+                while True:
+                    chapter = await loop.run_in_executor(executor, next, chapters, None)
+                    if chapter is None:
+                        break
+                    yield chapter
+            finally:
+                await loop.run_in_executor(executor, chapters.close)
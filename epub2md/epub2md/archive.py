@@ -0,0 +1,437 @@
+"""
+输出目标模块 - 将输出文件写入目录，或直接流式写入zip/tar归档
+
+写入目录时可以先写入暂存目录，完成后再移动到位。归档中的文件布局与输出目录相同。归档按顺序写入，不需要在磁盘上生成中间文件，
+也可以写到标准输出。zipfile 和 tarfile 在创建归档时才导入。
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from .constants import ARCHIVE_FORMATS, FSYNC_POLICIES
+
+# 小型写入线程池的默认线程数
+WRITE_JOBS = 4
+
+# 创建临时名称时的最大尝试次数
+_TEMP_ATTEMPTS = 100
+
+# 向归档中复制文件时每次读取的大小
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+# 扩展名到归档格式，较长的扩展名在前
+ARCHIVE_EXTENSIONS = (
+    ('.tar.gz', 'tar.gz'), ('.tgz', 'tar.gz'), ('.tar.bz2', 'tar.bz2'), ('.tar.xz', 'tar.xz'),
+    ('.tar.zst', 'tar.zst'), ('.tzst', 'tar.zst'), ('.tar', 'tar'), ('.zip', 'zip'),
+)
+
+
+def archive_format_for(path):
+    """
+    根据文件名确定归档格式，'-' (标准输出) 和文件对象默认为 tar
+    
+    Args:
+        path (str): 归档路径
+    
+    Returns:
+        str: 归档格式
+    """
+    if path == '-' or not isinstance(path, str):
+        return 'tar'
+    lower = path.lower()
+    for ext, archive_format in ARCHIVE_EXTENSIONS:
+        if lower.endswith(ext):
+            return archive_format
+    raise ValueError(f"无法根据文件名确定归档格式: {path}，请指定归档格式 ({', '.join(ARCHIVE_FORMATS)})")
+
+
+class DirectorySink:
+    """
+    将输出文件写入目录
+    
+    staged 为True时所有文件先写入暂存目录，close() 时逐个重命名到输出目录中的对应位置，
+    每个文件原子地替换同名的旧文件，输出目录中的其他文件保持不变。转换中途失败或进程
+    崩溃不会在输出目录中留下写了一半的文件。暂存目录是输出目录旁边以 . 开头的目录；
+    输出目录是挂载点 (与上级目录不在同一文件系统) 或上级目录不可写时，暂存目录放在
+    输出目录中，保证重命名在同一文件系统内进行。
+    """
+    
+    def __init__(self, root, staged=False, jobs=1, fsync='none'):
+        """
+        初始化输出目录
+        
+        Args:
+            root (str): 输出目录
+            staged (bool): 是否先写入暂存目录，完成时再移动到输出目录
+            jobs (int): 写入文件的线程数，大于1时 write() 在线程池中进行
+            fsync (str): 同步策略 (见 FSYNC_POLICIES)
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"未知的同步策略: {fsync}")
+        
+        self.root = root
+        self.fsync = fsync
+        self.jobs = max(1, jobs or 1)
+        self.staging = None
+        if staged:
+            self.staging = _make_temp_dir(_staging_parent(root), f".{os.path.basename(os.path.abspath(root))}.")
+        # 实际写入的目录
+        self.path = self.staging or root
+        self.executor = None
+        self.pending = deque()
+        self.created = set()
+    
+    def _path(self, name):
+        path = os.path.join(self.path, *name.split('/'))
+        parent = os.path.dirname(path) or '.'
+        if parent not in self.created:
+            os.makedirs(parent, exist_ok=True)
+            self.created.add(parent)
+        return path
+    
+    def write(self, name, data, compress=True):
+        """
+        写入一个文件，整个文件一次写出
+        
+        Args:
+            name (str): 相对于输出根目录的路径，以 / 分隔
+            data (bytes): 文件内容
+            compress (bool): 归档时是否压缩，目录中忽略
+        """
+        path = self._path(name)
+        if self.jobs == 1:
+            _write_file(path, data, self.fsync != 'none')
+            return
+        
+        # 在途的写入不超过 jobs*2 个，避免待写的内容堆积在内存中
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(max_workers=self.jobs)
+        self.pending.append(self.executor.submit(_write_file, path, data, self.fsync != 'none'))
+        if len(self.pending) >= self.jobs * 2:
+            self.pending.popleft().result()
+    
+    @contextmanager
+    def open(self, name):
+        """
+        以文本方式逐步写入一个文件
+        
+        未使用暂存目录时先写入同目录下的临时文件，完成后重命名，不会留下写了一半的文件
+        """
+        path = self._path(name)
+        if self.staging is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                yield f
+                self._sync(f)
+            return
+        
+        fd, temp_path = _make_temp_file(os.path.dirname(path) or '.', f".{os.path.basename(path)}.")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                yield f
+                self._sync(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    
+    def _sync(self, f):
+        if self.fsync != 'none':
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _wait(self):
+        """等待所有在线程池中的写入完成，有写入失败时抛出第一个错误"""
+        try:
+            while self.pending:
+                self.pending.popleft().result()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+    
+    def close(self):
+        """
+        等待写入完成，使用暂存目录时将其中的文件逐个移动到输出目录
+        
+        失败时删除暂存目录，已经移动的文件保留在输出目录中。
+        """
+        try:
+            self._wait()
+            if self.staging is None:
+                return
+            
+            if self.fsync == 'all':
+                for dir_path in self.created | {self.staging}:
+                    _fsync_dir(dir_path)
+            
+            moved = {os.path.abspath(self.root)}
+            os.makedirs(self.root, exist_ok=True)
+            for dir_path, dirs, files in os.walk(self.staging):
+                target_dir = os.path.join(self.root, os.path.relpath(dir_path, self.staging))
+                os.makedirs(target_dir, exist_ok=True)
+                for name in files:
+                    os.replace(os.path.join(dir_path, name), os.path.join(target_dir, name))
+                moved.add(os.path.abspath(target_dir))
+            
+            if self.fsync == 'all':
+                for dir_path in moved | {os.path.dirname(os.path.abspath(self.root))}:
+                    _fsync_dir(dir_path)
+        finally:
+            self.abort()
+    
+    def abort(self):
+        """转换失败时丢弃暂存目录，输出目录保持不变"""
+        try:
+            self._wait()
+        except Exception:
+            pass
+        if self.staging is not None:
+            shutil.rmtree(self.staging, ignore_errors=True)
+            self.staging = None
+
+
+def _staging_parent(root):
+    """
+    暂存目录所在的目录
+    
+    通常是输出目录的上级目录；输出目录已存在且与上级目录不在同一文件系统 (挂载点)，
+    或上级目录不可写时使用输出目录本身
+    """
+    root = os.path.abspath(root)
+    parent = os.path.dirname(root)
+    if os.path.isdir(root):
+        if os.stat(root).st_dev != os.stat(parent).st_dev or not os.access(parent, os.W_OK):
+            return root
+    else:
+        os.makedirs(parent, exist_ok=True)
+    return parent
+
+
+def _temp_name(directory, prefix):
+    """目录中以 prefix 开头、以 .tmp 结尾的随机名称"""
+    return os.path.join(directory, f"{prefix}{os.urandom(6).hex()}.tmp")
+
+
+def _make_temp_dir(directory, prefix):
+    """创建临时目录，权限按当前umask (不像 tempfile.mkdtemp 只有所有者可访问)"""
+    for _ in range(_TEMP_ATTEMPTS):
+        path = _temp_name(directory, prefix)
+        try:
+            os.mkdir(path, 0o777)
+            return path
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"无法在 {directory} 中创建临时目录")
+
+
+def _make_temp_file(directory, prefix):
+    """
+    创建临时文件，权限按当前umask
+    
+    Returns:
+        tuple: (文件描述符, 路径)
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    for _ in range(_TEMP_ATTEMPTS):
+        path = _temp_name(directory, prefix)
+        try:
+            return os.open(path, flags, 0o666), path
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"无法在 {directory} 中创建临时文件")
+
+
+def _write_file(path, data, fsync=False):
+    """用一次系统调用写出整个文件 (内容过大时操作系统可能只写入一部分，继续写剩余部分)"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        if fsync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(path):
+    """同步目录项，使其中的新建和重命名在崩溃后仍然存在 (Windows上不支持，忽略)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class _ArchiveSink(ABC):
+    """归档输出的公共部分: 管理底层文件的关闭，失败时删除不完整的归档"""
+    
+    def __init__(self, path, fileobj):
+        self.path = path
+        self.fileobj = fileobj
+    
+    @abstractmethod
+    def _finish(self):
+        """结束归档的写入"""
+    
+    def close(self):
+        """完成归档"""
+        self._finish()
+        if self.path != '-':
+            self.fileobj.close()
+        else:
+            self.fileobj.flush()
+    
+    def abort(self):
+        """转换失败时丢弃不完整的归档"""
+        try:
+            self._finish()
+        except Exception:
+            pass
+        if self.path != '-':
+            self.fileobj.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class ZipSink(_ArchiveSink):
+    """流式写入zip归档，文本压缩存储，图片直接存储"""
+    
+    def __init__(self, path, fileobj):
+        import zipfile
+        
+        super().__init__(path, fileobj)
+        # 输出不可寻址(如管道)时zipfile会改用数据描述符，仍然可以顺序写入
+        self.zip_file = zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED)
+    
+    def write(self, name, data, compress=True):
+        import zipfile
+        
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        info.external_attr = 0o644 << 16
+        self.zip_file.writestr(info, data)
+    
+    def write_stream(self, name, fileobj, size, compress=True):
+        """
+        从文件对象按块复制一个成员，不在内存中保存整个文件
+        
+        Args:
+            name (str): 成员名
+            fileobj: 可读的二进制文件对象
+            size (int): 文件大小，用于决定是否需要zip64扩展
+            compress (bool): 是否压缩
+        """
+        import zipfile
+        
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        info.external_attr = 0o644 << 16
+        info.file_size = size
+        with self.zip_file.open(info, 'w') as dst:
+            shutil.copyfileobj(fileobj, dst, _COPY_CHUNK_SIZE)
+    
+    @contextmanager
+    def open(self, name):
+        import zipfile
+        
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        # 不使用 force_zip64: Info-ZIP 的 unzip 会把带zip64扩展的UTF-8文件名报告为不一致
+        with io.TextIOWrapper(self.zip_file.open(info, 'w'), encoding='utf-8') as f:
+            yield f
+    
+    def _finish(self):
+        self.zip_file.close()
+
+
+class TarSink(_ArchiveSink):
+    """流式写入tar归档，可选gzip/bz2/xz/zstd压缩"""
+    
+    def __init__(self, path, fileobj, compression=''):
+        import tarfile
+        
+        super().__init__(path, fileobj)
+        self.compressor = None
+        if compression == 'zst':
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError("写入 .tar.zst 需要安装 zstandard: pip install zstandard") from None
+            self.compressor = zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False)
+            self.tar_file = tarfile.open(fileobj=self.compressor, mode='w|', format=tarfile.PAX_FORMAT)
+        else:
+            self.tar_file = tarfile.open(fileobj=fileobj, mode='w|' + compression, format=tarfile.PAX_FORMAT)
+    
+    def write(self, name, data, compress=True):
+        import tarfile
+        
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        info.mode = 0o644
+        self.tar_file.addfile(info, io.BytesIO(data))
+    
+    def write_stream(self, name, fileobj, size, compress=True):
+        """从文件对象按块复制一个成员，size 必须与实际大小一致 (见 ZipSink.write_stream)"""
+        import tarfile
+        
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = time.time()
+        info.mode = 0o644
+        self.tar_file.addfile(info, fileobj)
+    
+    @contextmanager
+    def open(self, name):
+        # tar需要预先知道成员的大小，先在内存中生成整个文件
+        buffer = io.StringIO()
+        yield buffer
+        self.write(name, buffer.getvalue().encode('utf-8'))
+    
+    def _finish(self):
+        self.tar_file.close()
+        if self.compressor is not None:
+            self.compressor.close()
+
+
+def open_archive(path, archive_format=None):
+    """
+    创建归档输出
+    
+    Args:
+        path (str): 归档路径，'-' 表示标准输出；也可以是可写的二进制文件对象，完成后不会被关闭
+        archive_format (str): 归档格式，默认根据文件名确定
+    
+    Returns:
+        ZipSink 或 TarSink: 完成后调用 close()，失败时调用 abort()
+    """
+    archive_format = archive_format or archive_format_for(path)
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f"未知的归档格式: {archive_format}")
+    
+    if not isinstance(path, str):
+        fileobj, path = path, '-'
+    else:
+        fileobj = sys.stdout.buffer if path == '-' else open(path, 'wb')
+    try:
+        if archive_format == 'zip':
+            return ZipSink(path, fileobj)
+        return TarSink(path, fileobj, archive_format[4:])
+    except BaseException:
+        if path != '-':
+            fileobj.close()
+            os.remove(path)
+        raise
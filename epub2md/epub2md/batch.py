@@ -0,0 +1,229 @@
+"""
+批量转换模块 - 在进程池中转换多本电子书
+"""
+
+import os
+import glob
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from .pipeline import convert_book, default_output_path
+
+
+def collect_inputs(paths):
+    """
+    展开输入路径
+    
+    目录递归查找其中的 .epub 文件，不存在的路径按通配符展开，
+    既不存在也没有匹配的路径原样保留，转换时报告为失败。
+    
+    Args:
+        paths (list): 文件、目录或通配符
+    
+    Returns:
+        list: EPUB文件路径，去重并保持顺序
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                for name in sorted(names):
+                    if name.lower().endswith('.epub'):
+                        files.append(os.path.join(root, name))
+        elif os.path.exists(path):
+            files.append(path)
+        else:
+            files.extend(sorted(glob.glob(path, recursive=True)) or [path])
+    
+    seen = set()
+    unique = []
+    for path in files:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+
+def plan_outputs(input_files, output_dir, single_file=False):
+    """
+    为每本书分配输出路径，重名时依次加上序号
+    
+    Args:
+        input_files (list): EPUB文件路径
+        output_dir (str): 输出目录
+        single_file (bool): 是否输出为单个文件
+    
+    Returns:
+        list: 与 input_files 一一对应的输出路径
+    """
+    outputs = []
+    taken = set()
+    for input_file in input_files:
+        name = default_output_path(input_file, single_file)
+        base_name, ext = os.path.splitext(name) if single_file else (name, '')
+        counter = 1
+        while name.lower() in taken:
+            counter += 1
+            name = f"{base_name}_{counter}{ext}"
+        taken.add(name.lower())
+        outputs.append(os.path.join(output_dir, name))
+    return outputs
+
+
+def _convert_one(task):
+    """
+    在工作进程中转换一本书，异常作为结果返回而不是抛出
+    
+    Args:
+        task (tuple): (序号, 输入文件, 输出路径, 转换选项)
+    
+    Returns:
+        dict: 转换结果
+    """
+    index, input_file, output, options = task
+    start = time.perf_counter()
+    try:
+        if not os.path.isfile(input_file):
+            raise FileNotFoundError(f"文件不存在: {input_file}")
+        convert_book(input_file, output, **options)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return {
+        'index': index,
+        'input': input_file,
+        'output': output,
+        'ok': error is None,
+        'error': error,
+        'elapsed': time.perf_counter() - start
+    }
+
+
+def _failure(task, error):
+    """工作进程异常退出等无法得到转换结果时，生成失败的结果"""
+    index, input_file, output, _ = task
+    return {'index': index, 'input': input_file, 'output': output, 'ok': False,
+            'error': f"{type(error).__name__}: {error}", 'elapsed': 0.0}
+
+
+def _convert_isolated(task):
+    """在单独的工作进程中转换一本书，进程异常退出只影响这本书"""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        try:
+            return executor.submit(_convert_one, task).result()
+        except BrokenProcessPool as e:
+            return _failure(task, e)
+
+
+def _run_pool(pending, jobs, finish):
+    """
+    在一个进程池中转换 pending 中的书，同时最多提交 jobs 本
+    
+    进程池因工作进程异常退出 (如被系统因内存不足杀掉) 而损坏后不再提交新的任务，
+    未开始的书留在 pending 中。
+    
+    Args:
+        pending (deque): 待转换的任务，取出已提交的任务
+        jobs (int): 工作进程数
+        finish (callable): 接收每本书的结果
+    
+    Returns:
+        list: 进程池损坏时正在转换的任务及其异常 (任务, 异常)，其中至少有一个导致了进程异常退出
+    """
+    suspects = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while pending or running:
+            while pending and len(running) < jobs and not suspects:
+                task = pending.popleft()
+                try:
+                    running[executor.submit(_convert_one, task)] = task
+                except BrokenProcessPool:
+                    pending.appendleft(task)
+                    break
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                try:
+                    finish(future.result())
+                except BrokenProcessPool as e:
+                    suspects.append((task, e))
+                except Exception as e:
+                    finish(_failure(task, e))
+    return suspects
+
+
+def convert_many(input_files, output_dir, jobs=1, progress=None, **options):
+    """
+    批量转换电子书
+    
+    每本书在独立的工作进程中转换，单本书出错不影响其他书。某本书导致工作进程异常退出时，
+    只有这本书失败：当时正在转换的书逐一在单独的进程中重新转换，其余的书换用新的进程池。
+    
+    Args:
+        input_files (list): EPUB文件路径
+        output_dir (str): 输出目录
+        jobs (int): 同时转换的书籍数
+        progress (callable): 每本书完成时调用 progress(结果, 已完成数, 总数)
+        **options: 传给 convert_book 的转换选项
+    
+    Returns:
+        list: 每本书的转换结果，顺序与 input_files 一致
+    """
+    outputs = plan_outputs(input_files, output_dir, options.get('single_file', False))
+    tasks = [(index, input_file, output, options)
+             for index, (input_file, output) in enumerate(zip(input_files, outputs))]
+    results = [None] * len(tasks)
+    done = [0]
+    
+    os.makedirs(output_dir, exist_ok=True)
+    
+    def finish(result):
+        results[result['index']] = result
+        done[0] += 1
+        if progress is not None:
+            progress(result, done[0], len(tasks))
+    
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            finish(_convert_one(task))
+        return results
+    
+    pending = deque(tasks)
+    while pending:
+        suspects = _run_pool(pending, jobs, finish)
+        if len(suspects) == 1:
+            # 只有这一本书在转换，它就是导致进程退出的书
+            finish(_failure(*suspects[0]))
+        else:
+            for task, _ in suspects:
+                finish(_convert_isolated(task))
+    
+    return results
+
+
+def summarize(results, elapsed):
+    """
+    生成批量转换的汇总报告
+    
+    Args:
+        results (list): convert_many 返回的结果
+        elapsed (float): 总耗时(秒)
+    
+    Returns:
+        dict: 汇总报告
+    """
+    succeeded = [r for r in results if r['ok']]
+    return {
+        'total': len(results),
+        'succeeded': len(succeeded),
+        'failed': len(results) - len(succeeded),
+        'elapsed': elapsed,
+        'book_time': sum(r['elapsed'] for r in results),
+        'books': results
+    }
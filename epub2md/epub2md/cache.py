@@ -0,0 +1,142 @@
+"""
+章节缓存模块 - 在SQLite中缓存章节的转换结果
+"""
+
+import os
+import time
+import hashlib
+import sqlite3
+from . import __version__
+
+# 默认缓存大小上限 (字节)
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+# 影响转换结果的html2text选项，修改转换选项时需要同步修改，使旧的缓存失效
+CONVERTER_OPTIONS = 'links,images,tables,emphasis,body_width=0,unicode_snob,single_line_break'
+
+
+def default_cache_dir():
+    """
+    获取默认缓存目录
+    
+    Returns:
+        str: $XDG_CACHE_HOME/epub2md，未设置时为 ~/.cache/epub2md
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'epub2md')
+
+
+class ChapterCache:
+    """
+    章节转换结果的持久缓存
+    
+    以 (章节HTML, 转换选项, epub2md版本) 的哈希为键保存后处理之后、改写图片链接
+    之前的Markdown。超过大小上限时在关闭时按最近使用时间淘汰。多个进程可以同时
+    使用同一个缓存。
+    """
+    
+    def __init__(self, cache_dir=None, max_size=DEFAULT_CACHE_SIZE):
+        """
+        初始化缓存
+        
+        Args:
+            cache_dir (str): 缓存目录，默认为 default_cache_dir()
+            max_size (int): 缓存大小上限 (字节)
+        """
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._used = {}  # 本次命中的键到使用时间，关闭时写回
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.cache_dir, 'chapters.sqlite'),
+                                          timeout=30, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS chapters ('
+            'key TEXT PRIMARY KEY, markdown TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS chapters_last_used ON chapters (last_used)')
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    @staticmethod
+    def key(html_content, engine):
+        """
+        计算章节的缓存键
+        
+        Args:
+            html_content (str): 章节HTML
+            engine (str): 转换引擎
+        
+        Returns:
+            str: 缓存键
+        """
+        digest = hashlib.sha256()
+        digest.update(f"{__version__}\0{engine}\0{CONVERTER_OPTIONS}\0".encode('utf-8'))
+        digest.update(html_content.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+    
+    def get(self, key):
+        """
+        读取缓存
+        
+        Args:
+            key (str): 缓存键
+        
+        Returns:
+            str: 缓存的Markdown，未命中时返回None
+        """
+        row = self.connection.execute('SELECT markdown FROM chapters WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used[key] = time.time()
+        return row[0]
+    
+    def put(self, key, markdown):
+        """
+        写入缓存
+        
+        Args:
+            key (str): 缓存键
+            markdown (str): Markdown
+        """
+        size = len(markdown.encode('utf-8', 'surrogatepass'))
+        self.connection.execute('INSERT OR REPLACE INTO chapters (key, markdown, size, last_used) VALUES (?, ?, ?, ?)',
+                                (key, markdown, size, time.time()))
+    
+    def close(self):
+        """更新命中条目的使用时间，淘汰超出大小上限的最久未使用条目，然后关闭数据库"""
+        if self.connection is None:
+            return
+        try:
+            with self.connection:
+                self.connection.execute('BEGIN')
+                self.connection.executemany('UPDATE chapters SET last_used = ? WHERE key = ?',
+                                            [(used, key) for key, used in self._used.items()])
+                self._evict()
+        finally:
+            self.connection.close()
+            self.connection = None
+    
+    def _evict(self):
+        """按最近使用时间从新到旧累计大小，删除超出上限的条目"""
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM chapters').fetchone()[0]
+        if total <= self.max_size:
+            return
+        
+        kept = 0
+        evict = []
+        for key, size in self.connection.execute('SELECT key, size FROM chapters ORDER BY last_used DESC'):
+            kept += size
+            if kept > self.max_size:
+                evict.append((key,))
+        self.connection.executemany('DELETE FROM chapters WHERE key = ?', evict)
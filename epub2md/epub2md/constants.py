@@ -0,0 +1,21 @@
+"""
+选项取值 - 命令行解析参数时需要的常量
+
+这里不导入任何其他模块，命令行 (包括 --help) 启动时只加载这个文件，转换流程和
+依赖库在子命令执行时才导入。
+"""
+
+# 可用的转换引擎: html2text 为 BeautifulSoup 预处理 + html2text，fast 为单次解析
+ENGINES = ('html2text', 'fast')
+
+# 图片处理方式: copy 直接写入原始数据，optimize 用PIL重新编码压缩
+IMAGE_MODES = ('copy', 'optimize')
+
+# 支持的归档格式，tar.zst 需要安装 zstandard
+ARCHIVE_FORMATS = ('zip', 'tar', 'tar.gz', 'tar.bz2', 'tar.xz', 'tar.zst')
+
+# 写入输出目录时的同步策略:
+#   none: 不调用fsync，由操作系统决定何时写入磁盘
+#   files: 每个文件写完后fsync
+#   all: 另外在移动文件前后同步目录，完成后输出在断电后也完整
+FSYNC_POLICIES = ('none', 'files', 'all')
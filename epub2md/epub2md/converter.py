@@ -2,74 +2,330 @@
 HTML到Markdown转换模块 - 负责将HTML内容转换为Markdown格式
 """
 
-import re
-import html2text
-from bs4 import BeautifulSoup
 import os
+from .parallel import ordered_map
+from .profiler import NULL_PROFILER, Profiler
+from .resource import ImageResolver
+from .model import Book
+from .constants import ENGINES
+
+# 工作进程中的转换器实例 (html2text.HTML2Text 有内部状态，每个进程各自持有一个)
+_worker_converter = None
+
+
+def _create_html2text(engine='html2text'):
+    """
+    创建并配置html2text转换器
+    
+    Args:
+        engine (str): 转换引擎
+    
+    Returns:
+        html2text.HTML2Text: 配置好的转换器
+    """
+    if engine == 'fast':
+        from .fast_engine import FastMarkdownEngine
+        h2t = FastMarkdownEngine()
+    else:
+        import html2text
+        h2t = html2text.HTML2Text()
+    h2t.ignore_links = False
+    h2t.ignore_images = False
+    h2t.ignore_tables = False
+    h2t.ignore_emphasis = False
+    h2t.body_width = 0  # 不自动换行
+    h2t.unicode_snob = True  # 使用Unicode字符
+    h2t.single_line_break = True  # 不使用多行换行
+    return h2t
+
+
+def _init_worker(engine, profile=False):
+    """初始化工作进程"""
+    global _worker_converter
+    _worker_converter = HTMLToMarkdownConverter(None, engine=engine, profiler=Profiler() if profile else None)
+
+
+def _convert_in_worker(task):
+    """
+    在工作进程中转换单个章节
+    
+    Args:
+        task (tuple): (章节ID, HTML内容)
+    
+    Returns:
+        tuple: (转换后的Markdown (尚未改写图片链接), 各阶段耗时)
+    """
+    item_id, html_content = task
+    markdown = _worker_converter._render_chapter(html_content, item_id)
+    return markdown, _worker_converter.profiler.take_chapter(item_id)
+
+
+def _fix_heading(line):
+    """在行首的#号后插入空格"""
+    if line[:1] != '#':
+        return line
+    level = len(line) - len(line.lstrip('#'))
+    return line[:level] + ' ' + line[level:]
+
+
+def _fixed_lines(markdown):
+    """
+    逐行修复标题和列表格式
+    
+    列表标记后两个以上的空白字符被压缩为一个空格。与正则中的 \\s 一样，这段空白
+    可以跨越换行，此时后续的空行和下一个非空行会被合并到当前行。
+    
+    Args:
+        markdown (str): Markdown内容
+    
+    Yields:
+        str: 修复后的行
+    """
+    lines = markdown.split('\n')
+    count = len(lines)
+    index = 0
+    while index < count:
+        line = lines[index]
+        index += 1
+        first = line[:1]
+        if not first or (first not in '#-*+' and not first.isspace()):
+            # 绝大多数行既不是标题也不是列表项
+            yield line
+            continue
+        
+        line = _fix_heading(line)
+        start = len(line) - len(line.lstrip())
+        
+        while start < len(line) and line[start] in '-*+':
+            rest = line[start + 1:].lstrip()
+            spaces = len(line) - start - 1 - len(rest)
+            column = None  # 合并进来的内容在原行中的列号
+            following = index
+            if not rest:
+                # 空白一直延伸到后续行
+                while following < count:
+                    text = lines[following]
+                    following += 1
+                    lead = len(text) - len(text.lstrip())
+                    spaces += 1 + lead
+                    if lead < len(text):
+                        rest = _fix_heading(text)[lead:]
+                        column = lead
+                        break
+            
+            if spaces < 2:
+                break
+            
+            head = line[:start + 1] + ' '
+            line = head + rest
+            index = max(index, following)
+            # 合并进来的内容位于行首时，它本身也可能是列表标记
+            if column != 0:
+                break
+            start = len(head)
+        
+        yield line
+
 
 class HTMLToMarkdownConverter:
     """HTML到Markdown转换器"""
     
-    def __init__(self, book_data, verbose=False):
+    def __init__(self, book_data, verbose=False, jobs=1, engine='html2text', cache=None, profiler=None):
         """
         初始化转换器
         
         Args:
-            book_data (dict): 包含书籍内容的字典
+            book_data (Book): 解析后的书籍，也可以是以前的字典结构
             verbose (bool): 是否显示详细信息
+            jobs (int): 并行转换章节的进程数，1表示串行转换
+            engine (str): 转换引擎，'html2text' 或 'fast'
+            cache (ChapterCache): 章节缓存，为None时不使用缓存
+            profiler (Profiler): 性能分析器，为None时不记录耗时
         """
-        self.book_data = book_data
+        if engine not in ENGINES:
+            raise ValueError(f"未知的转换引擎: {engine}")
+        
+        self.book = Book.coerce(book_data) if book_data is not None else None
         self.verbose = verbose
+        self.jobs = max(1, jobs or 1)
+        self.engine = engine
+        self.cache = cache
+        self.profiler = profiler or NULL_PROFILER
         self.markdown_content = {}
         
-        # 配置html2text转换器
-        self.h2t = html2text.HTML2Text()
-        self.h2t.ignore_links = False
-        self.h2t.ignore_images = False
-        self.h2t.ignore_tables = False
-        self.h2t.ignore_emphasis = False
-        self.h2t.body_width = 0  # 不自动换行
-        self.h2t.unicode_snob = True  # 使用Unicode字符
-        self.h2t.single_line_break = True  # 不使用多行换行
+        # 图片链接解析器，转换每个章节时直接改写其中的图片链接
+        self.image_resolver = None
+        if self.book is not None:
+            self.image_resolver = ImageResolver(self.book.images, self.book.hrefs)
     
     def convert(self):
         """
         将HTML内容转换为Markdown格式
         
         Returns:
-            dict: 包含转换后的内容的字典
+            dict: Book.to_dict() 的结构，content 为章节ID到转换后的Markdown的映射
+        """
+        for item_id, markdown in self.iter_chapters():
+            self.markdown_content[item_id] = markdown
+        
+        return dict(self.book.to_dict(), content=self.markdown_content)
+    
+    def iter_chapters(self, item_ids=None):
+        """
+        逐个转换章节，转换完成一个就返回一个，不保留转换结果
+        
+        并行转换时最多同时有 jobs*2 个章节在途，因此内存占用与书的大小无关。
+        
+        Args:
+            item_ids (list): 按顺序转换的章节ID，默认为全部内容
+        
+        Yields:
+            tuple: (章节ID, Markdown)
         """
         if self.verbose:
             print("正在将HTML转换为Markdown...")
         
+        content = self.book.content
+        if item_ids is None:
+            item_ids = list(content)
+        
         # 转换HTML内容
-        for item_id, html_content in self.book_data['content'].items():
+        if self.jobs > 1 and len(item_ids) > 1:
+            chapters = self._convert_parallel(content, item_ids)
+        else:
+            chapters = ((item_id, self._convert_chapter(self._read_chapter(content, item_id), item_id))
+                        for item_id in item_ids)
+        
+        for item_id, markdown in chapters:
             if self.verbose:
                 print(f"  处理章节: {item_id}")
+            self.profiler.chapter(item_id, markdown_size=len(markdown))
             
-            # 预处理HTML
-            processed_html = self._preprocess_html(html_content)
-            
-            # 转换为Markdown
-            markdown = self.h2t.handle(processed_html)
-            
-            # 后处理Markdown
-            markdown = self._postprocess_markdown(markdown, item_id)
+            yield item_id, markdown
+        
+        if self.verbose and self.cache is not None:
+            print(f"  缓存命中: {self.cache.hits}, 未命中: {self.cache.misses}")
+    
+    def _convert_parallel(self, content, item_ids):
+        """
+        使用进程池并行转换章节
+        
+        Args:
+            content (dict): 章节ID到HTML内容的映射
+            item_ids (list): 按顺序转换的章节ID
+        
+        Yields:
+            tuple: (章节ID, Markdown)，顺序与串行转换一致
+        """
+        # multiprocessing 只在并行转换时才导入
+        from concurrent.futures import Future, ProcessPoolExecutor
+        
+        keys = {}  # 未命中缓存的章节ID到缓存键
+        
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker,
+                                 initargs=(self.engine, self.profiler.enabled)) as executor:
+            def submit(item_id):
+                html_content = self._read_chapter(content, item_id)
+                key, markdown = self._lookup(html_content)
+                if markdown is not None:
+                    # 命中缓存的章节不进入进程池
+                    self.profiler.chapter(item_id, cached=True)
+                    future = Future()
+                    future.set_result((markdown, {}))
+                    return future
+                keys[item_id] = key
+                return executor.submit(_convert_in_worker, (item_id, html_content))
             
-            self.markdown_content[item_id] = markdown
+            results = ordered_map(submit, item_ids, self.jobs * 2)
+            for item_id, (markdown, stages) in zip(item_ids, results):
+                # 工作进程中各阶段的耗时随结果一起返回
+                self.profiler.merge_chapter(item_id, stages)
+                key = keys.pop(item_id, None)
+                if key is not None:
+                    self.cache.put(key, markdown)
+                yield item_id, self._rewrite_images(markdown, item_id)
+    
+    def _convert_chapter(self, html_content, item_id):
+        """
+        转换单个章节
+        
+        Args:
+            html_content (str): HTML内容
+            item_id (str): 内容ID
         
-        # 更新图片引用路径
-        self._update_image_paths()
+        Returns:
+            str: 转换后的Markdown
+        """
+        key, markdown = self._lookup(html_content)
+        if markdown is None:
+            markdown = self._render_chapter(html_content, item_id)
+            if key is not None:
+                self.cache.put(key, markdown)
+        else:
+            self.profiler.chapter(item_id, cached=True)
         
-        result = {
-            'metadata': self.book_data['metadata'],
-            'toc': self.book_data['toc'],
-            'spine': self.book_data['spine'],
-            'content': self.markdown_content,
-            'images': self.book_data['images']
-        }
+        return self._rewrite_images(markdown, item_id)
+    
+    def _read_chapter(self, content, item_id):
+        """从归档中读取并解码章节HTML"""
+        with self.profiler.stage('decode', item_id):
+            html_content = content[item_id]
+        self.profiler.chapter(item_id, html_size=len(html_content))
+        return html_content
+    
+    def _lookup(self, html_content):
+        """
+        在缓存中查找章节
         
-        return result
+        Args:
+            html_content (str): HTML内容
+        
+        Returns:
+            tuple: (缓存键, 缓存的Markdown)，不使用缓存时均为None，未命中时Markdown为None
+        """
+        if self.cache is None:
+            return None, None
+        key = self.cache.key(html_content, self.engine)
+        return key, self.cache.get(key)
+    
+    def _rewrite_images(self, markdown, item_id):
+        """更新图片引用路径"""
+        if self.image_resolver is None:
+            return markdown
+        with self.profiler.stage('rewrite', item_id):
+            return self.image_resolver.rewrite(markdown, item_id)
+    
+    def _render_chapter(self, html_content, item_id):
+        """
+        将单个章节的HTML转换为Markdown，不改写图片链接
+        
+        Args:
+            html_content (str): HTML内容
+            item_id (str): 内容ID
+        
+        Returns:
+            str: 转换后的Markdown
+        """
+        # html2text.HTML2Text 处理不规范的HTML后会残留内部状态，
+        # 每个章节使用新的实例，保证结果与章节的处理顺序和所在进程无关
+        h2t = _create_html2text(self.engine)
+        
+        if self.engine == 'fast':
+            # 单次解析，标题和图片alt的修正在事件流中完成
+            with self.profiler.stage('html2text', item_id):
+                markdown = h2t.handle(html_content)
+        else:
+            # 预处理HTML
+            with self.profiler.stage('preprocess', item_id):
+                processed_html = self._preprocess_html(html_content)
+            
+            # 转换为Markdown
+            with self.profiler.stage('html2text', item_id):
+                markdown = h2t.handle(processed_html)
+        
+        # 后处理Markdown
+        with self.profiler.stage('postprocess', item_id):
+            return self._postprocess_markdown(markdown, item_id)
     
     def _preprocess_html(self, html_content):
         """
@@ -81,7 +337,8 @@ class HTMLToMarkdownConverter:
         Returns:
             str: 处理后的HTML
         """
-        # 使用BeautifulSoup解析HTML
+        # 使用BeautifulSoup解析HTML (只有默认引擎需要)
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(html_content, 'html.parser')
         
         # 处理标题
@@ -106,6 +363,14 @@ class HTMLToMarkdownConverter:
         """
         后处理Markdown内容
         
+        一次逐行扫描完成标题格式修复、列表格式修复、段落空行补齐和多余空行合并，
+        结果与依次执行以下四个正则替换完全相同:
+            
+            ^(#+)(.*?)$         ->  \\1 \\2      (MULTILINE)
+            ^(\\s*[-*+])\\s{2,}  ->  \\1 空格    (MULTILINE)
+            ([^\\n])\\n([^\\n])    ->  \\1\\n\\n\\2
+            \\n{3,}              ->  \\n\\n
+        
         Args:
             markdown (str): Markdown内容
             item_id (str): 内容ID
@@ -113,40 +378,31 @@ class HTMLToMarkdownConverter:
         Returns:
             str: 处理后的Markdown
         """
-        # 修复标题格式
-        markdown = re.sub(r'^(#+)(.*?)$', r'\1 \2', markdown, flags=re.MULTILINE)
-        
-        # 修复列表格式问题
-        markdown = re.sub(r'^(\s*[-*+])\s{2,}', r'\1 ', markdown, flags=re.MULTILINE)
-        
-        # 确保段落之间有空行
-        markdown = re.sub(r'([^\n])\n([^\n])', r'\1\n\n\2', markdown)
-        
-        # 删除多余的空行
-        markdown = re.sub(r'\n{3,}', '\n\n', markdown)
-        
-        return markdown
-    
-    def _update_image_paths(self):
-        """更新Markdown中的图片引用路径"""
-        # 创建图片ID到文件名的映射
-        image_mapping = {}
-        for img_id, img_data in self.book_data['images'].items():
-            file_name = img_data['file_name']
-            image_mapping[img_id] = file_name
-        
-        # 更新每个章节中的图片引用
-        for item_id, markdown in self.markdown_content.items():
-            for img_id, file_name in image_mapping.items():
-                # 寻找可能的引用格式
-                possible_refs = [
-                    f"({img_id})",
-                    f"({os.path.basename(img_id)})"
-                ]
-                
-                for ref in possible_refs:
-                    # 替换为相对路径
-                    if ref in markdown:
-                        markdown = markdown.replace(ref, f"(images/{file_name})")
+        pieces = []
+        newlines = 0  # 上一个非空行之后累积的换行数
+        previous = None  # 上一行
+        consumed = False  # 上一行唯一的字符是否已被段落换行的匹配占用
+        
+        for line in _fixed_lines(markdown):
+            if previous is not None:
+                # 两个非空行之间的单个换行补成空行，正则匹配不重叠，
+                # 只有一个字符的行被占用后不能再参与下一次匹配
+                if previous and line and not consumed:
+                    newlines += 2
+                    consumed = len(line) == 1
+                else:
+                    newlines += 1
+                    consumed = False
             
-            self.markdown_content[item_id] = markdown
+            if line:
+                if newlines:
+                    # 合并多余空行
+                    pieces.append('\n' * min(newlines, 2))
+                    newlines = 0
+                pieces.append(line)
+            previous = line
+        
+        if newlines:
+            pieces.append('\n' * min(newlines, 2))
+        
+        return ''.join(pieces)
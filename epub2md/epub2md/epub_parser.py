@@ -1,200 +1,480 @@
 """
 EPUB解析模块 - 负责解析EPUB文件结构和内容
+
+EPUB文件本质上是一个zip归档。解析器只在初始化阶段读取 container.xml、
+OPF 和 NCX/导航文档，章节和图片只记录在归档中的位置 (见 model 模块)，直到后续阶段
+真正访问时才从归档中解压对应条目，从而避免一次性把整本书读入内存。
 """
 
 import os
-import ebooklib
-from ebooklib import epub
-from bs4 import BeautifulSoup
+import shutil
+import struct
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote
 from typing import Dict, List, Any, Optional
+from .model import Book, Chapter, TocEntry, ImageAsset
+from .profiler import NULL_PROFILER
+
+NAMESPACES = {
+    'CONTAINER': 'urn:oasis:names:tc:opendocument:xmlns:container',
+    'OPF': 'http://www.idpf.org/2007/opf',
+    'DC': 'http://purl.org/dc/elements/1.1/',
+    'DAISY': 'http://www.daisy.org/z3986/2005/ncx/',
+    'XHTML': 'http://www.w3.org/1999/xhtml',
+    'EPUB': 'http://www.idpf.org/2007/ops',
+}
+
+# 需要提取的Dublin Core元数据字段
+METADATA_FIELDS = ('title', 'creator', 'language', 'identifier', 'publisher', 'date')
+
+DOCUMENT_MEDIA_TYPES = ('application/xhtml+xml',)
+NCX_MEDIA_TYPE = 'application/x-dtbncx+xml'
+
+# 复制条目时每次读写的块大小
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# zip本地文件头: 固定部分的长度，以及文件名长度和扩展字段长度的位置
+LOCAL_HEADER_SIZE = 30
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+
+def _ns(prefix: str, tag: str) -> str:
+    """生成带命名空间的标签名"""
+    return '{%s}%s' % (NAMESPACES[prefix], tag)
+
+
+class EPUBArchive:
+    """基于zipfile的EPUB归档读取器，按需读取条目"""
+    
+    def __init__(self, epub_path: str):
+        """
+        初始化EPUB归档
+        
+        Args:
+            epub_path (str): EPUB文件路径
+        """
+        self.epub_path = epub_path
+        self.zip_file = zipfile.ZipFile(epub_path, 'r')
+        try:
+            self.opf_path = self._find_opf_path()
+        except BaseException:
+            # 构造失败时调用方拿不到对象，在这里关闭文件，常驻进程中不会泄漏文件句柄
+            self.zip_file.close()
+            raise
+        self.opf_dir = posixpath.dirname(self.opf_path)
+    
+    def _find_opf_path(self) -> str:
+        """从 META-INF/container.xml 中找到OPF文件的位置"""
+        container = ET.fromstring(self.zip_file.read('META-INF/container.xml'))
+        rootfile = container.find('.//' + _ns('CONTAINER', 'rootfile'))
+        if rootfile is None or not rootfile.get('full-path'):
+            raise ValueError("container.xml中缺少OPF文件路径")
+        return rootfile.get('full-path')
+    
+    def resolve(self, href: str) -> str:
+        """
+        将相对于OPF目录的href转换为归档内的条目名
+        
+        Args:
+            href (str): 相对于OPF目录的路径
+        
+        Returns:
+            str: 归档中的条目名
+        """
+        return posixpath.normpath(posixpath.join(self.opf_dir, href))
+    
+    def read(self, href: str) -> bytes:
+        """
+        读取相对于OPF目录的条目内容
+        
+        Args:
+            href (str): 相对于OPF目录的路径
+        
+        Returns:
+            bytes: 条目内容
+        """
+        return self.zip_file.read(self.resolve(href))
+    
+    def open(self, href: str):
+        """
+        以流的方式打开相对于OPF目录的条目
+        
+        Args:
+            href (str): 相对于OPF目录的路径
+        
+        Returns:
+            file: 只读的文件对象
+        """
+        return self.zip_file.open(self.resolve(href))
+    
+    def size(self, href: str) -> int:
+        """
+        返回条目解压后的大小，不读取条目内容
+        
+        Args:
+            href (str): 相对于OPF目录的路径
+        
+        Returns:
+            int: 字节数，条目不存在时为0
+        """
+        try:
+            return self.zip_file.getinfo(self.resolve(href)).file_size
+        except KeyError:
+            return 0
+    
+    def copy_to(self, href: str, path: str) -> None:
+        """
+        将条目原样写入文件，不在内存中保存整个条目
+        
+        未压缩存储的条目直接从EPUB文件中按范围复制 (可用时由 copy_file_range/sendfile 在内核中完成)，
+        压缩的条目按块解压写出。可以在多个线程中同时调用。输出路径已存在时先删除再创建新文件，
+        不会改动与其共享数据的硬链接 (如图片存储中的文件)。
+        
+        Args:
+            href (str): 相对于OPF目录的路径
+            path (str): 输出文件路径
+        """
+        info = self.zip_file.getinfo(self.resolve(href))
+        if os.path.lexists(path):
+            os.remove(path)
+        if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+            with self.zip_file.open(info) as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+            return
+        
+        # 每次复制使用独立的文件描述符，不与 zipfile 共享读取位置
+        src = os.open(self.epub_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            os.lseek(src, info.header_offset, os.SEEK_SET)
+            header = os.read(src, LOCAL_HEADER_SIZE)
+            if len(header) != LOCAL_HEADER_SIZE or header[:4] != LOCAL_HEADER_SIGNATURE:
+                raise zipfile.BadZipFile(f"条目 {info.filename} 的文件头无效")
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            offset = info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+            
+            dst = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+            try:
+                _copy_range(src, dst, offset, info.file_size)
+            finally:
+                os.close(dst)
+        finally:
+            os.close(src)
+    
+    def close(self) -> None:
+        """关闭归档"""
+        self.zip_file.close()
+
+
+def _copy_range(src: int, dst: int, offset: int, count: int) -> None:
+    """
+    将 src 中从 offset 开始的 count 个字节写入 dst 的当前位置
+    
+    依次尝试 copy_file_range 和 sendfile，不支持时 (旧内核、跨文件系统、其他平台) 改为逐块读写
+    """
+    end = offset + count
+    for name in ('copy_file_range', 'sendfile'):
+        copy = getattr(os, name, None)
+        if copy is None:
+            continue
+        try:
+            while offset < end:
+                if name == 'copy_file_range':
+                    copied = copy(src, dst, end - offset, offset)
+                else:
+                    copied = copy(dst, src, offset, end - offset)
+                if copied == 0:
+                    break
+                offset += copied
+        except OSError:
+            continue
+        if offset == end:
+            return
+    
+    os.lseek(src, offset, os.SEEK_SET)
+    while offset < end:
+        chunk = os.read(src, min(COPY_CHUNK_SIZE, end - offset))
+        if not chunk:
+            raise zipfile.BadZipFile("EPUB文件被截断")
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst, view):]
+        offset += len(chunk)
+
 
 class EPUBParser:
     """EPUB文件解析器"""
     
-    def __init__(self, epub_path: str, verbose: bool = False):
+    def __init__(self, epub_path: str, verbose: bool = False, profiler=None):
         """
         初始化EPUB解析器
         
         Args:
             epub_path (str): EPUB文件路径
             verbose (bool): 是否显示详细信息
+            profiler (Profiler): 性能分析器，为None时不记录耗时
         """
         self.epub_path = epub_path
         self.verbose = verbose
-        self.book = None  # type: Optional[epub.EpubBook]
+        self.profiler = profiler or NULL_PROFILER
+        self.archive = None  # type: Optional[EPUBArchive]
+        self.opf = None  # type: Optional[ET.Element]
+        self.manifest = {}  # type: Dict[str, Dict[str, Any]]
         self.metadata = {}
-        self.toc = []
+        self.toc = []  # type: List[TocEntry]
         self.spine = []
-        self.images = {}
-        
-    def parse(self) -> Dict[str, Any]:
+        self.images = {}  # type: Dict[str, ImageAsset]
+    
+    def __enter__(self) -> 'EPUBParser':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+    
+    def close(self) -> None:
+        """关闭EPUB归档，之后不能再读取惰性内容"""
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+    
+    def parse(self) -> Book:
         """
         解析EPUB文件
         
+        只读取OPF和目录文件，章节内容和图片数据在被访问时才会从归档中读取，
+        因此在使用完返回结果之前不要调用 close()。需要以前的字典结构时使用 Book.to_dict()。
+        
         Returns:
-            dict: 包含解析后的书籍内容，结构如下:
-                {
-                    'metadata': {书籍元数据},
-                    'toc': [目录项列表],
-                    'spine': [内容顺序列表],
-                    'content': {id: html内容的字典},
-                    'images': {id: 图片数据的字典}
-                }
+            Book: 解析后的书籍，包括元数据、目录、spine、章节和图片
         """
         if self.verbose:
             print(f"正在解析EPUB文件: {self.epub_path}")
         
-        # 读取EPUB文件
-        try:
-            self.book = epub.read_epub(self.epub_path)
-            if self.book is None:
-                raise ValueError(f"无法读取EPUB文件: {self.epub_path}")
-        except Exception as e:
-            if self.verbose:
-                print(f"读取EPUB文件时出错: {e}")
-            raise
-        
-        # 解析元数据
-        self._parse_metadata()
+        with self.profiler.stage('parse'):
+            # 打开EPUB归档并读取OPF
+            try:
+                self.archive = EPUBArchive(self.epub_path)
+                self.opf = ET.fromstring(self.archive.zip_file.read(self.archive.opf_path))
+            except (zipfile.BadZipFile, KeyError, ET.ParseError, ValueError) as e:
+                if self.verbose:
+                    print(f"读取EPUB文件时出错: {e}")
+                self.close()
+                raise ValueError(f"无法读取EPUB文件: {self.epub_path} ({e})") from e
+            
+            # 解析清单
+            self._parse_manifest()
+            
+            # 解析元数据
+            self._parse_metadata()
         
         # 解析目录
-        self._parse_toc()
+        with self.profiler.stage('toc'):
+            self._parse_toc()
         
-        # 解析内容
-        content = self._parse_content()
-        
-        # 解析图片
-        self._parse_images()
+        with self.profiler.stage('parse'):
+            # 解析内容
+            chapters = self._parse_content()
+            
+            # 解析图片
+            self._parse_images()
         
-        result = {
-            'metadata': self.metadata,
-            'toc': self.toc,
-            'spine': self.spine,
-            'content': content,
-            'images': self.images
-        }
+        return Book(self.metadata, self.toc, self.spine, chapters, self.images)
+    
+    def _parse_manifest(self) -> None:
+        """解析OPF清单"""
+        self.manifest = {}
+        manifest = self.opf.find(_ns('OPF', 'manifest'))
+        if manifest is None:
+            return
         
-        return result
+        for item in manifest.findall(_ns('OPF', 'item')):
+            item_id = item.get('id')
+            href = item.get('href')
+            if not item_id or not href:
+                continue
+            
+            media_type = item.get('media-type', '')
+            # 有些出版商使用了错误的媒体类型
+            if media_type == 'image/jpg':
+                media_type = 'image/jpeg'
+            
+            self.manifest[item_id] = {
+                'href': posixpath.normpath(unquote(href)),
+                'media_type': media_type,
+                'properties': item.get('properties', '').split()
+            }
     
     def _parse_metadata(self) -> None:
         """解析EPUB元数据"""
         if self.verbose:
             print("正在提取元数据...")
         
-        if self.book is None:
+        if self.opf is None:
             return
-            
-        # 提取标题
-        title = self.book.get_metadata('DC', 'title')
-        if title:
-            self.metadata['title'] = title[0][0]
-        
-        # 提取作者
-        creator = self.book.get_metadata('DC', 'creator')
-        if creator:
-            self.metadata['creator'] = creator[0][0]
-        
-        # 提取语言
-        language = self.book.get_metadata('DC', 'language')
-        if language:
-            self.metadata['language'] = language[0][0]
-        
-        # 其他元数据
-        identifiers = self.book.get_metadata('DC', 'identifier')
-        if identifiers:
-            self.metadata['identifier'] = identifiers[0][0]
-        
-        publishers = self.book.get_metadata('DC', 'publisher')
-        if publishers:
-            self.metadata['publisher'] = publishers[0][0]
-        
-        dates = self.book.get_metadata('DC', 'date')
-        if dates:
-            self.metadata['date'] = dates[0][0]
+        
+        metadata = self.opf.find(_ns('OPF', 'metadata'))
+        if metadata is None:
+            return
+        
+        # 每个字段只取第一个值
+        for field in METADATA_FIELDS:
+            element = metadata.find(_ns('DC', field))
+            if element is not None and element.text:
+                self.metadata[field] = element.text.strip()
     
     def _parse_toc(self) -> None:
         """解析目录结构"""
         if self.verbose:
             print("正在提取目录结构...")
         
-        if self.book is None:
+        if self.opf is None:
             return
-            
-        def _process_toc_entries(entries, level=0):
-            result = []
-            for item in entries:
-                if isinstance(item, tuple):
-                    # 是目录项
-                    title, href, children = item
-                    entry = {
-                        'title': title,
-                        'href': href,
-                        'level': level,
-                        'children': _process_toc_entries(children, level + 1) if children else []
-                    }
-                    result.append(entry)
-            return result
         
-        self.toc = _process_toc_entries(self.book.toc)
+        spine = self.opf.find(_ns('OPF', 'spine'))
+        
+        # 优先使用NCX，没有时使用EPUB3导航文档
+        ncx_id = spine.get('toc') if spine is not None else None
+        if not ncx_id or ncx_id not in self.manifest:
+            ncx_id = next((item_id for item_id, item in self.manifest.items()
+                           if item['media_type'] == NCX_MEDIA_TYPE), None)
+        nav_id = next((item_id for item_id, item in self.manifest.items()
+                       if 'nav' in item['properties']), None)
+        
+        try:
+            if ncx_id:
+                self.toc = self._parse_ncx(self.manifest[ncx_id]['href'])
+            if not self.toc and nav_id:
+                self.toc = self._parse_nav(self.manifest[nav_id]['href'])
+        except (KeyError, ET.ParseError) as e:
+            if self.verbose:
+                print(f"解析目录时出错: {e}")
+            self.toc = []
         
         # 提取spine (内容顺序)
         self.spine = []
-        for item in self.book.spine:
-            # 处理不同类型的spine项
-            if hasattr(item, 'get_id'):
-                # EpubItem对象
-                self.spine.append(item.get_id())
-            elif isinstance(item, tuple) and len(item) >= 1:
-                # 元组格式，第一个元素通常是ID
-                self.spine.append(item[0])
-            elif isinstance(item, str):
-                # 字符串ID
-                self.spine.append(item)
-            else:
-                # 尝试将对象转为字符串
-                try:
-                    item_id = str(item)
+        if spine is not None:
+            for itemref in spine.findall(_ns('OPF', 'itemref')):
+                item_id = itemref.get('idref')
+                if item_id:
                     self.spine.append(item_id)
-                except:
-                    if self.verbose:
-                        print(f"无法处理的spine项: {type(item)}")
-                    continue
+                elif self.verbose:
+                    print("无法处理的spine项: 缺少idref")
+    
+    def _parse_ncx(self, ncx_href: str) -> List[TocEntry]:
+        """
+        解析NCX目录文件
         
-    def _parse_content(self) -> Dict[str, str]:
-        """解析内容"""
+        Args:
+            ncx_href (str): NCX文件相对于OPF目录的路径
+        
+        Returns:
+            list: 目录项列表
+        """
+        root = ET.fromstring(self.archive.read(ncx_href))
+        nav_map = root.find(_ns('DAISY', 'navMap'))
+        if nav_map is None:
+            return []
+        
+        base_dir = posixpath.dirname(ncx_href)
+        
+        def _process_nav_points(parent, level=0):
+            result = []
+            for nav_point in parent.findall(_ns('DAISY', 'navPoint')):
+                text = nav_point.find('%s/%s' % (_ns('DAISY', 'navLabel'), _ns('DAISY', 'text')))
+                content = nav_point.find(_ns('DAISY', 'content'))
+                src = content.get('src', '') if content is not None else ''
+                entry = TocEntry((text.text or '').strip() if text is not None else '',
+                                 self._normalize_href(base_dir, src), level,
+                                 _process_nav_points(nav_point, level + 1))
+                result.append(entry)
+            return result
+        
+        return _process_nav_points(nav_map)
+    
+    def _parse_nav(self, nav_href: str) -> List[TocEntry]:
+        """
+        解析EPUB3导航文档
+        
+        Args:
+            nav_href (str): 导航文档相对于OPF目录的路径
+        
+        Returns:
+            list: 目录项列表
+        """
+        root = ET.fromstring(self.archive.read(nav_href))
+        navs = list(root.iter(_ns('XHTML', 'nav')))
+        toc_nav = next((nav for nav in navs
+                        if 'toc' in nav.get(_ns('EPUB', 'type'), '').split()), None)
+        if toc_nav is None:
+            if not navs:
+                return []
+            toc_nav = navs[0]
+        
+        base_dir = posixpath.dirname(nav_href)
+        
+        def _process_list(list_node, level=0):
+            result = []
+            if list_node is None:
+                return result
+            for li in list_node.findall(_ns('XHTML', 'li')):
+                label = li.find(_ns('XHTML', 'a'))
+                if label is None:
+                    label = li.find(_ns('XHTML', 'span'))
+                title = ''.join(label.itertext()).strip() if label is not None else ''
+                href = label.get('href', '') if label is not None else ''
+                entry = TocEntry(title, self._normalize_href(base_dir, href), level,
+                                 _process_list(li.find(_ns('XHTML', 'ol')), level + 1))
+                result.append(entry)
+            return result
+        
+        return _process_list(toc_nav.find(_ns('XHTML', 'ol')))
+    
+    def _normalize_href(self, base_dir: str, href: str) -> str:
+        """
+        将目录文件中的链接转换为相对于OPF目录的路径，保留锚点
+        
+        Args:
+            base_dir (str): 目录文件所在目录(相对于OPF目录)
+            href (str): 原始链接
+        
+        Returns:
+            str: 规范化后的链接
+        """
+        if not href:
+            return ''
+        path, sep, fragment = unquote(href).partition('#')
+        if path:
+            path = posixpath.normpath(posixpath.join(base_dir, path))
+        return path + sep + fragment
+    
+    def _parse_content(self) -> Dict[str, Chapter]:
+        """解析内容，返回清单中所有XHTML文档的章节，按清单顺序"""
         if self.verbose:
             print("正在提取内容...")
         
-        content = {}
+        chapters = {}  # type: Dict[str, Chapter]
+        if self.archive is None:
+            return chapters
         
-        if self.book is None:
-            return content
-            
-        for item in self.book.get_items():
-            if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                item_id = item.get_id()
-                html_content = item.get_content().decode('utf-8')
-                content[item_id] = html_content
+        positions = {}
+        for index, item_id in enumerate(self.spine):
+            positions.setdefault(item_id, index)
+        
+        for item_id, item in self.manifest.items():
+            if item['media_type'] in DOCUMENT_MEDIA_TYPES:
+                chapters[item_id] = Chapter(positions.get(item_id), item_id, href=item['href'], archive=self.archive)
         
-        return content
+        return chapters
     
     def _parse_images(self) -> None:
         """提取图片资源"""
         if self.verbose:
             print("正在提取图片资源...")
         
-        if self.book is None:
+        if self.archive is None:
             return
-            
-        for item in self.book.get_items():
-            if item.get_type() == ebooklib.ITEM_IMAGE:
-                item_id = item.get_id()
-                image_data = item.get_content()
-                file_name = os.path.basename(item.file_name)
-                media_type = item.media_type
-                
-                self.images[item_id] = {
-                    'data': image_data,
-                    'file_name': file_name,
-                    'media_type': media_type
-                }
+        
+        for item_id, item in self.manifest.items():
+            if item['media_type'].startswith('image/'):
+                self.images[item_id] = ImageAsset(item_id, item['href'], item['media_type'], archive=self.archive)
@@ -0,0 +1,274 @@
+"""
+快速转换引擎 - 单次解析HTML并直接输出Markdown
+
+默认引擎先用BeautifulSoup解析并修正HTML，再把修正后的树序列化为字符串交给
+html2text重新解析，每个章节要被解析两次。快速引擎只解析一次：它在html2text
+的事件流上直接完成标题和图片alt的修正，并模拟BeautifulSoup序列化时对文本和
+标签结构所做的规范化，因此输出与默认引擎保持一致。
+"""
+
+import os
+import re
+from html.entities import html5
+import html2text
+
+# 不包含子节点的空元素
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link',
+    'menuitem', 'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound',
+    'command', 'frame', 'image', 'isindex', 'nextid', 'spacer'
+])
+
+# 保留空白的元素
+PRESERVE_WHITESPACE_TAGS = frozenset(['pre', 'textarea'])
+
+HEADING_TAGS = frozenset(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+
+ASCII_SPACES = ' \n\t\x0c\r'
+
+# 序列化时会被转义为实体的字符
+SPECIAL_CHARS = re.compile(r'([&<>])')
+
+
+def _decode_entityref(name):
+    """将命名实体转换为字符，未知实体保留原样"""
+    character = html5.get(name + ';')
+    if character is None:
+        return '&%s' % name
+    return character
+
+
+def _decode_charref(name):
+    """将数字字符引用转换为字符"""
+    try:
+        if name[:1] in ('x', 'X'):
+            code = int(name[1:], 16)
+        else:
+            code = int(name)
+    except ValueError:
+        return '\N{REPLACEMENT CHARACTER}'
+    
+    # 小于256的编号常常实际指向windows-1252字符
+    if code < 256:
+        try:
+            return bytes([code]).decode('windows-1252')
+        except UnicodeDecodeError:
+            pass
+    try:
+        return chr(code)
+    except (ValueError, OverflowError):
+        return '\N{REPLACEMENT CHARACTER}'
+
+
+def _heading_string(events):
+    """
+    查找标题内容对应的单一字符串节点
+    
+    与BeautifulSoup的 Tag.string 相同：只有一个子节点时，子节点为字符串(包括注释)
+    则返回该节点，子节点为元素则递归查找。
+    
+    Args:
+        events (list): 标题内部的事件列表
+    
+    Returns:
+        tuple: 字符串节点对应的事件，不满足条件时返回None
+    """
+    while True:
+        children = 0
+        child = None
+        depth = 0
+        for event in events:
+            if depth == 0 and event[0] != 'end':
+                # 一段连续文本可能由多个文本节点组成
+                children += event[2] if event[0] == 'text' else 1
+                child = event
+            if event[0] == 'start':
+                depth += 1
+            elif event[0] == 'end':
+                depth -= 1
+        
+        if children != 1:
+            return None
+        if child[0] != 'start':
+            return child
+        # 进入唯一的子元素
+        events = events[1:-1]
+
+
+class FastMarkdownEngine(html2text.HTML2Text):
+    """单次解析的HTML到Markdown转换引擎"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._text = []  # 当前文本节点中尚未输出的片段
+        self._run = []  # 序列化后会连成一段的文本节点
+        self._open_tags = []  # 当前打开的元素
+        self._closed_voids = []  # 已隐式闭合、其结束标签应被忽略的空元素
+        self._heading = None  # 正在缓冲的标题: [标签, 事件列表, 嵌套深度]
+    
+    def handle(self, data):
+        self._text = []
+        self._run = []
+        self._open_tags = []
+        self._closed_voids = []
+        self._heading = None
+        return super().handle(data)
+    
+    def close(self):
+        super().close()
+        self._flush_text()
+        while self._open_tags:
+            self._emit(('end', self._open_tags.pop()))
+        if self._heading is not None:
+            # 未闭合的标题按原样输出
+            events = self._heading[1]
+            self._heading = None
+            for event in events:
+                self._emit(event)
+    
+    # ---- HTMLParser 回调: 规范化文本和标签结构 ----
+    
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        attrs = [(name, '' if value is None else value) for name, value in attrs]
+        self._emit(('start', tag, attrs))
+        if tag in VOID_ELEMENTS:
+            self._emit(('end', tag))
+            self._closed_voids.append(tag)
+        else:
+            self._open_tags.append(tag)
+    
+    def handle_startendtag(self, tag, attrs):
+        self._flush_text()
+        attrs = [(name, '' if value is None else value) for name, value in attrs]
+        self._emit(('start', tag, attrs))
+        self._emit(('end', tag))
+    
+    def handle_endtag(self, tag):
+        if tag in self._closed_voids:
+            self._closed_voids.remove(tag)
+            return
+        # 没有对应开始标签的结束标签被忽略，未闭合的内部元素被隐式闭合
+        if tag not in self._open_tags:
+            self._end_text_node()
+            return
+        self._flush_text()
+        while self._open_tags:
+            open_tag = self._open_tags.pop()
+            self._emit(('end', open_tag))
+            if open_tag == tag:
+                break
+    
+    def handle_data(self, data, entity_char=False):
+        self._text.append(data)
+    
+    def handle_entityref(self, name):
+        self._text.append(_decode_entityref(name))
+    
+    def handle_charref(self, name):
+        self._text.append(_decode_charref(name))
+    
+    def handle_comment(self, data):
+        self._flush_text()
+        self._emit(('other',))
+    
+    def handle_decl(self, decl):
+        self._flush_text()
+        self._emit(('other',))
+    
+    def handle_pi(self, data):
+        self._flush_text()
+        self._emit(('other',))
+    
+    def unknown_decl(self, data):
+        self._flush_text()
+        self._emit(('other',))
+    
+    def _end_text_node(self):
+        """结束当前文本节点"""
+        if not self._text:
+            return
+        text = ''.join(self._text)
+        self._text = []
+        
+        # 不保留空白时，纯空白文本被压缩为一个空格或换行
+        if not PRESERVE_WHITESPACE_TAGS.intersection(self._open_tags) and not text.strip(ASCII_SPACES):
+            text = '\n' if '\n' in text else ' '
+        self._run.append(text)
+    
+    def _flush_text(self):
+        """输出累积的文本，相邻的文本节点序列化后连在一起"""
+        self._end_text_node()
+        if not self._run:
+            return
+        text = ''.join(self._run)
+        count = len(self._run)
+        self._run = []
+        self._emit(('text', text, count))
+    
+    # ---- 标题修正 ----
+    
+    def _emit(self, event):
+        """处理规范化后的事件，标题内的事件先缓冲"""
+        heading = self._heading
+        if heading is not None:
+            if event[0] == 'end' and heading[2] == 0:
+                self._heading = None
+                self._finish_heading(heading[0], heading[1], event)
+                return
+            heading[1].append(event)
+            if event[0] == 'start':
+                heading[2] += 1
+            elif event[0] == 'end':
+                heading[2] -= 1
+            return
+        
+        if event[0] == 'start' and event[1] in HEADING_TAGS:
+            self._heading = [event, [], 0]
+            return
+        
+        self._dispatch(event)
+    
+    def _finish_heading(self, start_event, events, end_event):
+        """标题结束时，只包含单一文本的标题去掉内部格式"""
+        string = _heading_string(events)
+        if string is not None:
+            self._dispatch(('start', start_event[1], []))
+            self._dispatch(string)
+            self._dispatch(end_event)
+            return
+        
+        self._dispatch(start_event)
+        for event in events:
+            self._emit(event)
+        self._emit(end_event)
+    
+    # ---- 交给html2text输出 ----
+    
+    def _dispatch(self, event):
+        kind = event[0]
+        if kind == 'text':
+            for piece in SPECIAL_CHARS.split(event[1]):
+                if not piece:
+                    continue
+                if len(piece) == 1 and piece in '&<>':
+                    super().handle_data(piece, True)
+                else:
+                    super().handle_data(piece)
+        elif kind == 'start':
+            tag, attrs = event[1], event[2]
+            if tag == 'img':
+                attrs = self._fix_image_alt(attrs)
+            super().handle_starttag(tag, attrs)
+        elif kind == 'end':
+            super().handle_endtag(event[1])
+    
+    def _fix_image_alt(self, attrs):
+        """确保图片有alt属性"""
+        values = dict(attrs)
+        if values.get('alt'):
+            return attrs
+        alt = os.path.basename(values.get('src', ''))
+        if 'alt' in values:
+            return [(name, alt if name == 'alt' else value) for name, value in attrs]
+        return attrs + [('alt', alt)]
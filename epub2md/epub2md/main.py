@@ -7,53 +7,295 @@ epub2md - 将EPUB电子书转换为Markdown格式
 
 import os
 import sys
+import json
+import time
+import contextlib
 import click
 from . import __version__
-from .epub_parser import EPUBParser
-from .converter import HTMLToMarkdownConverter
-from .output import OutputGenerator
+from .constants import ARCHIVE_FORMATS, ENGINES, FSYNC_POLICIES, IMAGE_MODES
 
-@click.command()
+# 转换流程和依赖库在子命令执行时才导入，--help、--version 和补全脚本不必加载它们
+
+
+class DefaultGroup(click.Group):
+    """第一个参数不是子命令时交给默认子命令处理，保持 epub2md 书.epub 的用法"""
+    
+    def __init__(self, *args, **kwargs):
+        self.default_command = kwargs.pop('default_command', None)
+        super().__init__(*args, **kwargs)
+    
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and args[0] not in ctx.help_option_names + ['--version']:
+            args = [self.default_command] + list(args)
+        return super().parse_args(ctx, args)
+
+
+def conversion_options(func):
+    """单本和批量转换共用的选项"""
+    options = [
+        click.option('--single-file', is_flag=True, help='输出为单个Markdown文件'),
+        click.option('--toc/--no-toc', default=True, help='是否包含目录'),
+        click.option('--chapters', callback=parse_chapters_option,
+                     help='只转换指定spine位置的章节 (从1开始)，如 1-3、5、1-3,7、10-'),
+        click.option('--toc-match', callback=parse_toc_match_option,
+                     help='只转换标题匹配正则表达式的目录项所在的部分 (包括其下级目录项)'),
+        click.option('--engine', type=click.Choice(ENGINES), default='html2text', show_default=True,
+                     help='转换引擎，fast 只解析一次HTML，速度更快'),
+        click.option('--images', 'image_mode', type=click.Choice(IMAGE_MODES), default='optimize',
+                     show_default=True, help='图片处理方式，copy 直接复制原始图片，optimize 重新编码压缩'),
+        click.option('--keep-unreferenced', is_flag=True,
+                     help='同时输出没有被任何章节引用的图片 (默认只读取和输出被引用的图片)'),
+        click.option('--image-store', type=click.Path(file_okay=False),
+                     help='共享的图片存储目录，相同的图片只保存一次并以硬链接引用'),
+        click.option('--cache-dir', type=click.Path(file_okay=False),
+                     help='章节缓存目录，默认为 ~/.cache/epub2md'),
+        click.option('--no-cache', is_flag=True, help='不使用章节缓存'),
+        click.option('--index', type=click.Path(dir_okay=False),
+                     help='转换时把章节写入SQLite全文搜索索引 (FTS5)，多本书可以共用一个索引文件'),
+        click.option('--max-memory', callback=parse_memory_option,
+                     help='每本书的内存预算，如 512M、2G。预计超出时降低并行度或直接复制图片，仍然超出时报错'),
+        click.option('--fsync', type=click.Choice(FSYNC_POLICIES), default='none', show_default=True,
+                     help='写入输出目录后的同步策略，files 同步每个文件，all 另外同步目录'),
+        click.option('-v', '--verbose', is_flag=True, help='显示详细信息'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def parse_memory_option(ctx, param, value):
+    """解析 --max-memory 的值"""
+    if value is None:
+        return None
+    from .memory import parse_size
+    try:
+        return parse_size(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def parse_chapters_option(ctx, param, value):
+    """检查 --chapters 的值，原样传给转换流程"""
+    if value is None:
+        return None
+    from .selection import parse_chapter_ranges
+    try:
+        parse_chapter_ranges(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    return value
+
+
+def parse_toc_match_option(ctx, param, value):
+    """检查 --toc-match 的正则表达式"""
+    if value is None:
+        return None
+    import re
+    try:
+        re.compile(value)
+    except re.error as e:
+        raise click.BadParameter(f"无效的正则表达式: {e}")
+    return value
+
+
+def resolve_cache_dir(cache_dir, no_cache):
+    """根据命令行选项确定章节缓存目录，不使用缓存时返回None"""
+    if no_cache:
+        return None
+    if cache_dir:
+        return cache_dir
+    from .cache import default_cache_dir
+    return default_cache_dir()
+
+
+@click.group(cls=DefaultGroup, default_command='convert')
 @click.version_option(version=__version__)
+def main():
+    """将EPUB电子书转换为Markdown格式"""
+
+
+@main.command()
 @click.argument('input_file', type=click.Path(exists=True))
 @click.option('-o', '--output', type=click.Path(), help='输出目录或文件名')
-@click.option('--single-file', is_flag=True, help='输出为单个Markdown文件')
-@click.option('--toc/--no-toc', default=True, help='是否包含目录')
-@click.option('-v', '--verbose', is_flag=True, help='显示详细信息')
-def main(input_file, output, single_file, toc, verbose):
-    """将EPUB电子书转换为Markdown格式"""
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1, show_default=True,
+              help='并行转换章节的进程数')
+@click.option('--profile', type=click.Path(dir_okay=False),
+              help='将各阶段和各章节的耗时写入JSON文件')
+@click.option('--cprofile', type=click.Path(dir_okay=False),
+              help='使用cProfile运行并将统计写入文件 (不包括并行转换的工作进程)')
+@click.option('--trace-memory', is_flag=True,
+              help='在 --profile 报告中记录每个阶段的内存峰值 (使用tracemalloc，会拖慢转换)')
+@click.option('--archive', type=click.Path(dir_okay=False, allow_dash=True),
+              help='直接写入zip/tar归档 (如 out.zip、out.tar.zst)，- 为标准输出，不创建输出目录')
+@click.option('--archive-format', type=click.Choice(ARCHIVE_FORMATS),
+              help='归档格式，默认根据 --archive 的文件名确定，标准输出默认为 tar')
+@conversion_options
+def convert(input_file, output, jobs, profile, cprofile, trace_memory, archive, archive_format, single_file, toc,
+            chapters, toc_match, engine, image_mode, keep_unreferenced, image_store, cache_dir, no_cache, index, max_memory,
+            fsync, verbose):
+    """转换一本EPUB电子书 (默认命令)"""
+    from .pipeline import convert_book, default_output_path
+    from .profiler import Profiler
+    
+    if trace_memory and not profile:
+        raise click.UsageError('--trace-memory 需要与 --profile 一起使用')
+    if archive and image_store:
+        raise click.UsageError('--image-store 不能与 --archive 一起使用')
+    if archive and not archive_format:
+        from .archive import archive_format_for
+        try:
+            archive_format = archive_format_for(archive)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--archive')
+    
+    # 归档写到标准输出时，详细信息改为输出到标准错误
+    redirect = contextlib.ExitStack()
+    location = '标准输出' if archive == '-' else archive
+    if archive == '-':
+        archive = sys.stdout.buffer
+        redirect.enter_context(contextlib.redirect_stdout(sys.stderr))
+    
     try:
         # 如果没有指定输出路径，使用输入文件名作为基础
         if not output:
-            base_name = os.path.splitext(os.path.basename(input_file))[0]
-            if single_file:
-                output = f"{base_name}.md"
-            else:
-                output = base_name
+            output = default_output_path(input_file, single_file)
         
         if verbose:
             click.echo(f"正在处理: {input_file}")
-            click.echo(f"输出位置: {output}")
+            click.echo(f"输出位置: {location or output}")
             click.echo(f"输出模式: {'单文件' if single_file else '多文件'}")
         
-        # 解析EPUB文件
-        parser = EPUBParser(input_file, verbose)
-        book = parser.parse()
+        profiler = Profiler(trace_memory=trace_memory) if profile else None
         
-        # 转换为Markdown
-        converter = HTMLToMarkdownConverter(book, verbose)
-        result = converter.convert()
+        def run():
+            convert_book(input_file, output, single_file, toc, jobs=jobs, engine=engine,
+                         image_mode=image_mode, image_store=image_store,
+                         cache_dir=resolve_cache_dir(cache_dir, no_cache), verbose=verbose, profiler=profiler,
+                         max_memory=max_memory, archive=archive, archive_format=archive_format, fsync=fsync,
+                         keep_unreferenced=keep_unreferenced, chapters=chapters, toc_match=toc_match, index=index)
         
-        # 生成输出
-        generator = OutputGenerator(result, output, single_file, toc, verbose)
-        generator.generate()
+        if cprofile:
+            import cProfile
+            import pstats
+            
+            stats = cProfile.Profile()
+            stats.runcall(run)
+            stats.dump_stats(cprofile)
+            if verbose:
+                pstats.Stats(stats).sort_stats('cumulative').print_stats(20)
+        else:
+            run()
+        
+        if profiler is not None:
+            profiler.write(profile)
+            profiler.close()
         
         if verbose:
+            if profiler is not None:
+                click.echo(f"性能报告: {profile}")
             click.echo("转换完成!")
         
     except Exception as e:
         click.echo(f"错误: {str(e)}", err=True)
         sys.exit(1)
+    finally:
+        redirect.close()
+
+
+@main.command('convert-many')
+@click.argument('inputs', nargs=-1, required=True)
+@click.option('-o', '--output-dir', type=click.Path(file_okay=False), default='.', show_default=True,
+              help='输出目录，每本书输出到以书名命名的子目录或文件')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=os.cpu_count() or 1, show_default=True,
+              help='同时转换的书籍数')
+@click.option('--report', type=click.Path(dir_okay=False), help='将汇总报告写入JSON文件')
+@conversion_options
+def convert_many_command(inputs, output_dir, jobs, report, single_file, toc, chapters, toc_match, engine, image_mode, keep_unreferenced, image_store,
+                         cache_dir, no_cache, index, max_memory, fsync, verbose):
+    """批量转换多本EPUB电子书，INPUTS 可以是文件、目录或通配符"""
+    from .batch import collect_inputs, convert_many, summarize
+    
+    input_files = collect_inputs(inputs)
+    if not input_files:
+        click.echo("错误: 没有找到EPUB文件", err=True)
+        sys.exit(1)
+    
+    def progress(result, done, total):
+        status = '完成' if result['ok'] else '失败'
+        click.echo(f"[{done}/{total}] {status} {result['input']} ({result['elapsed']:.2f}s)")
+        if not result['ok']:
+            click.echo(f"  {result['error']}", err=True)
+    
+    start = time.perf_counter()
+    results = convert_many(input_files, output_dir, jobs=jobs, progress=progress, single_file=single_file,
+                           toc=toc, engine=engine, image_mode=image_mode, image_store=image_store,
+                           cache_dir=resolve_cache_dir(cache_dir, no_cache), max_memory=max_memory,
+                           fsync=fsync, keep_unreferenced=keep_unreferenced, chapters=chapters,
+                           toc_match=toc_match, index=index, verbose=verbose)
+    summary = summarize(results, time.perf_counter() - start)
+    
+    click.echo(f"共 {summary['total']} 本: 成功 {summary['succeeded']}, 失败 {summary['failed']}, "
+               f"耗时 {summary['elapsed']:.2f}s")
+    for result in results:
+        if not result['ok']:
+            click.echo(f"  失败: {result['input']}: {result['error']}")
+    
+    if report:
+        with open(report, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    
+    if summary['failed']:
+        sys.exit(1)
+
+
+@main.command()
+@click.option('--host', default='127.0.0.1', show_default=True, help='HTTP服务监听地址')
+@click.option('--port', type=int, default=8000, show_default=True, help='HTTP服务监听端口')
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False),
+              help='改为在unix socket上接收JSON行任务')
+@click.option('--stdio', is_flag=True, help='改为从标准输入读取JSON行任务，结果写到标准输出')
+@click.option('-o', '--output-dir', type=click.Path(file_okay=False), default='.', show_default=True,
+              help='任务未指定输出路径时的输出目录')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=os.cpu_count() or 1, show_default=True,
+              help='工作进程数')
+@click.option('--allow-any-output', is_flag=True,
+              help='允许任务写到输出目录以外 (默认拒绝，任务的输出路径和存储路径必须在输出目录中)')
+@conversion_options
+def serve(host, port, socket_path, stdio, output_dir, jobs, allow_any_output, single_file, toc, chapters, toc_match, engine, image_mode, keep_unreferenced, image_store,
+          cache_dir, no_cache, index, max_memory, fsync, verbose):
+    """以服务模式运行，常驻的工作进程池接收转换任务
+    
+    \b
+    任务为JSON对象，例如 {"id": 1, "input": "书.epub", "output": "out", "engine": "fast"}，
+    命令行上的转换选项作为任务的默认值。任务中的路径相对于输出目录，默认不能指向输出目录以外。
+    HTTP: POST /convert 提交任务，GET /health 检查状态，GET /stats 查看统计。
+    """
+    from .server import JobServer, serve_stdio, make_http_server, make_unix_server
+    
+    with JobServer(jobs, output_dir, allow_any_output, single_file=single_file, toc=toc, engine=engine,
+                   image_mode=image_mode, image_store=image_store, cache_dir=resolve_cache_dir(cache_dir, no_cache),
+                   max_memory=max_memory, fsync=fsync, keep_unreferenced=keep_unreferenced,
+                   chapters=chapters, toc_match=toc_match, index=index, verbose=verbose) as server:
+        if stdio:
+            serve_stdio(server)
+            return
+        
+        if socket_path:
+            listener = make_unix_server(server, socket_path)
+            address = socket_path
+        else:
+            listener = make_http_server(server, host, port)
+            address = 'http://%s:%d' % listener.server_address[:2]
+        click.echo(f"服务已启动: {address} ({jobs} 个工作进程)", err=True)
+        try:
+            listener.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.server_close()
+            if socket_path and os.path.exists(socket_path):
+                os.unlink(socket_path)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,247 @@
+"""
+内存估算模块 - 估算转换一本书所需的内存，超出预算时降级或提前报错
+"""
+
+import os
+import re
+import sys
+from io import BytesIO
+
+# 转换一个章节时的内存占用相对于HTML大小的倍数 (BeautifulSoup的解析树远大于HTML本身)
+CHAPTER_FACTOR = {'html2text': 12, 'fast': 4}
+
+# 每个章节转换工作进程的解释器和依赖库
+WORKER_OVERHEAD = 40 * 1024 * 1024
+
+# 解码后的图片每个像素的字节数
+PIXEL_BYTES = 4
+
+# 读取图片尺寸时最多读取的字节数
+IMAGE_HEADER_BYTES = 64 * 1024
+
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+SIZE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?\s*$', re.IGNORECASE)
+
+
+class MemoryBudgetError(RuntimeError):
+    """预计的内存占用超过了预算"""
+
+
+def parse_size(text):
+    """
+    解析内存大小，如 '512M'、'2G'、'1.5GiB'，单位按1024计算
+    
+    Args:
+        text (str): 大小
+    
+    Returns:
+        int: 字节数
+    """
+    match = SIZE_PATTERN.match(str(text))
+    if not match:
+        raise ValueError(f"无效的内存大小: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+def format_size(size):
+    """将字节数格式化为便于阅读的形式"""
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GiB"
+
+
+def current_rss():
+    """
+    返回当前进程的常驻内存
+    
+    Returns:
+        int: 字节数，无法获取时为0
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss()
+
+
+def peak_rss():
+    """
+    返回当前进程的常驻内存峰值
+    
+    Returns:
+        int: 字节数，无法获取时为0
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为KB，macOS 上为字节
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _chapter_sizes(book):
+    """章节HTML的大小，从归档目录中读取，不解压章节"""
+    return [chapter.size() for chapter in book.chapters.values()]
+
+
+def _decoded_size(image, data_size):
+    """读取图片头部得到尺寸，估算解码后的大小"""
+    from PIL import Image
+    
+    try:
+        with image.open() as f:
+            head = f.read(IMAGE_HEADER_BYTES)
+        width, height = Image.open(BytesIO(head)).size
+        return width * height * PIXEL_BYTES
+    except Exception:
+        # 无法识别尺寸时按压缩率约为10估算
+        return data_size * 10
+
+
+def _image_footprints(book, image_mode, images=None):
+    """每张图片处理时的内存占用，images 为None时计算所有图片，否则只计算其中的图片ID"""
+    footprints = []
+    for img_id, image in book.images.items():
+        if images is not None and img_id not in images:
+            continue
+        data_size = image.size()
+        footprint = data_size
+        if image_mode == 'optimize' and 'image/svg' not in image.media_type:
+            # 原始数据、解码后的位图和重新编码的输出
+            footprint = data_size * 2 + _decoded_size(image, data_size)
+        footprints.append(footprint)
+    return footprints
+
+
+def estimate_footprint(book, jobs=1, image_jobs=1, image_mode='optimize', engine='html2text', base=None,
+                       images=None):
+    """
+    估算流式转换一本书的内存占用
+    
+    章节逐个转换并写出，同时在内存中的只有在途的章节：串行转换时为一个，
+    并行转换时主进程中最多 jobs*2 个，另外每个工作进程各转换一个。图片由
+    image_jobs 个线程同时处理，只计算最大的几张。
+    
+    Args:
+        book (Book): EPUBParser.parse 的结果
+        jobs (int): 并行转换章节的进程数
+        image_jobs (int): 并行处理图片的线程数
+        image_mode (str): 图片处理方式
+        engine (str): 转换引擎
+        base (int): 转换开始前的常驻内存 (字节)，默认为当前值
+        images (set): 只计算这些图片ID (如实际输出的图片)，为None时计算所有图片
+    
+    Returns:
+        dict: 各部分的估算值 (字节)，total 为总和
+    """
+    chapters = sorted(_chapter_sizes(book), reverse=True)
+    largest = chapters[0] if chapters else 0
+    factor = CHAPTER_FACTOR.get(engine, CHAPTER_FACTOR['html2text'])
+    
+    estimate = {'base': current_rss() if base is None else base}
+    if jobs > 1 and len(chapters) > 1:
+        # 主进程中排队的HTML和Markdown，加上每个工作进程各自转换一个章节
+        estimate['chapters'] = 2 * sum(chapters[:jobs * 2]) + factor * sum(chapters[:jobs])
+        estimate['workers'] = jobs * WORKER_OVERHEAD
+    else:
+        estimate['chapters'] = factor * largest
+        estimate['workers'] = 0
+    
+    footprints = sorted(_image_footprints(book, image_mode, images), reverse=True)
+    estimate['images'] = sum(footprints[:max(1, image_jobs)])
+    estimate['total'] = sum(estimate.values())
+    return estimate
+
+
+def plan_memory(book, max_memory, jobs=1, image_jobs=1, image_mode='optimize', engine='html2text',
+                verbose=False, images=None):
+    """
+    在内存预算内选择转换策略
+    
+    依次尝试: 原来的设置、串行转换章节、串行处理图片、直接复制图片，
+    使用第一个不超过预算的策略。
+    
+    Args:
+        book (Book): EPUBParser.parse 的结果
+        max_memory (int): 内存预算 (字节)
+        jobs (int): 并行转换章节的进程数
+        image_jobs (int): 并行处理图片的线程数
+        image_mode (str): 图片处理方式
+        engine (str): 转换引擎
+        verbose (bool): 是否显示详细信息
+        images (set): 只计算这些图片ID，为None时计算所有图片 (见 estimate_footprint)
+    
+    Returns:
+        dict: 选定的 jobs、image_jobs 和 image_mode
+    
+    Raises:
+        MemoryBudgetError: 所有策略都会超出预算
+    """
+    candidates = [(jobs, image_jobs, image_mode), (1, image_jobs, image_mode), (1, 1, image_mode)]
+    if image_mode == 'optimize':
+        candidates.append((1, 1, 'copy'))
+    
+    # 估算时会导入PIL并读取图片头部，使常驻内存增加；所有策略都与转换开始前的内存比较
+    base = current_rss()
+    seen = set()
+    first = None
+    for candidate in candidates:
+        if candidate in seen:
+            continue
+        seen.add(candidate)
+        estimate = estimate_footprint(book, candidate[0], candidate[1], candidate[2], engine, base=base,
+                                      images=images)
+        if first is None:
+            first = estimate
+        if estimate['total'] <= max_memory:
+            if verbose:
+                print(f"预计内存占用: {format_size(estimate['total'])} (预算 {format_size(max_memory)})")
+                if candidate != candidates[0]:
+                    print(f"  为了不超出内存预算，改为 jobs={candidate[0]}, 图片线程={candidate[1]}, "
+                          f"图片处理方式={candidate[2]}")
+            return {'jobs': candidate[0], 'image_jobs': candidate[1], 'image_mode': candidate[2]}
+    
+    parts = ', '.join(f"{name} {format_size(first[name])}" for name in ('base', 'chapters', 'workers', 'images'))
+    raise MemoryBudgetError(f"预计需要 {format_size(estimate['total'])} 内存，超过限制 {format_size(max_memory)} "
+                            f"(按原设置需要 {format_size(first['total'])}: {parts})")
+
+
+def plan_images(book, max_memory, images=None, image_jobs=1, image_mode='optimize', verbose=False):
+    """
+    章节全部写出后，在内存预算内选择图片的处理方式
+    
+    章节是流式转换的，处理图片时已不在内存中，因此只计算当前的常驻内存和实际输出的
+    图片。依次尝试: 原来的设置、串行处理图片、直接复制图片。
+    
+    Args:
+        book (Book): EPUBParser.parse 的结果
+        max_memory (int): 内存预算 (字节)
+        images (set): 实际输出的图片ID，为None时为所有图片
+        image_jobs (int): 并行处理图片的线程数
+        image_mode (str): 图片处理方式
+        verbose (bool): 是否显示详细信息
+    
+    Returns:
+        dict: 选定的 image_jobs 和 image_mode
+    
+    Raises:
+        MemoryBudgetError: 所有方式都会超出预算
+    """
+    candidates = [(image_jobs, image_mode), (1, image_mode)]
+    if image_mode == 'optimize':
+        candidates.append((1, 'copy'))
+    
+    base = current_rss()
+    for candidate in candidates:
+        footprints = sorted(_image_footprints(book, candidate[1], images), reverse=True)
+        total = base + sum(footprints[:max(1, candidate[0])])
+        if total <= max_memory:
+            if verbose and candidate != candidates[0]:
+                print(f"  为了不超出内存预算，图片改为 图片线程={candidate[0]}, 图片处理方式={candidate[1]}")
+            return {'image_jobs': candidate[0], 'image_mode': candidate[1]}
+    
+    raise MemoryBudgetError(f"处理图片预计需要 {format_size(total)} 内存，超过限制 {format_size(max_memory)} "
+                            f"(当前 {format_size(base)})")
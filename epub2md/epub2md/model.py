@@ -0,0 +1,338 @@
+"""
+数据模型 - 解析后的书籍、章节、目录项和图片
+
+使用 __slots__ 的轻量类代替嵌套字典，批量转换时大量目录项和图片记录的内存开销更小。
+章节和图片只保存在EPUB归档中的位置，内容在访问时才读取。to_dict() 返回以前
+EPUBParser.parse 返回的字典结构，供仍然使用字典的调用方使用。
+"""
+
+import posixpath
+from collections.abc import Mapping
+
+
+class TocEntry:
+    """目录项"""
+    
+    __slots__ = ('title', 'href', 'level', 'children')
+    
+    def __init__(self, title, href, level=0, children=None):
+        """
+        初始化目录项
+        
+        Args:
+            title (str): 标题
+            href (str): 相对于OPF目录的链接，可以带锚点
+            level (int): 层级，顶层为0
+            children (list): 子目录项
+        """
+        self.title = title
+        self.href = href
+        self.level = level
+        self.children = children or []
+    
+    @classmethod
+    def from_dict(cls, data, level=0):
+        """从字典形式的目录项创建，缺少 level 时按嵌套深度计算"""
+        level = data.get('level', level)
+        return cls(data['title'], data['href'], level,
+                   [cls.from_dict(child, level + 1) for child in data.get('children') or ()])
+    
+    def to_dict(self):
+        """转换为字典，子目录项一并转换"""
+        return {'title': self.title, 'href': self.href, 'level': self.level,
+                'children': [child.to_dict() for child in self.children]}
+    
+    def __repr__(self):
+        return f"TocEntry({self.title!r}, {self.href!r}, level={self.level})"
+
+
+class ImageAsset(Mapping):
+    """
+    图片资源
+    
+    data 在访问时才从归档中读取。同时可以按 'data'、'file_name'、'media_type'、'href'
+    以字典方式访问，兼容以前的图片字典。
+    """
+    
+    __slots__ = ('id', 'href', 'file_name', 'media_type', 'archive', '_data')
+    
+    _KEYS = ('data', 'file_name', 'media_type', 'href')
+    
+    def __init__(self, id, href, media_type, archive=None, data=None, file_name=None):
+        """
+        初始化图片资源
+        
+        Args:
+            id (str): 清单中的条目ID
+            href (str): 相对于OPF目录的路径
+            media_type (str): 媒体类型
+            archive (EPUBArchive): 图片所在的EPUB归档，为None时使用 data
+            data (bytes): 图片数据，不从归档中读取时提供
+            file_name (str): 文件名，默认取 href 的最后一部分
+        """
+        self.id = id
+        self.href = href
+        self.media_type = media_type
+        self.archive = archive
+        self._data = data
+        self.file_name = file_name or posixpath.basename(href or '')
+    
+    @property
+    def data(self):
+        """图片数据，未提供时从归档中读取 (每次访问都会重新读取，不缓存)"""
+        if self._data is not None or self.archive is None:
+            return self._data
+        return self.archive.read(self.href)
+    
+    def size(self):
+        """图片数据的大小，从归档的目录中获取，不读取数据"""
+        if self._data is None and self.archive is not None:
+            return self.archive.size(self.href)
+        return len(self._data or b'')
+    
+    def open(self):
+        """以流的方式读取图片数据"""
+        if self._data is None and self.archive is not None:
+            return self.archive.open(self.href)
+        from io import BytesIO
+        return BytesIO(self._data or b'')
+    
+    def __getitem__(self, key):
+        if key in self._KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+    
+    def __iter__(self):
+        return iter(self._KEYS)
+    
+    def __len__(self):
+        return len(self._KEYS)
+    
+    # 按身份比较，不读取图片数据
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+    
+    def to_dict(self):
+        """转换为字典，会读取图片数据"""
+        return {key: getattr(self, key) for key in self._KEYS}
+    
+    def __repr__(self):
+        return f"ImageAsset({self.id!r}, {self.href!r}, {self.media_type!r})"
+
+
+class Chapter:
+    """
+    章节
+    
+    解析得到的章节只有位置信息，HTML在访问 html 时才从归档中读取；iter_chapters
+    返回的章节另外带有转换后的 markdown 和引用的图片。
+    """
+    
+    __slots__ = ('index', 'id', 'title', 'markdown', 'images', 'href', 'archive', '_html')
+    
+    # 比较和 to_dict 使用的字段 (与以前 iter_chapters 返回的命名元组相同)
+    _FIELDS = ('index', 'id', 'title', 'markdown', 'images')
+    
+    def __init__(self, index, id, title=None, markdown=None, images=(), href=None, archive=None, html=None):
+        """
+        初始化章节
+        
+        Args:
+            index (int): 在spine中的位置(从0开始)，不在spine中时为None
+            id (str): 清单中的条目ID
+            title (str): 目录中的标题，没有时为默认标题
+            markdown (str): 转换后的Markdown，图片链接指向 images/ 目录
+            images (tuple): 引用的图片输出路径 (如 'images/cover.jpg')，按首次出现的顺序
+            href (str): 相对于OPF目录的路径
+            archive (EPUBArchive): 章节所在的EPUB归档，为None时使用 html
+            html (str): 章节HTML，不从归档中读取时提供
+        """
+        self.index = index
+        self.id = id
+        self.title = title
+        self.markdown = markdown
+        self.images = images
+        self.href = href
+        self.archive = archive
+        self._html = html
+    
+    @property
+    def html(self):
+        """章节HTML，未提供时从归档中读取并解码 (不缓存，需要时调用 load())"""
+        if self._html is not None or self.archive is None:
+            return self._html
+        return self.archive.read(self.href).decode('utf-8')
+    
+    def load(self):
+        """读取HTML并保存在章节中，之后访问 html 不再读取归档"""
+        self._html = self.html
+        return self._html
+    
+    def size(self):
+        """HTML的字节数，从归档中读取时不解压章节"""
+        if self._html is None and self.archive is not None:
+            return self.archive.size(self.href)
+        return len((self._html or '').encode('utf-8'))
+    
+    def to_dict(self):
+        """转换为字典"""
+        return {field: getattr(self, field) for field in self._FIELDS}
+    
+    def __eq__(self, other):
+        if not isinstance(other, Chapter):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self._FIELDS)
+    
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        return f"Chapter(index={self.index!r}, id={self.id!r}, title={self.title!r})"
+
+
+class BookContent(Mapping):
+    """章节ID到章节HTML的只读映射，值在访问时才读取"""
+    
+    __slots__ = ('chapters',)
+    
+    def __init__(self, chapters):
+        self.chapters = chapters
+    
+    def __getitem__(self, item_id):
+        return self.chapters[item_id].html
+    
+    def __iter__(self):
+        return iter(self.chapters)
+    
+    def __len__(self):
+        return len(self.chapters)
+    
+    def __contains__(self, item_id):
+        return item_id in self.chapters
+
+
+def _flatten(entries):
+    """按文档顺序(先序)展开目录树"""
+    flat = []
+    stack = list(reversed(entries))
+    while stack:
+        entry = stack.pop()
+        flat.append(entry)
+        stack.extend(reversed(entry.children))
+    return tuple(flat)
+
+
+class Book:
+    """解析后的书籍"""
+    
+    __slots__ = ('metadata', 'toc', 'flat_toc', 'spine', 'chapters', 'images', 'hrefs', 'content')
+    
+    def __init__(self, metadata=None, toc=None, spine=None, chapters=None, images=None):
+        """
+        初始化书籍
+        
+        Args:
+            metadata (dict): Dublin Core元数据
+            toc (list): 顶层目录项 (TocEntry)
+            spine (list): 按阅读顺序排列的条目ID
+            chapters (dict): 条目ID到 Chapter 的映射，按清单顺序，包括不在spine中的文档
+            images (dict): 条目ID到 ImageAsset 的映射，按清单顺序
+        """
+        self.metadata = metadata or {}
+        self.toc = toc or []
+        self.spine = spine or []
+        self.chapters = chapters or {}
+        self.images = images or {}
+        # 展开的目录，按文档顺序排列，供需要遍历整个目录的地方直接使用
+        self.flat_toc = _flatten(self.toc)
+        self.hrefs = {item_id: chapter.href for item_id, chapter in self.chapters.items() if chapter.href}
+        self.content = BookContent(self.chapters)
+    
+    @classmethod
+    def coerce(cls, book):
+        """接受 Book 或以前的字典结构，返回 Book"""
+        if isinstance(book, cls):
+            return book
+        return cls.from_dict(book)
+    
+    @classmethod
+    def from_dict(cls, data):
+        """
+        从字典结构创建
+        
+        Args:
+            data (dict): 包含 metadata、toc、spine、content、hrefs、images 的字典，
+                content 为章节ID到HTML (或已转换的Markdown) 的映射
+        
+        Returns:
+            Book: 书籍
+        """
+        spine = list(data.get('spine') or ())
+        positions = {}
+        for index, item_id in enumerate(spine):
+            positions.setdefault(item_id, index)
+        
+        content = data.get('content') or {}
+        if isinstance(content, BookContent):
+            chapters = content.chapters
+        else:
+            hrefs = data.get('hrefs') or {}
+            chapters = {item_id: Chapter(positions.get(item_id), item_id, href=hrefs.get(item_id), html=html)
+                        for item_id, html in content.items()}
+        
+        images = {}
+        for img_id, image in (data.get('images') or {}).items():
+            if not isinstance(image, ImageAsset):
+                image = ImageAsset(img_id, image.get('href'), image['media_type'], data=image.get('data'),
+                                   file_name=image.get('file_name'))
+            images[img_id] = image
+        
+        toc = [entry if isinstance(entry, TocEntry) else TocEntry.from_dict(entry) for entry in data.get('toc') or ()]
+        return cls(dict(data.get('metadata') or {}), toc, spine, chapters, images)
+    
+    def select(self, item_ids):
+        """
+        只保留部分章节
+        
+        spine保持不变，输出的文件编号和默认标题仍然按在整本书中的位置；目录只保留
+        指向选中章节的目录项及其上级。图片不变，输出时只处理被引用的图片。
+        
+        Args:
+            item_ids (set): 保留的章节ID
+        
+        Returns:
+            Book: 新的书籍，与原书籍共享章节和图片对象
+        """
+        chapters = {item_id: chapter for item_id, chapter in self.chapters.items() if item_id in item_ids}
+        hrefs = {chapter.href for chapter in chapters.values() if chapter.href}
+        
+        def prune(entries):
+            kept = []
+            for entry in entries:
+                children = prune(entry.children)
+                if children or entry.href.split('#', 1)[0] in hrefs:
+                    kept.append(TocEntry(entry.title, entry.href, entry.level, children))
+            return kept
+        
+        return Book(self.metadata, prune(self.toc), self.spine, chapters, self.images)
+    
+    def to_dict(self):
+        """
+        转换为以前 EPUBParser.parse 返回的字典结构
+        
+        content 和 images 仍然是惰性的：章节HTML和图片数据在访问时才读取。
+        """
+        return {
+            'metadata': self.metadata,
+            'toc': [entry.to_dict() for entry in self.toc],
+            'spine': self.spine,
+            'content': self.content,
+            'hrefs': self.hrefs,
+            'images': self.images,
+        }
+    
+    def __repr__(self):
+        return f"Book({self.metadata.get('title')!r}, chapters={len(self.chapters)}, images={len(self.images)})"
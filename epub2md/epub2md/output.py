@@ -2,75 +2,195 @@
 输出处理模块 - 负责生成Markdown输出文件
 """
 
+import io
 import os
-import shutil
 import re
-from .resource import ResourceProcessor
+from .resource import ResourceProcessor, ImageResolver
+from .archive import DirectorySink, WRITE_JOBS
+from .memory import plan_images
+from .model import Book
+from .profiler import NULL_PROFILER
+
+
+def collect_toc_titles(flat_toc, href_to_chapter):
+    """
+    遍历一次目录，记录每个章节在目录中的第一个标题
+    
+    Args:
+        flat_toc (tuple): 按文档顺序展开的目录项 (Book.flat_toc)
+        href_to_chapter (dict): 章节href(相对于OPF目录)到章节ID的映射
+    
+    Returns:
+        dict: 章节ID到标题的映射
+    """
+    titles = {}
+    for entry in flat_toc:
+        chapter_id = href_to_chapter.get(entry.href.split('#', 1)[0])
+        if chapter_id and chapter_id not in titles:
+            titles[chapter_id] = entry.title
+    return titles
+
+
+def default_chapter_title(spine_index):
+    """
+    目录中没有标题的章节使用的默认标题
+    
+    Args:
+        spine_index (int): 章节在spine中的位置(从0开始)
+    
+    Returns:
+        str: 默认标题
+    """
+    return f"第{spine_index+1}章"
+
 
 class OutputGenerator:
     """Markdown输出生成器"""
     
-    def __init__(self, book_data, output_path, single_file=False, include_toc=True, verbose=False):
+    def __init__(self, book_data, output_path, single_file=False, include_toc=True, verbose=False,
+                 image_mode='optimize', jobs=1, image_store=None, profiler=None, sink=None,
+                 fsync='none', keep_unreferenced=False, index=None, max_memory=None):
         """
         初始化输出生成器
         
         Args:
-            book_data (dict): 包含书籍内容的字典
+            book_data (Book): 解析后的书籍，也可以是以前的字典结构
             output_path (str): 输出路径
             single_file (bool): 是否输出为单个文件
             include_toc (bool): 是否包含目录
             verbose (bool): 是否显示详细信息
+            image_mode (str): 图片处理方式，'copy' 或 'optimize'
+            jobs (int): 并行处理图片的线程数
+            image_store (str): 共享的内容寻址图片存储目录
+            profiler (Profiler): 性能分析器，为None时不记录耗时
+            sink (ZipSink): 归档输出 (见 archive.open_archive)，提供时所有文件以相同的布局写入归档，
+                不在文件系统中创建任何文件，单文件模式下以 output_path 的文件名作为成员名
+            fsync (str): 写入目录时的同步策略 (见 archive.FSYNC_POLICIES)
+            keep_unreferenced (bool): 是否输出没有被任何章节引用的图片，默认只输出被引用的图片
+            index (BookIndex): 搜索索引 (见 search.SearchIndex.add_book)，提供时每个章节写出时同时写入索引
+            max_memory (int): 内存预算(字节)，提供时在处理图片前按实际输出的图片检查，
+                预计超出时改为串行处理或直接复制图片，仍然超出时报错
         """
-        self.book_data = book_data
+        self.book = Book.coerce(book_data)
         self.output_path = output_path
         self.single_file = single_file
         self.include_toc = include_toc
         self.verbose = verbose
+        self.image_mode = image_mode
+        self.jobs = jobs
+        self.image_store = image_store
+        self.profiler = profiler or NULL_PROFILER
         
         # 确定输出目录
         if self.single_file:
             self.output_dir = os.path.dirname(output_path) or '.'
         else:
             self.output_dir = output_path
-            
+        
+        # 输出目标，未提供归档时写入输出目录。多文件模式下先写入暂存目录，全部完成后再移动到位；
+        # 单文件模式下Markdown文件先写入临时文件再重命名
+        self.sink = sink
+        self.fsync = fsync
+        
         # 资源处理器
         self.resource_processor = None
         
+        # 章节转换时记录引用的图片，章节全部写出后只处理被引用的图片
+        self.keep_unreferenced = keep_unreferenced
+        self.image_links = None if keep_unreferenced else ImageResolver(self.book.images)
+        self.referenced_images = set()  # 章节中引用的图片输出路径 (如 'images/cover.jpg')
+        
+        # 搜索索引
+        self.index = index
+        
+        self.max_memory = max_memory
+        
         # 章节信息映射
         self.chapter_files = {}  # 章节ID到文件名的映射
         self.chapter_titles = {}  # 章节ID到标题的映射
         self.chapter_sequence = []  # 按顺序排列的章节ID
+        self.chapter_positions = {}  # 章节ID到其在chapter_sequence中位置的映射
+        self.href_to_chapter = {}  # 章节href(相对于OPF目录)到章节ID的映射
+        self.toc_titles = {}  # 章节ID到目录中第一个指向它的标题的映射
+        
+        # 流式输出时按需转换章节的函数
+        self.convert = None
     
-    def generate(self):
-        """生成Markdown输出"""
+    def generate(self, convert=None):
+        """
+        生成Markdown输出
+        
+        Args:
+            convert (callable): 接收章节ID列表并按顺序返回 (章节ID, Markdown) 的函数，
+                例如 HTMLToMarkdownConverter.iter_chapters。提供时章节逐个转换并立即写出，
+                book.content 只用于判断章节是否存在；否则从 book.content
+                读取已转换的Markdown
+        """
+        self.convert = convert
+        
         if self.verbose:
             print(f"正在生成Markdown输出...")
             print(f"输出模式: {'单文件' if self.single_file else '多文件'}")
         
-        # 确保输出目录存在
-        os.makedirs(self.output_dir, exist_ok=True)
-        
-        # 处理资源
-        self.resource_processor = ResourceProcessor(self.book_data, self.output_dir, self.verbose)
-        self.resource_processor.process_resources()
-        
-        # 准备章节映射和序列
-        self._prepare_chapter_info()
+        # 确保输出目录存在。归档由调用方关闭，输出目录在这里完成或丢弃
+        owns_sink = self.sink is None
+        if owns_sink:
+            if self.single_file:
+                os.makedirs(self.output_dir, exist_ok=True)
+            self.sink = DirectorySink(self.output_dir, staged=not self.single_file, jobs=WRITE_JOBS,
+                                      fsync=self.fsync)
         
-        if self.single_file:
-            self._generate_single_file()
-        else:
-            self._generate_multiple_files()
+        try:
+            # 准备章节映射和序列
+            self._prepare_chapter_info()
+            
+            if self.single_file:
+                self._generate_single_file()
+            else:
+                self._generate_multiple_files()
+            
+            # 处理资源 (多文件模式下写入暂存目录)。章节已全部转换，只读取被引用的图片
+            used_images = self._used_images()
+            image_mode, image_jobs = self.image_mode, self.jobs
+            if self.max_memory:
+                plan = plan_images(self.book, self.max_memory, used_images, image_jobs, image_mode, self.verbose)
+                image_mode, image_jobs = plan['image_mode'], plan['image_jobs']
+            image_root = self.sink.path if owns_sink else self.output_dir
+            self.resource_processor = ResourceProcessor(self.book, image_root, self.verbose,
+                                                        image_mode=image_mode, jobs=image_jobs,
+                                                        image_store=self.image_store,
+                                                        sink=None if owns_sink else self.sink)
+            with self.profiler.stage('images'):
+                self.resource_processor.process_resources(only=used_images)
+            
+            if owns_sink:
+                with self.profiler.stage('write'):
+                    self.sink.close()
+        except BaseException:
+            if owns_sink:
+                self.sink.abort()
+            raise
+        finally:
+            if owns_sink:
+                self.sink = None
     
     def _prepare_chapter_info(self):
         """准备章节信息，包括文件名、标题和顺序"""
+        # 建立href到章节ID的精确映射
+        for item_id, href in self.book.hrefs.items():
+            self.href_to_chapter[href] = item_id
+        
+        # 遍历一次目录，记录每个章节在目录中的第一个标题
+        self.toc_titles = collect_toc_titles(self.book.flat_toc, self.href_to_chapter)
+        
         # 遍历spine获取章节顺序
-        for idx, item_id in enumerate(self.book_data['spine']):
-            if item_id in self.book_data['content']:
+        for idx, item_id in enumerate(self.book.spine):
+            if item_id in self.book.chapters:
+                self.chapter_positions[item_id] = len(self.chapter_sequence)
                 self.chapter_sequence.append(item_id)
                 
                 # 获取章节标题
-                chapter_title = self._get_chapter_title(item_id) or f"第{idx+1}章"
+                chapter_title = self._get_chapter_title(item_id) or default_chapter_title(idx)
                 self.chapter_titles[item_id] = chapter_title
                 
                 # 生成文件名
@@ -84,15 +204,16 @@ class OutputGenerator:
         if self.verbose:
             print("正在生成单个Markdown文件...")
         
-        with open(self.output_path, 'w', encoding='utf-8') as f:
-            # 写入元数据
-            self._write_metadata(f)
-            f.write('\n\n')
-            
-            # 写入目录
-            if self.include_toc:
-                self._write_toc(f)
+        with self.sink.open(os.path.basename(self.output_path)) as f:
+            with self.profiler.stage('write'):
+                # 写入元数据
+                self._write_metadata(f)
                 f.write('\n\n')
+                
+                # 写入目录
+                if self.include_toc:
+                    self._write_toc(f)
+                    f.write('\n\n')
             
             # 写入内容
             self._write_content(f)
@@ -103,8 +224,8 @@ class OutputGenerator:
             print("正在生成多个Markdown文件...")
         
         # 生成主文件
-        main_file_path = os.path.join(self.output_dir, 'README.md')
-        with open(main_file_path, 'w', encoding='utf-8') as f:
+        with self.profiler.stage('write'):
+            f = io.StringIO()
             # 写入元数据
             self._write_metadata(f)
             f.write('\n\n')
@@ -112,18 +233,20 @@ class OutputGenerator:
             # 写入目录
             if self.include_toc:
                 self._write_toc(f, is_main_file=True)
+            self.sink.write('README.md', f.getvalue().encode('utf-8'))
         
         # 为每个章节生成单独的文件
-        for idx, item_id in enumerate(self.chapter_sequence):
+        for idx, (item_id, content) in enumerate(self._iter_content()):
             if self.verbose:
                 print(f"  正在生成章节: {item_id}")
             
             # 获取章节标题和文件名
             chapter_title = self.chapter_titles.get(item_id, f"第{idx+1}章")
             file_name = self.chapter_files.get(item_id, f"{idx+1:02d}.md")
-            file_path = os.path.join(self.output_dir, file_name)
             
-            with open(file_path, 'w', encoding='utf-8') as f:
+            # 整个章节先在内存中生成，再一次写出
+            with self.profiler.stage('write', item_id):
+                f = io.StringIO()
                 # 1. 添加导航链接 (顶部)
                 self._write_nav_links(f, item_id, position='top')
                 
@@ -131,12 +254,12 @@ class OutputGenerator:
                 f.write(f"# {chapter_title}\n\n")
                 
                 # 3. 写入章节内容
-                content = self.book_data['content'].get(item_id, '')
                 f.write(content)
                 f.write('\n\n')
                 
                 # 4. 添加导航链接 (底部)
                 self._write_nav_links(f, item_id, position='bottom')
+                self.sink.write(file_name, f.getvalue().encode('utf-8'))
     
     def _write_metadata(self, file):
         """
@@ -145,7 +268,7 @@ class OutputGenerator:
         Args:
             file: 文件对象
         """
-        metadata = self.book_data['metadata']
+        metadata = self.book.metadata
         
         # 写入标题
         if 'title' in metadata:
@@ -175,42 +298,37 @@ class OutputGenerator:
         """
         file.write("## 目录\n\n")
         
-        def write_toc_entries(entries, level=0):
-            for entry in entries:
-                indent = '  ' * level
-                title = entry['title']
-                href = entry['href']
-                
-                # 在多文件模式下，链接到对应的文件
-                if is_main_file and not self.single_file:
-                    # 找到对应的章节ID
-                    chapter_id = self._get_chapter_id_from_href(href)
-                    if chapter_id:
-                        # 使用预先生成的文件名
-                        if chapter_id in self.chapter_files:
-                            href = self.chapter_files[chapter_id]
+        # 展开的目录已按文档顺序排列，缩进取决于目录项的层级
+        for entry in self.book.flat_toc:
+            indent = '  ' * entry.level
+            title = entry.title
+            href = entry.href
+            
+            # 找到对应的章节ID
+            chapter_id = self._get_chapter_id_from_href(href)
+            
+            # 在多文件模式下，链接到对应的文件
+            if is_main_file and not self.single_file:
+                if chapter_id:
+                    # 使用预先生成的文件名
+                    if chapter_id in self.chapter_files:
+                        href = self.chapter_files[chapter_id]
+                    else:
+                        # 如果没有预生成的文件名，使用章节标题生成
+                        chapter_title = self._get_chapter_title(chapter_id)
+                        if chapter_title:
+                            safe_title = self._make_safe_filename(chapter_title)
+                            href = f"{safe_title}.md"
                         else:
-                            # 如果没有预生成的文件名，使用章节标题生成
-                            chapter_title = self._get_chapter_title(chapter_id)
-                            if chapter_title:
-                                safe_title = self._make_safe_filename(chapter_title)
-                                href = f"{safe_title}.md"
-                            else:
-                                href = f"{chapter_id}.md"
-                
-                # 在单文件模式下，创建内部锚链接
-                elif self.single_file and chapter_id:
-                    # 创建锚点
-                    anchor = self._make_anchor_id(self.chapter_titles.get(chapter_id, title))
-                    href = f"#{anchor}"
-                        
-                file.write(f"{indent}- [{title}]({href})\n")
-                
-                # 递归处理子目录
-                if entry['children']:
-                    write_toc_entries(entry['children'], level + 1)
-        
-        write_toc_entries(self.book_data['toc'])
+                            href = f"{chapter_id}.md"
+            
+            # 在单文件模式下，创建内部锚链接
+            elif self.single_file and chapter_id:
+                # 创建锚点
+                anchor = self._make_anchor_id(self.chapter_titles.get(chapter_id, title))
+                href = f"#{anchor}"
+            
+            file.write(f"{indent}- [{title}]({href})\n")
     
     def _write_content(self, file):
         """
@@ -220,8 +338,8 @@ class OutputGenerator:
             file: 文件对象
         """
         # 按spine顺序写入内容
-        for item_id in self.chapter_sequence:
-            if item_id in self.book_data['content']:
+        for item_id, content in self._iter_content():
+            with self.profiler.stage('write', item_id):
                 # 获取章节标题
                 chapter_title = self.chapter_titles.get(item_id)
                 
@@ -231,10 +349,51 @@ class OutputGenerator:
                     file.write(f'<a id="{anchor_id}"></a>\n\n')
                     file.write(f"# {chapter_title}\n\n")
                 
-                content = self.book_data['content'][item_id]
                 file.write(content)
                 file.write('\n\n')
     
+    def _iter_content(self):
+        """
+        按spine顺序返回章节内容
+        
+        Returns:
+            iterator: (章节ID, Markdown)
+        """
+        if self.convert is not None:
+            chapters = self.convert(self.chapter_sequence)
+        else:
+            content = self.book.content
+            chapters = ((item_id, content[item_id]) for item_id in self.chapter_sequence)
+        if self.index is not None:
+            chapters = self._index_chapters(chapters)
+        if self.image_links is None:
+            return chapters
+        return self._track_images(chapters)
+    
+    def _index_chapters(self, chapters):
+        """将每个章节写入搜索索引"""
+        for item_id, markdown in chapters:
+            with self.profiler.stage('index', item_id):
+                self.index.add(item_id, self.chapter_titles.get(item_id), markdown)
+            yield item_id, markdown
+    
+    def _track_images(self, chapters):
+        """记录每个章节引用的图片"""
+        for item_id, markdown in chapters:
+            self.referenced_images.update(self.image_links.referenced(markdown))
+            yield item_id, markdown
+    
+    def _used_images(self):
+        """
+        需要输出的图片
+        
+        Returns:
+            set: 被章节引用的图片ID，保留未引用的图片时为None (全部输出)
+        """
+        if self.image_links is None:
+            return None
+        return {img_id for img_id, target in self.image_links.by_id.items() if target in self.referenced_images}
+    
     def _write_nav_links(self, file, current_chapter_id, position='top'):
         """
         写入章节间导航链接
@@ -244,9 +403,8 @@ class OutputGenerator:
             current_chapter_id: 当前章节ID
             position: 位置 ('top' 或 'bottom')
         """
-        try:
-            current_idx = self.chapter_sequence.index(current_chapter_id)
-        except ValueError:
+        current_idx = self.chapter_positions.get(current_chapter_id)
+        if current_idx is None:
             return
         
         # 获取上一章和下一章
@@ -294,49 +452,20 @@ class OutputGenerator:
         Returns:
             str: 章节标题，如果没有找到则返回None
         """
-        # 在目录中查找
-        def find_title_in_toc(entries):
-            for entry in entries:
-                href = entry['href']
-                chapter_id = self._get_chapter_id_from_href(href)
-                
-                if chapter_id == item_id:
-                    return entry['title']
-                
-                # 递归查找子目录
-                if entry['children']:
-                    title = find_title_in_toc(entry['children'])
-                    if title:
-                        return title
-            
-            return None
-        
-        return find_title_in_toc(self.book_data['toc'])
+        return self.toc_titles.get(item_id)
     
     def _get_chapter_id_from_href(self, href):
         """
         从href中提取章节ID
         
         Args:
-            href: href属性值
+            href: 目录中的链接(相对于OPF目录)
             
         Returns:
             str: 章节ID，如果无法提取则返回None
         """
-        # 提取文件名
-        if '#' in href:
-            href = href.split('#')[0]
-        
-        # 提取文件名（不带路径）
-        file_name = os.path.basename(href)
-        
-        # 查找匹配的内容项
-        for item_id, content in self.book_data['content'].items():
-            # 通常EPUB会在文件名部分使用内容ID
-            if item_id in file_name or file_name in item_id:
-                return item_id
-        
-        return None
+        # 去掉锚点，按完整路径精确匹配
+        return self.href_to_chapter.get(href.split('#', 1)[0])
     
     def _make_safe_filename(self, title):
         """
@@ -0,0 +1,30 @@
+"""
+并行处理工具
+"""
+
+from collections import deque
+
+
+def ordered_map(submit, tasks, window):
+    """
+    按提交顺序返回结果的有界并行map
+    
+    与 executor.map 不同，同时在途的任务不超过 window 个，
+    避免一次性把所有章节内容或图片数据读入内存并放入任务队列。
+    
+    Args:
+        submit: 提交单个任务并返回 Future 的函数，例如
+                functools.partial(executor.submit, func)
+        tasks: 任务参数的可迭代对象
+        window (int): 最多同时在途的任务数
+    
+    Yields:
+        任务结果，顺序与 tasks 一致
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(submit(task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -0,0 +1,160 @@
+"""
+转换流程模块 - 串联解析、转换和输出
+"""
+
+import os
+from .epub_parser import EPUBParser
+from .converter import HTMLToMarkdownConverter
+from .output import OutputGenerator, collect_toc_titles, default_chapter_title
+from .cache import ChapterCache
+from .memory import plan_memory
+from .archive import open_archive
+from .model import Chapter
+from .selection import select_chapters
+from .search import SearchIndex
+
+
+def default_output_path(input_file, single_file=False):
+    """
+    根据输入文件名生成默认输出路径
+    
+    Args:
+        input_file (str): EPUB文件路径
+        single_file (bool): 是否输出为单个文件
+    
+    Returns:
+        str: 输出路径
+    """
+    base_name = os.path.splitext(os.path.basename(input_file))[0]
+    if single_file:
+        return f"{base_name}.md"
+    return base_name
+
+
+def convert_book(input_file, output=None, single_file=False, toc=True, jobs=1, engine='html2text',
+                 image_mode='optimize', image_store=None, cache_dir=None, verbose=False, image_jobs=None,
+                 profiler=None, max_memory=None, archive=None, archive_format=None,
+                 fsync='none', keep_unreferenced=False, chapters=None, toc_match=None, index=None):
+    """
+    将一本EPUB电子书转换为Markdown
+    
+    Args:
+        input_file (str): EPUB文件路径
+        output (str): 输出目录或文件名，默认使用输入文件名
+        single_file (bool): 是否输出为单个文件
+        toc (bool): 是否包含目录
+        jobs (int): 并行转换章节的进程数
+        engine (str): 转换引擎
+        image_mode (str): 图片处理方式
+        image_store (str): 共享的图片存储目录
+        cache_dir (str): 章节缓存目录，为None时不使用缓存
+        verbose (bool): 是否显示详细信息
+        image_jobs (int): 并行处理图片的线程数，默认与 jobs 相同
+        profiler (Profiler): 性能分析器，记录各阶段和各章节的耗时
+        max_memory (int): 内存预算(字节)，预计超出时降低并行度或改为直接复制图片，仍然超出时报错
+        archive (str): 归档路径，'-' 为标准输出。提供时以与输出目录相同的布局直接写入zip/tar归档，
+            不在文件系统中创建输出目录，单文件模式下 output 的文件名作为归档中的成员名
+        archive_format (str): 归档格式 (见 archive.ARCHIVE_FORMATS)，默认根据归档文件名确定
+        fsync (str): 写入输出目录时的同步策略 (见 archive.FSYNC_POLICIES)
+        keep_unreferenced (bool): 是否输出没有被任何章节引用的图片，默认只读取和输出被引用的图片
+        chapters (str): 只转换这些spine位置的章节 (从1开始)，如 '1-3'、'1-3,7'，也可以是位置列表
+        toc_match (str): 只转换标题匹配此正则表达式的目录项所在的部分
+        index (str): 搜索索引数据库路径，提供时转换的同时把每个章节写入全文搜索索引，多本书可以共用
+    
+    Returns:
+        str: 输出路径，写入归档时为归档路径
+    
+    Raises:
+        MemoryBudgetError: 预计的内存占用超出 max_memory
+        ValueError: 章节范围无效或没有选中任何章节
+    """
+    if not output:
+        output = default_output_path(input_file, single_file)
+    image_jobs = image_jobs or jobs
+    
+    # 解析EPUB文件 (章节和图片按需从归档中读取，转换结束前保持归档打开)
+    with EPUBParser(input_file, verbose, profiler=profiler) as parser:
+        # 只转换部分章节时，未选中的章节和只被它们引用的图片不会被读取
+        book = select_chapters(parser.parse(), chapters, toc_match)
+        
+        # 在转换任何章节之前根据章节的大小检查内存预算。图片在章节全部写出后才处理，
+        # 那时再按实际输出的图片检查 (见 OutputGenerator)
+        if max_memory:
+            plan = plan_memory(book, max_memory, jobs, image_jobs, image_mode, engine, verbose, images=())
+            jobs = plan['jobs']
+        
+        # 章节按spine顺序逐个转换并立即写出，同一时间只有少数章节的HTML和Markdown
+        # 在内存中；元数据和目录来自OPF/NCX，在任何章节转换之前写出
+        cache = ChapterCache(cache_dir) if cache_dir else None
+        search_index = SearchIndex(index) if index else None
+        book_index = None
+        sink = open_archive(archive, archive_format) if archive else None
+        try:
+            if search_index is not None:
+                book_index = search_index.add_book(book, input_file, archive if isinstance(archive, str) else output)
+            converter = HTMLToMarkdownConverter(book, verbose, jobs=jobs, engine=engine, cache=cache,
+                                                profiler=profiler)
+            generator = OutputGenerator(book, output, single_file, toc, verbose,
+                                        image_mode=image_mode, jobs=image_jobs, image_store=image_store,
+                                        profiler=profiler, sink=sink, fsync=fsync,
+                                        keep_unreferenced=keep_unreferenced, index=book_index,
+                                        max_memory=max_memory)
+            generator.generate(convert=converter.iter_chapters)
+            if sink is not None:
+                sink.close()
+                sink = None
+            # 输出全部完成后才用新的索引记录替换以前的记录
+            if book_index is not None:
+                book_index.commit()
+        except BaseException:
+            if sink is not None:
+                sink.abort()
+            if book_index is not None:
+                book_index.abort()
+            raise
+        finally:
+            if cache is not None:
+                cache.close()
+            if search_index is not None:
+                search_index.close()
+    
+    return archive or output
+
+
+def iter_chapters(epub_path, engine='html2text', jobs=1, cache_dir=None, chapters=None, toc_match=None):
+    """
+    按spine顺序逐个转换章节
+    
+    每个章节转换完成后立即返回，调用方可以随时停止迭代，剩余的章节不会被转换。
+    迭代结束或生成器被关闭时EPUB文件随之关闭。
+    
+    Args:
+        epub_path (str): EPUB文件路径
+        engine (str): 转换引擎
+        jobs (int): 并行转换章节的进程数
+        cache_dir (str): 章节缓存目录，为None时不使用缓存
+        chapters (str): 只转换这些spine位置的章节 (见 convert_book)
+        toc_match (str): 只转换标题匹配此正则表达式的目录项所在的部分
+    
+    Yields:
+        Chapter: 转换后的章节
+    """
+    with EPUBParser(epub_path) as parser:
+        book = select_chapters(parser.parse(), chapters, toc_match)
+        
+        href_to_chapter = {href: item_id for item_id, href in book.hrefs.items()}
+        titles = collect_toc_titles(book.flat_toc, href_to_chapter)
+        spine = [(index, item_id) for index, item_id in enumerate(book.spine) if item_id in book.chapters]
+        
+        cache = ChapterCache(cache_dir) if cache_dir else None
+        converter = HTMLToMarkdownConverter(book, jobs=jobs, engine=engine, cache=cache)
+        chapters = converter.iter_chapters([item_id for _, item_id in spine])
+        try:
+            for (index, item_id), (_, markdown) in zip(spine, chapters):
+                yield Chapter(index, item_id, titles.get(item_id) or default_chapter_title(index), markdown,
+                              tuple(converter.image_resolver.referenced(markdown)), href=book.hrefs.get(item_id))
+        finally:
+            # 提前停止时先结束转换 (关闭进程池)，再关闭缓存和EPUB文件
+            chapters.close()
+            if cache is not None:
+                cache.close()
@@ -0,0 +1,175 @@
+"""
+性能分析模块 - 记录各阶段和各章节的耗时
+"""
+
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from .memory import current_rss, peak_rss
+
+# 记录的阶段，按流程顺序排列
+STAGES = ('parse', 'toc', 'decode', 'preprocess', 'html2text', 'postprocess', 'rewrite', 'index', 'images', 'write')
+
+
+class Profiler:
+    """记录各阶段的累计耗时，以及每个章节在各阶段的耗时和大小"""
+    
+    enabled = True
+    
+    def __init__(self, trace_memory=False):
+        """
+        初始化分析器
+        
+        Args:
+            trace_memory (bool): 是否用tracemalloc记录每个阶段的内存峰值并采样常驻内存，
+                会明显拖慢转换。只统计当前进程，并行转换的工作进程不在其中
+        """
+        self.started = time.perf_counter()
+        self.stages = {}  # 阶段名到 [累计耗时, 次数]
+        self.chapters = {}  # 章节ID到章节记录
+        self.memory = {}  # 阶段名到 [tracemalloc峰值, 阶段结束时的常驻内存最大值]
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self._owns_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self._owns_tracing:
+            tracemalloc.start()
+    
+    def close(self):
+        """停止由分析器开启的内存跟踪"""
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+    
+    @contextmanager
+    def stage(self, name, item_id=None):
+        """
+        计时一个阶段
+        
+        Args:
+            name (str): 阶段名
+            item_id (str): 所属章节ID，不属于某个章节时为None
+        """
+        if self.trace_memory:
+            # reset_peak 需要Python 3.9，更早的版本记录的是从开始到阶段结束的峰值
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, item_id)
+            if self.trace_memory:
+                self._sample_memory(name)
+    
+    def _sample_memory(self, name):
+        """记录阶段内的内存峰值和阶段结束时的常驻内存"""
+        peak = tracemalloc.get_traced_memory()[1]
+        rss = current_rss()
+        with self._lock:
+            memory = self.memory.setdefault(name, [0, 0])
+            memory[0] = max(memory[0], peak)
+            memory[1] = max(memory[1], rss)
+    
+    def record(self, name, seconds, item_id=None):
+        """累加一个阶段的耗时"""
+        with self._lock:
+            total = self.stages.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+            if item_id is not None:
+                stages = self._chapter(item_id)['stages']
+                stages[name] = stages.get(name, 0.0) + seconds
+    
+    def chapter(self, item_id, **info):
+        """记录章节信息，如 html_size、markdown_size、cached"""
+        with self._lock:
+            self._chapter(item_id).update(info)
+    
+    def _chapter(self, item_id):
+        record = self.chapters.get(item_id)
+        if record is None:
+            record = self.chapters[item_id] = {'id': item_id, 'stages': {}}
+        return record
+    
+    def take_chapter(self, item_id):
+        """
+        取出并删除一个章节各阶段的耗时，用于把工作进程中的记录带回主进程
+        
+        Returns:
+            dict: 阶段名到耗时
+        """
+        with self._lock:
+            record = self.chapters.pop(item_id, None)
+        return record['stages'] if record else {}
+    
+    def merge_chapter(self, item_id, stages):
+        """合并 take_chapter 取出的记录"""
+        for name, seconds in stages.items():
+            self.record(name, seconds, item_id)
+    
+    def report(self):
+        """
+        生成报告
+        
+        Returns:
+            dict: 总耗时、各阶段耗时和按转换顺序排列的章节记录
+        """
+        with self._lock:
+            names = [name for name in STAGES if name in self.stages]
+            names += sorted(name for name in self.stages if name not in STAGES)
+            chapters = []
+            for record in self.chapters.values():
+                record = dict(record, stages=dict(record['stages']))
+                record['seconds'] = sum(record['stages'].values())
+                chapters.append(record)
+            stages = {name: {'seconds': self.stages[name][0], 'calls': self.stages[name][1]} for name in names}
+            for name, (peak, rss) in self.memory.items():
+                stages[name].update(peak_memory=peak, rss=rss)
+            return {
+                'total': time.perf_counter() - self.started,
+                'max_rss': peak_rss(),
+                'stages': stages,
+                'chapters': chapters,
+                'slowest_chapters': [record['id'] for record in
+                                     sorted(chapters, key=lambda record: record['seconds'], reverse=True)[:10]],
+            }
+    
+    def write(self, path):
+        """将报告写入JSON文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class NullProfiler:
+    """不记录任何信息的分析器，未启用性能分析时使用"""
+    
+    enabled = False
+    _stage = _NullStage()
+    
+    def stage(self, name, item_id=None):
+        return self._stage
+    
+    def record(self, name, seconds, item_id=None):
+        pass
+    
+    def chapter(self, item_id, **info):
+        pass
+    
+    def take_chapter(self, item_id):
+        return {}
+    
+    def merge_chapter(self, item_id, stages):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
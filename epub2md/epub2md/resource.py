@@ -3,31 +3,367 @@
 """
 
 import os
+import re
 import shutil
-from PIL import Image
+import hashlib
+import functools
+import tempfile
+import posixpath
+from urllib.parse import unquote
 from io import BytesIO
+from .parallel import ordered_map
+from .model import Book, ImageAsset
+from .constants import IMAGE_MODES
+
+# optimize 模式下重新编码的图片类型，其他类型原样输出
+ENCODED_MEDIA_TYPES = ('image/jpeg', 'image/jpg', 'image/png', 'image/gif')
+
+# 图片存储中文件的权限，输出目录中的硬链接与其共享，设为只读防止通过输出文件修改
+_BLOB_MODE = 0o444
+
+# Markdown图片链接: ![alt](目标)，html2text会用反斜杠转义其中的方括号和圆括号
+IMAGE_LINK_PATTERN = re.compile(r'(!\[(?:\\.|[^\\\]])*\]\()((?:\\.|[^\\)])*)\)')
+
+# 带协议的链接 (http:、data: 等)
+URL_SCHEME_PATTERN = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*:')
+
+MARKDOWN_ESCAPE_PATTERN = re.compile(r'([\\\[\]()])')
+
+
+def _escape_link(target):
+    """转义Markdown链接中的空格和括号"""
+    return MARKDOWN_ESCAPE_PATTERN.sub(r'\\\1', target.replace(' ', '%20'))
+
+
+def assign_image_names(images):
+    """
+    为图片分配输出文件名
+    
+    按清单顺序分配，先出现的图片使用原文件名，重名的图片改为 "文件名_图片ID.扩展名"。
+    文件名只取决于清单，与输出目录中已有的文件无关，因此重复转换得到相同的结果。
+    
+    Args:
+        images (dict): 图片ID到图片数据的映射
+    
+    Returns:
+        dict: 图片ID到输出文件名的映射
+    """
+    names = {}
+    taken = set()
+    for img_id, img_data in images.items():
+        file_name = img_data['file_name']
+        if file_name.lower() in taken:
+            base_name, ext = os.path.splitext(file_name)
+            file_name = f"{base_name}_{img_id}{ext}"
+        taken.add(file_name.lower())
+        names[img_id] = file_name
+    return names
+
+
+class ImageResolver:
+    """将章节中的图片链接解析为输出文件路径"""
+    
+    def __init__(self, images, hrefs=None, image_dir='images'):
+        """
+        初始化图片链接解析器
+        
+        Args:
+            images (dict): 图片ID到图片数据的映射
+            hrefs (dict): 章节ID到章节href(相对于OPF目录)的映射
+            image_dir (str): 输出文件中引用图片的目录
+        """
+        self.chapter_dirs = {item_id: posixpath.dirname(href) for item_id, href in (hrefs or {}).items()}
+        self.by_href = {}  # 图片href(相对于OPF目录)到输出路径
+        self.by_id = {}  # 图片ID到输出路径
+        self.by_basename = {}  # 唯一的图片文件名到输出路径
+        self.links = {}  # 写入Markdown的链接到输出路径
+        
+        duplicates = set()
+        for img_id, file_name in assign_image_names(images).items():
+            target = f"{image_dir}/{file_name}" if image_dir else file_name
+            img_data = images[img_id]
+            href = img_data.get('href') or img_data['file_name']
+            self.by_href[href] = target
+            self.by_id[img_id] = target
+            self.links[_escape_link(target)] = target
+            
+            basename = posixpath.basename(href)
+            if basename in self.by_basename:
+                duplicates.add(basename)
+            self.by_basename[basename] = target
+        for basename in duplicates:
+            del self.by_basename[basename]
+    
+    def resolve(self, src, item_id=None):
+        """
+        解析图片链接
+        
+        链接相对于所在章节的路径解析。章节路径未知时，依次按相对于OPF目录的路径、
+        图片ID和唯一的文件名查找。
+        
+        Args:
+            src (str): 图片链接
+            item_id (str): 链接所在章节的ID
+        
+        Returns:
+            str: 输出路径，无法解析时返回None
+        """
+        if not src or src.startswith('/') or URL_SCHEME_PATTERN.match(src):
+            return None
+        path = unquote(src.split('#', 1)[0].split('?', 1)[0])
+        if not path:
+            return None
+        
+        chapter_dir = self.chapter_dirs.get(item_id)
+        if chapter_dir is not None:
+            return self.by_href.get(posixpath.normpath(posixpath.join(chapter_dir, path)))
+        
+        target = self.by_href.get(posixpath.normpath(path)) or self.by_id.get(path)
+        if target is None:
+            target = self.by_basename.get(posixpath.basename(path))
+        return target
+    
+    def rewrite(self, markdown, item_id=None):
+        """
+        一次扫描替换章节中的所有图片链接
+        
+        Args:
+            markdown (str): Markdown内容
+            item_id (str): 章节ID
+        
+        Returns:
+            str: 替换后的Markdown
+        """
+        def replace(match):
+            src = re.sub(r'\\(.)', r'\1', match.group(2))
+            target = self.resolve(src, item_id)
+            if target is None:
+                return match.group(0)
+            return f"{match.group(1)}{_escape_link(target)})"
+        
+        return IMAGE_LINK_PATTERN.sub(replace, markdown)
+    
+    def referenced(self, markdown):
+        """
+        列出改写后的Markdown中引用的图片
+        
+        Args:
+            markdown (str): rewrite() 处理后的Markdown
+        
+        Returns:
+            list: 图片输出路径，按首次出现的顺序去重
+        """
+        images = []
+        seen = set()
+        for match in IMAGE_LINK_PATTERN.finditer(markdown):
+            target = self.links.get(match.group(2))
+            if target is not None and target not in seen:
+                seen.add(target)
+                images.append(target)
+        return images
+
+
+def _encode_image(image_data, media_type, image_mode):
+    """
+    生成图片的输出数据
+    
+    Args:
+        image_data (bytes): 原始图片数据
+        media_type (str): 媒体类型
+        image_mode (str): 处理方式
+    
+    Returns:
+        tuple: (输出数据, 错误)。重新编码失败时返回原始数据和该错误
+    """
+    if image_mode != 'optimize' or 'image/svg' in media_type:
+        return image_data, None
+    
+    # 使用PIL处理图片 (只在需要重新编码时导入)
+    from PIL import Image
+    output = BytesIO()
+    try:
+        img = Image.open(BytesIO(image_data))
+        
+        # 优化输出
+        if media_type == 'image/jpeg' or media_type == 'image/jpg':
+            img.save(output, 'JPEG', quality=90, optimize=True)
+        elif media_type == 'image/png':
+            img.save(output, 'PNG', optimize=True)
+        elif media_type == 'image/gif':
+            img.save(output, 'GIF')
+        else:
+            # 其他类型直接写入
+            return image_data, None
+    except Exception as e:
+        # 如果出错，直接写入原始数据
+        return image_data, e
+    return output.getvalue(), None
+
+
+def _is_passthrough(media_type, image_mode):
+    """图片是否原样输出，不需要解码和重新编码"""
+    return image_mode != 'optimize' or media_type not in ENCODED_MEDIA_TYPES
+
+
+def _save_image(task):
+    """
+    写入单个图片
+    
+    原样输出且来自EPUB归档的图片直接从归档条目复制到输出文件，不读入内存。输出路径
+    已存在时先删除再写入新文件，不会改动硬链接到图片存储中的文件。
+    
+    Args:
+        task (tuple): (图片ID, 输出路径, ImageAsset, 媒体类型, 处理方式, 图片存储)
+    
+    Returns:
+        tuple: (图片ID, 存储中的路径, 错误)。未使用存储时存储路径为None，写入失败时为False；
+               重新编码失败时改为写入原始数据，此时仍返回该错误
+    """
+    img_id, output_path, image, media_type, image_mode, store = task
+    try:
+        if store is None and image.archive is not None and _is_passthrough(media_type, image_mode):
+            image.archive.copy_to(image.href, output_path)
+            return img_id, None, None
+        
+        data, error = _encode_image(image.data, media_type, image_mode)
+        if store is not None:
+            return img_id, store.link(data, os.path.splitext(output_path)[1], output_path), error
+        
+        if os.path.lexists(output_path):
+            os.remove(output_path)
+        with open(output_path, 'wb') as f:
+            f.write(data)
+        return img_id, None, error
+    except Exception as e:
+        return img_id, False, e
+
+
+def _encode_for_archive(task):
+    """
+    生成写入归档的单个图片，写入由调用方按顺序进行
+    
+    原样输出且来自EPUB归档的图片不在这里读取，由调用方写入时从EPUB中按块复制。
+    
+    Args:
+        task (tuple): 与 _save_image 相同
+    
+    Returns:
+        tuple: (图片ID, 输出数据, 错误)。失败时输出数据为None；原样输出的图片为 ImageAsset
+    """
+    img_id, _, image, media_type, image_mode, _ = task
+    try:
+        if image.archive is not None and _is_passthrough(media_type, image_mode):
+            return img_id, image, None
+        data, error = _encode_image(image.data, media_type, image_mode)
+        return img_id, data, error
+    except Exception as e:
+        return img_id, None, e
+
+
+class ImageStore:
+    """
+    内容寻址的图片存储
+    
+    每个不同的图片只以其内容的SHA-256命名保存一次，各本书的输出目录通过硬链接引用，
+    硬链接失败(例如跨文件系统)时复制文件。多本书可以同时使用同一个存储目录。存储中的
+    文件是只读的，通过输出目录中的硬链接也不能修改。
+    """
+    
+    def __init__(self, root):
+        """
+        初始化图片存储
+        
+        Args:
+            root (str): 存储目录
+        """
+        self.root = root
+    
+    def path_for(self, data, ext):
+        """
+        计算图片在存储中的路径
+        
+        Args:
+            data (bytes): 图片数据
+            ext (str): 扩展名
+        
+        Returns:
+            str: 存储路径
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        return os.path.join(self.root, digest[:2], digest + ext.lower())
+    
+    def link(self, data, ext, output_path):
+        """
+        保存图片(已存在时跳过)并在输出路径引用它
+        
+        Args:
+            data (bytes): 图片数据
+            ext (str): 扩展名
+            output_path (str): 输出路径
+        
+        Returns:
+            str: 存储路径
+        """
+        blob_path = self.path_for(data, ext)
+        if not os.path.exists(blob_path):
+            # 先写入临时文件再重命名，其他进程不会看到不完整的文件
+            blob_dir = os.path.dirname(blob_path)
+            os.makedirs(blob_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=blob_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.chmod(temp_path, _BLOB_MODE)
+                os.replace(temp_path, blob_path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        
+        if os.path.lexists(output_path):
+            os.remove(output_path)
+        try:
+            os.link(blob_path, output_path)
+        except OSError:
+            shutil.copyfile(blob_path, output_path)
+        return blob_path
+
 
 class ResourceProcessor:
     """资源处理器，处理EPUB中的资源文件（主要是图片）"""
     
-    def __init__(self, book_data, output_dir, verbose=False):
+    def __init__(self, book_data, output_dir, verbose=False, image_mode='optimize', jobs=1, image_store=None,
+                 sink=None):
         """
         初始化资源处理器
         
         Args:
-            book_data (dict): 包含书籍内容的字典
+            book_data (Book): 解析后的书籍，也可以是包含 images 的字典
             output_dir (str): 输出目录
             verbose (bool): 是否显示详细信息
+            image_mode (str): 图片处理方式，'copy' 或 'optimize'
+            jobs (int): 并行处理和写入图片的线程数
+            image_store (str): 共享的内容寻址图片存储目录，为None时直接写入输出目录
+            sink (ZipSink): 归档输出，提供时图片写入归档的 images/ 下，不使用图片存储
         """
-        self.book_data = book_data
+        if image_mode not in IMAGE_MODES:
+            raise ValueError(f"未知的图片处理方式: {image_mode}")
+        
+        self.book = Book.coerce(book_data)
         self.output_dir = output_dir
         self.verbose = verbose
+        self.image_mode = image_mode
+        self.jobs = max(1, jobs or 1)
+        self.sink = sink
+        self.image_store = ImageStore(image_store) if image_store and sink is None else None
         self.image_dir = os.path.join(output_dir, 'images')
         self.processed_images = {}
     
-    def process_resources(self):
+    def process_resources(self, only=None):
         """
-        处理所有资源文件
+        处理资源文件
+        
+        Args:
+            only (set): 只处理这些图片ID，为None时处理清单中的所有图片。其余图片不会被读取和解压
         
         Returns:
             dict: 处理后的资源映射
@@ -36,76 +372,93 @@ class ResourceProcessor:
             print("正在处理资源文件...")
         
         # 确保图片目录存在
-        os.makedirs(self.image_dir, exist_ok=True)
+        if self.sink is None:
+            os.makedirs(self.image_dir, exist_ok=True)
         
         # 处理图片
-        self._process_images()
+        self._process_images(only)
         
         return self.processed_images
     
-    def _process_images(self):
+    def _process_images(self, only=None):
         """处理图片文件"""
         if self.verbose:
             print("正在处理图片资源...")
         
-        for img_id, img_data in self.book_data['images'].items():
-            try:
-                image_data = img_data['data']
-                file_name = img_data['file_name']
-                media_type = img_data['media_type']
-                
-                # 构建输出路径
-                output_path = os.path.join(self.image_dir, file_name)
-                
-                # 检查文件是否已存在
-                if os.path.exists(output_path):
-                    # 生成唯一文件名
-                    base_name, ext = os.path.splitext(file_name)
-                    file_name = f"{base_name}_{img_id}{ext}"
-                    output_path = os.path.join(self.image_dir, file_name)
-                
-                # 根据媒体类型处理
-                if 'image/svg' in media_type:
-                    # 直接写入SVG文件
-                    with open(output_path, 'wb') as f:
-                        f.write(image_data)
-                else:
-                    try:
-                        # 使用PIL处理图片
-                        img = Image.open(BytesIO(image_data))
-                        
-                        # 优化输出
-                        if media_type == 'image/jpeg' or media_type == 'image/jpg':
-                            img.save(output_path, 'JPEG', quality=90, optimize=True)
-                        elif media_type == 'image/png':
-                            img.save(output_path, 'PNG', optimize=True)
-                        elif media_type == 'image/gif':
-                            img.save(output_path, 'GIF')
-                        else:
-                            # 其他类型直接写入
-                            with open(output_path, 'wb') as f:
-                                f.write(image_data)
-                    except Exception as e:
-                        # 如果出错，直接写入原始数据
-                        if self.verbose:
-                            print(f"  处理图片时出错: {e}，直接写入原始数据")
-                        with open(output_path, 'wb') as f:
-                            f.write(image_data)
+        images = self.book.images
+        names = assign_image_names(images)
+        
+        def tasks():
+            for img_id, image in images.items():
+                if only is not None and img_id not in only:
+                    continue
+                # 图片数据在处理时才读取，原样输出的图片不读入内存
+                output_path = os.path.join(self.image_dir, names[img_id])
+                yield img_id, output_path, image, image.media_type, self.image_mode, self.image_store
                 
-                # 记录处理结果
-                self.processed_images[img_id] = {
-                    'original_file': img_data['file_name'],
-                    'processed_file': file_name,
-                    'output_path': output_path,
-                    'media_type': media_type
-                }
+        # 重新编码和写入在线程池中并行进行 (PIL编码和文件读写时会释放GIL)；
+        # 结果按清单顺序返回，映射与完成顺序无关。归档只能顺序写入，
+        # 线程池中只重新编码，由当前线程按顺序写入归档
+        save = _save_image if self.sink is None else _encode_for_archive
+        if self.jobs > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                submit = functools.partial(executor.submit, save)
+                for result in ordered_map(submit, tasks(), self.jobs * 2):
+                    self._handle_result(names, *result)
+        else:
+            for task in tasks():
+                self._handle_result(names, *save(task))
+    
+    def _handle_result(self, names, img_id, result, error):
+        """写入归档 (如果使用) 并记录图片处理结果"""
+        if self.sink is None:
+            self._record_image(names, img_id, result, error)
+            return
+        if result is None:
+            self._record_image(names, img_id, False, error)
+            return
+        # 写入归档失败时归档已不完整，错误直接向上传递
+        name = f"images/{names[img_id]}"
+        if isinstance(result, ImageAsset):
+            with result.open() as f:
+                self.sink.write_stream(name, f, result.size(), compress=False)
+        else:
+            self.sink.write(name, result, compress=False)
+        self._record_image(names, img_id, None, error)
                 
-                if self.verbose:
-                    print(f"  已处理图片: {file_name}")
-                    
-            except Exception as e:
-                if self.verbose:
-                    print(f"  处理图片 {img_id} 时出错: {e}")
+    def _record_image(self, names, img_id, store_path, error):
+        """
+        记录图片处理结果
+        
+        Args:
+            names (dict): 图片ID到输出文件名的映射
+            img_id (str): 图片ID
+            store_path (str): 图片在存储中的路径，未使用存储时为None，写入失败时为False
+            error (Exception): 处理过程中的错误
+        """
+        if store_path is False:
+            if self.verbose:
+                print(f"  处理图片 {img_id} 时出错: {error}")
+            return
+        
+        if error is not None and self.verbose:
+            print(f"  处理图片时出错: {error}，直接写入原始数据")
+        
+        image = self.book.images[img_id]
+        file_name = names[img_id]
+        
+        # 记录处理结果
+        self.processed_images[img_id] = {
+            'original_file': image.file_name,
+            'processed_file': file_name,
+            'output_path': os.path.join(self.image_dir, file_name),
+            'media_type': image.media_type,
+            'store_path': store_path
+        }
+        
+        if self.verbose:
+            print(f"  已处理图片: {file_name}")
     
     def cleanup(self):
         """清理临时资源"""
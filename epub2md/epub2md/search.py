@@ -0,0 +1,344 @@
+"""
+全文搜索索引 - 转换时把章节写入SQLite FTS5索引
+
+每个章节写出时，转换得到的Markdown、去掉标记后的纯文本、spine位置、目录路径和
+标题的位置同时写入索引，不必在转换后重新读取输出文件。FTS5的 unicode61 分词器
+把连续的中日韩文字当作一个词，因此写入索引前在每个中日韩字符与相邻字符之间加上
+零宽空格，按字建立索引，查询时同样切分并作为短语匹配，不依赖分词库。句子和分句
+的标点以及换行之后另外加入一个分隔词，短语不会跨过标点匹配 (例如 "他方" 不会匹配
+"他。方")。多本书可以共用一个索引数据库，同一本书再次转换成功后才替换以前的记录。
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+
+SCHEMA_VERSION = 1
+
+# 按字建立索引的中日韩文字：假名、CJK统一表意文字 (含扩展A)、兼容表意文字和谚文音节
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+# 切分用的零宽空格，FTS5把它当作分隔符，去掉后即为原文
+_SEPARATOR = '\u200b'
+_CJK_BOUNDARY = re.compile(rf'(?<=[{_CJK}])(?=\S)|(?<=\S)(?=[{_CJK}])')
+# 标点和换行之后加入的分隔词 (私用区字符，unicode61 把它当作一个词)，查询中的标点同样处理
+_BARRIER = '\ue000'
+_PUNCTUATION = re.compile('([\n。！？；，、：…!?;,.:])')
+
+_HEADING = re.compile(r'(#{1,6})\s+(.*?)(?:\s+#+)?\s*$')
+_FENCE = re.compile(r'\s*(```|~~~)')
+_RULE = re.compile(r'\s*([-*_]\s*){3,}$|\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$')
+_BLOCK_PREFIX = re.compile(r'\s*(>\s*)*([*+-]\s+|\d+\.\s+)?')
+_IMAGE = re.compile(r'!\[([^\]]*)\]\([^)]*\)')
+_LINK = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_TAG = re.compile(r'<[^>]+>')
+_UNDERSCORE_EMPHASIS = re.compile(r'(?<!\w)_(?=\S)(.+?)(?<=\S)_(?!\w)')
+_MARKUP = re.compile(r'\*\*|__|[*`]')
+
+
+def segment(text):
+    """
+    在中日韩字符与相邻的字符之间加上零宽空格，使FTS5按字建立索引，并在标点和换行
+    之后加入分隔词
+    
+    Args:
+        text (str): 文本
+    
+    Returns:
+        str: 切分后的文本
+    """
+    text = _CJK_BOUNDARY.sub(_SEPARATOR, text)
+    return _PUNCTUATION.sub(rf'\1{_SEPARATOR}{_BARRIER}{_SEPARATOR}', text)
+
+
+def _inline_text(line):
+    """去掉一行中的行内标记"""
+    line = _IMAGE.sub(r'\1', line)
+    line = _LINK.sub(r'\1', line)
+    line = _TAG.sub('', line)
+    line = _UNDERSCORE_EMPHASIS.sub(r'\1', line)
+    return _MARKUP.sub('', line).replace('|', ' ').strip()
+
+
+def markdown_to_text(markdown):
+    """
+    Markdown转换为纯文本，同时记录标题
+    
+    Args:
+        markdown (str): Markdown
+    
+    Returns:
+        tuple: (纯文本, 标题列表)，标题为 {'level', 'title', 'offset', 'text_offset'}，
+            offset 和 text_offset 分别是标题在Markdown和纯文本中的字符位置
+    """
+    lines = []
+    headings = []
+    offset = 0
+    text_offset = 0
+    in_code = False
+    for line in markdown.splitlines(True):
+        stripped = line.rstrip('\r\n')
+        if _FENCE.match(stripped):
+            in_code = not in_code
+            text = None
+        elif in_code:
+            text = stripped
+        else:
+            match = _HEADING.match(stripped)
+            if match:
+                text = _inline_text(match.group(2))
+                headings.append({'level': len(match.group(1)), 'title': text,
+                                 'offset': offset, 'text_offset': text_offset})
+            elif _RULE.match(stripped):
+                text = None
+            else:
+                text = _inline_text(_BLOCK_PREFIX.sub('', stripped, count=1))
+        offset += len(line)
+        if text:
+            lines.append(text)
+            text_offset += len(text) + 1
+    return '\n'.join(lines), headings
+
+
+def _match_query(query):
+    """用户输入的查询转换为FTS5查询：每个词切分后作为短语，各个词都要匹配"""
+    phrases = []
+    for term in query.split():
+        tokens = [token for token in segment(term).split(_SEPARATOR) if token]
+        if tokens:
+            phrases.append('"%s"' % ' '.join(tokens).replace('"', '""'))
+    return ' '.join(phrases)
+
+
+def _join_cjk(snippet, start, end):
+    """去掉切分时加入的零宽空格和分隔词，合并相邻的高亮"""
+    return snippet.replace(_SEPARATOR, '').replace(_BARRIER, '').replace(end + start, '')
+
+
+class SearchIndex:
+    """
+    章节全文搜索索引
+    
+    多个进程可以同时写入同一个索引数据库。每个章节在一个事务中写入。一本书的章节
+    以新的书籍ID写入，转换成功后才标记为完成并删除这本书以前的记录，转换期间和
+    转换失败时搜索仍然看到以前完整的记录。
+    """
+    
+    def __init__(self, path):
+        """
+        打开或创建索引
+        
+        Args:
+            path (str): 索引数据库路径
+        
+        Raises:
+            ValueError: SQLite不支持FTS5
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        try:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            with self.connection:
+                self.connection.execute('BEGIN IMMEDIATE')
+                self._create_schema()
+        except sqlite3.OperationalError as e:
+            self.connection.close()
+            if 'fts5' in str(e):
+                raise ValueError("全文搜索索引需要支持FTS5的SQLite") from e
+            raise
+    
+    def _create_schema(self):
+        """创建表"""
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS books ('
+            'id INTEGER PRIMARY KEY, source TEXT NOT NULL, identifier TEXT, title TEXT, creator TEXT, '
+            'language TEXT, output TEXT, indexed REAL NOT NULL, complete INTEGER NOT NULL DEFAULT 0)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS books_source ON books (source)')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS chapters ('
+            'id INTEGER PRIMARY KEY, book_id INTEGER NOT NULL REFERENCES books (id), item_id TEXT NOT NULL, '
+            'spine_index INTEGER, title TEXT, toc_path TEXT NOT NULL, headings TEXT NOT NULL, '
+            'markdown TEXT NOT NULL, text TEXT NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS chapters_book ON chapters (book_id, spine_index)')
+        # rowid 与 chapters.id 相同，内容为切分后的标题、目录路径和纯文本
+        self.connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chapter_text USING fts5(title, toc_path, text, tokenize='unicode61')"
+        )
+        self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def close(self):
+        """关闭数据库"""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+    
+    def add_book(self, book, source, output=None):
+        """
+        开始索引一本书，转换成功后调用返回对象的 commit() 替换这本书以前的记录
+        
+        Args:
+            book (Book): 解析后的书籍
+            source (str): EPUB文件路径，转换为绝对路径后作为书的键
+            output (str): 输出路径
+        
+        Returns:
+            BookIndex: 写入这本书的章节
+        """
+        source = os.path.abspath(source)
+        metadata = book.metadata
+        book_id = self.connection.execute(
+            'INSERT INTO books (source, identifier, title, creator, language, output, indexed) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (source, metadata.get('identifier'), metadata.get('title'), metadata.get('creator'),
+             metadata.get('language'), output, time.time())
+        ).lastrowid
+        return BookIndex(self, book_id, book)
+    
+    def complete_book(self, book_id):
+        """
+        标记一本书已完成，删除同一本书以前的记录 (包括以前中断留下的记录)
+        
+        Args:
+            book_id (int): add_book 分配的书籍ID
+        """
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            source = self.connection.execute('SELECT source FROM books WHERE id = ?', (book_id,)).fetchone()[0]
+            for (old_id,) in self.connection.execute('SELECT id FROM books WHERE source = ? AND id != ?',
+                                                     (source, book_id)).fetchall():
+                self._delete_book(old_id)
+            self.connection.execute('UPDATE books SET complete = 1 WHERE id = ?', (book_id,))
+    
+    def remove_book(self, book_id):
+        """
+        删除一本书的全部记录
+        
+        Args:
+            book_id (int): add_book 分配的书籍ID
+        """
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self._delete_book(book_id)
+    
+    def _delete_book(self, book_id):
+        self.connection.execute('DELETE FROM chapter_text WHERE rowid IN (SELECT id FROM chapters WHERE book_id = ?)',
+                                (book_id,))
+        self.connection.execute('DELETE FROM chapters WHERE book_id = ?', (book_id,))
+        self.connection.execute('DELETE FROM books WHERE id = ?', (book_id,))
+    
+    def search(self, query, limit=20, highlight=('[', ']')):
+        """
+        搜索章节
+        
+        查询中用空格分隔的各个词都要出现，每个词中的中日韩文字按相邻的字匹配，不跨过
+        标点和换行。只返回已完成的书中的章节。
+        
+        Args:
+            query (str): 查询
+            limit (int): 最多返回的结果数
+            highlight (tuple): 摘要中标记匹配内容的前后标记
+        
+        Returns:
+            list: 按相关度排列的结果，每个结果为 {'book', 'source', 'output', 'item_id', 'spine_index',
+                'title', 'toc_path', 'snippet'}
+        """
+        match = _match_query(query)
+        if not match:
+            return []
+        start, end = highlight
+        rows = self.connection.execute(
+            'SELECT books.title, books.source, books.output, chapters.item_id, chapters.spine_index, '
+            'chapters.title, chapters.toc_path, snippet(chapter_text, 2, ?, ?, ?, 24) '
+            'FROM chapter_text JOIN chapters ON chapters.id = chapter_text.rowid '
+            'JOIN books ON books.id = chapters.book_id '
+            'WHERE chapter_text MATCH ? AND books.complete ORDER BY bm25(chapter_text) LIMIT ?',
+            (start, end, '…', match, limit)
+        )
+        return [{'book': book, 'source': source, 'output': output, 'item_id': item_id, 'spine_index': spine_index,
+                 'title': title, 'toc_path': json.loads(toc_path), 'snippet': _join_cjk(snippet, start, end)}
+                for book, source, output, item_id, spine_index, title, toc_path, snippet in rows]
+
+
+class BookIndex:
+    """写入一本书的章节，由 SearchIndex.add_book 创建"""
+    
+    def __init__(self, index, book_id, book):
+        """
+        初始化
+        
+        Args:
+            index (SearchIndex): 索引
+            book_id (int): 书籍ID
+            book (Book): 解析后的书籍
+        """
+        self.index = index
+        self.book_id = book_id
+        self.spine_positions = {}
+        for position, item_id in enumerate(book.spine):
+            self.spine_positions.setdefault(item_id, position)
+        self.toc_paths = self._toc_paths(book)
+    
+    def _toc_paths(self, book):
+        """
+        每个章节的目录路径
+        
+        取目录中第一个指向章节的目录项及其上级的标题；目录中没有列出的章节属于
+        spine中前一个章节所在的部分
+        """
+        href_to_chapter = {href: item_id for item_id, href in book.hrefs.items()}
+        paths = {}
+        ancestors = []
+        for entry in book.flat_toc:
+            del ancestors[entry.level:]
+            ancestors.append(entry.title)
+            chapter_id = href_to_chapter.get(entry.href.split('#', 1)[0])
+            if chapter_id and chapter_id not in paths:
+                paths[chapter_id] = list(ancestors)
+        
+        path = []
+        for item_id in book.spine:
+            path = paths.setdefault(item_id, path)
+        return paths
+    
+    def add(self, item_id, title, markdown):
+        """
+        写入一个章节
+        
+        Args:
+            item_id (str): 章节ID
+            title (str): 章节标题
+            markdown (str): 转换后的Markdown
+        """
+        text, headings = markdown_to_text(markdown)
+        toc_path = self.toc_paths.get(item_id, [])
+        connection = self.index.connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            chapter_id = connection.execute(
+                'INSERT INTO chapters (book_id, item_id, spine_index, title, toc_path, headings, markdown, text) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.book_id, item_id, self.spine_positions.get(item_id), title,
+                 json.dumps(toc_path, ensure_ascii=False), json.dumps(headings, ensure_ascii=False), markdown, text)
+            ).lastrowid
+            connection.execute('INSERT INTO chapter_text (rowid, title, toc_path, text) VALUES (?, ?, ?, ?)',
+                               (chapter_id, segment(title or ''), segment(' '.join(toc_path)), segment(text)))
+    
+    def commit(self):
+        """转换成功后调用，替换这本书以前的记录"""
+        self.index.complete_book(self.book_id)
+    
+    def abort(self):
+        """转换失败时删除这次写入的记录，以前的记录保持不变"""
+        self.index.remove_book(self.book_id)
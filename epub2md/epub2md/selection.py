@@ -0,0 +1,118 @@
+"""
+章节选择 - 只转换书中的部分章节
+
+按spine位置 (如 1-3) 或目录标题 (正则表达式) 选出章节，得到只包含这些章节的 Book。
+章节和图片都是按需从EPUB中读取的，未选中的章节不会被解压，也不会被转换；图片只
+输出被选中章节引用的部分，因此预览的耗时取决于选出的部分而不是整本书。
+"""
+
+import re
+
+_RANGE_PATTERN = re.compile(r'(\d+)(?:\s*(-)\s*(\d*))?')
+
+
+def parse_chapter_ranges(spec):
+    """
+    解析章节范围
+    
+    Args:
+        spec (str): 逗号分隔的spine位置或范围 (从1开始，包含两端)，如 '1-3'、'5'、'1-3,7'、'10-'
+    
+    Returns:
+        list: (起始, 结束) 元组，结束为None表示到最后
+    
+    Raises:
+        ValueError: 范围格式无效
+    """
+    ranges = []
+    for part in str(spec).split(','):
+        match = _RANGE_PATTERN.fullmatch(part.strip())
+        if not match:
+            raise ValueError(f"无效的章节范围: {part.strip()!r}")
+        start = int(match.group(1))
+        if not match.group(2):
+            end = start
+        else:
+            end = int(match.group(3)) if match.group(3) else None
+        if start < 1 or (end is not None and end < start):
+            raise ValueError(f"无效的章节范围: {part.strip()!r}")
+        ranges.append((start, end))
+    return ranges
+
+
+def _chapter_ranges(chapters):
+    """章节范围字符串或spine位置列表转换为范围列表"""
+    if isinstance(chapters, str):
+        return parse_chapter_ranges(chapters)
+    return [(int(position), int(position)) for position in chapters]
+
+
+def toc_sections(book, pattern):
+    """
+    标题匹配的目录项所在部分包含的章节
+    
+    一个部分从目录项指向的文档开始，到文档顺序中下一个同级或更高级目录项指向的
+    文档为止 (不包括)，因此包括其子目录项和目录中没有列出的文档。
+    
+    Args:
+        book (Book): 解析后的书籍
+        pattern (str): 正则表达式，在目录标题中搜索，也可以是已编译的模式
+    
+    Returns:
+        set: 章节ID
+    """
+    pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+    href_to_chapter = {href: item_id for item_id, href in book.hrefs.items()}
+    spine_positions = {}
+    for index, item_id in enumerate(book.spine):
+        spine_positions.setdefault(item_id, index)
+    
+    flat_toc = book.flat_toc
+    starts = [spine_positions.get(href_to_chapter.get(entry.href.split('#', 1)[0])) for entry in flat_toc]
+    
+    selected = set()
+    for i, entry in enumerate(flat_toc):
+        if starts[i] is None or not pattern.search(entry.title or ''):
+            continue
+        end = len(book.spine)
+        for j in range(i + 1, len(flat_toc)):
+            # 同一文档中的后续目录项 (锚点) 不结束这一部分
+            if flat_toc[j].level <= entry.level and starts[j] is not None and starts[j] > starts[i]:
+                end = starts[j]
+                break
+        selected.update(book.spine[starts[i]:end])
+    return selected
+
+
+def select_chapters(book, chapters=None, toc_match=None):
+    """
+    选出部分章节
+    
+    同时提供 chapters 和 toc_match 时只保留两者都选中的章节。
+    
+    Args:
+        book (Book): 解析后的书籍
+        chapters (str): spine位置范围 (见 parse_chapter_ranges)，也可以是spine位置列表
+        toc_match (str): 正则表达式，选出标题匹配的目录项所在的部分 (见 toc_sections)
+    
+    Returns:
+        Book: 只包含选中章节的书籍，两者都为None时返回原书籍
+    
+    Raises:
+        ValueError: 范围格式无效或没有选中任何章节
+    """
+    if chapters is None and toc_match is None:
+        return book
+    
+    positions = [(index, item_id) for index, item_id in enumerate(book.spine) if item_id in book.chapters]
+    if chapters is not None:
+        ranges = _chapter_ranges(chapters)
+        positions = [(index, item_id) for index, item_id in positions
+                     if any(start <= index + 1 and (end is None or index + 1 <= end) for start, end in ranges)]
+    if toc_match is not None:
+        sections = toc_sections(book, toc_match)
+        positions = [(index, item_id) for index, item_id in positions if item_id in sections]
+    
+    if not positions:
+        raise ValueError("没有选中任何章节")
+    return book.select({item_id for _, item_id in positions})
@@ -0,0 +1,437 @@
+"""
+服务模式 - 常驻进程接收转换任务
+
+命令行每次运行都要重新导入解析和转换所需的库，对大量小书来说启动开销比转换本身
+还大。服务模式启动时预先创建并预热工作进程池，之后通过本地HTTP接口、标准输入或
+unix socket 上的JSON行接收任务，每个任务返回转换结果和耗时。
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from .batch import _convert_one
+from .pipeline import default_output_path
+from .memory import parse_size
+
+# 任务中允许指定的转换选项
+JOB_OPTIONS = ('single_file', 'toc', 'engine', 'image_mode', 'image_store', 'cache_dir', 'max_memory', 'fsync',
+               'keep_unreferenced', 'chapters', 'toc_match',
+               'index')
+
+# 任务中的路径选项，与 output 一样只能指向输出目录中
+JOB_PATH_OPTIONS = ('image_store', 'cache_dir', 'index')
+
+
+def _warm_up():
+    """
+    工作进程启动时导入转换所需的库
+    
+    工作进程的输出 (如 verbose 的进度信息) 改写到标准错误，标准输出留给 --stdio 的结果行。
+    """
+    sys.stdout = sys.stderr
+    from . import converter, fast_engine, resource  # noqa: F401
+    import bs4  # noqa: F401
+    import PIL.Image  # noqa: F401
+
+
+def _ping():
+    return os.getpid()
+
+
+class JobServer:
+    """持有预热的工作进程池，执行转换任务并统计结果"""
+    
+    def __init__(self, jobs=1, output_dir='.', allow_any_output=False, **defaults):
+        """
+        初始化服务
+        
+        Args:
+            jobs (int): 工作进程数
+            output_dir (str): 任务未指定输出路径时的输出目录，任务中的相对路径也相对于它
+            allow_any_output (bool): 是否允许任务写到输出目录以外，默认拒绝这样的任务
+            **defaults: 任务的默认转换选项
+        """
+        self.jobs = jobs
+        self.output_dir = output_dir
+        self.allow_any_output = allow_any_output
+        self.defaults = defaults
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._stats = {'submitted': 0, 'active': 0, 'succeeded': 0, 'failed': 0, 'book_time': 0.0,
+                       'restarts': 0}
+        # 替换进程池期间持有，同时发现进程池损坏的线程只替换一次
+        self._pool_lock = threading.Lock()
+        self._broken = False
+        self.executor = self._start_pool()
+    
+    def _start_pool(self):
+        """创建进程池并预先启动全部工作进程，第一个任务不必等待进程创建和库导入"""
+        executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=_warm_up)
+        try:
+            for future in [executor.submit(_ping) for _ in range(self.jobs)]:
+                future.result()
+        except BaseException:
+            executor.shutdown(wait=False)
+            raise
+        return executor
+    
+    def _replace_pool(self, broken):
+        """
+        用新的进程池替换损坏的进程池
+        
+        工作进程异常退出 (如被系统因内存不足杀掉) 后进程池不再接受任务，替换后之后的任务
+        使用新的进程池。
+        
+        Args:
+            broken (ProcessPoolExecutor): 损坏的进程池，已经被替换时不再重复替换
+        
+        Returns:
+            ProcessPoolExecutor: 当前的进程池
+        """
+        with self._pool_lock:
+            if self.executor is not broken:
+                return self.executor
+            executor = self._start_pool()
+            with self._lock:
+                self.executor = executor
+                self._broken = False
+                self._stats['restarts'] += 1
+        broken.shutdown(wait=False)
+        return executor
+    
+    def _pool_broken(self, broken):
+        """任务发现进程池损坏时在后台替换，不阻塞进程池的回调线程"""
+        with self._lock:
+            if self.executor is not broken or self._broken:
+                return
+            self._broken = True
+        threading.Thread(target=self._replace_pool, args=(broken,), daemon=True).start()
+    
+    def health(self):
+        """
+        返回进程池状态
+        
+        Returns:
+            dict: status 为 ok，进程池损坏且尚未替换时为 broken；另有工作进程数和进程池替换次数
+        """
+        with self._lock:
+            status = 'broken' if self._broken else 'ok'
+            restarts = self._stats['restarts']
+        return {'status': status, 'workers': self.jobs, 'restarts': restarts}
+    
+    def close(self):
+        """等待进行中的任务完成并关闭进程池"""
+        self.executor.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _make_task(self, job):
+        """将任务描述转换为 _convert_one 的参数"""
+        if not isinstance(job, dict) or not job.get('input'):
+            raise ValueError("任务必须是包含 input 的JSON对象")
+        unknown = set(job) - set(JOB_OPTIONS) - {'id', 'input', 'output'}
+        if unknown:
+            raise ValueError(f"未知的任务选项: {', '.join(sorted(unknown))}")
+        
+        options = dict(self.defaults)
+        options.update((key, job[key]) for key in JOB_OPTIONS if key in job)
+        if isinstance(options.get('max_memory'), str):
+            options['max_memory'] = parse_size(options['max_memory'])
+        for key in JOB_PATH_OPTIONS:
+            if job.get(key):
+                options[key] = self._check_path(key, job[key])
+        if job.get('output'):
+            output = self._check_path('output', job['output'])
+        else:
+            output = os.path.join(self.output_dir,
+                                  default_output_path(job['input'], options.get('single_file', False)))
+        return job.get('id'), job['input'], output, options
+    
+    def _check_path(self, key, path):
+        """
+        解析任务中的输出路径
+        
+        任务来自本地的任何进程，默认只允许写到输出目录中 (解析符号链接后判断)。
+        
+        Args:
+            key (str): 选项名，用于错误信息
+            path (str): 任务中的路径，相对路径相对于输出目录
+        
+        Returns:
+            str: 路径
+        
+        Raises:
+            ValueError: 路径不在输出目录中
+        """
+        if not isinstance(path, str):
+            raise ValueError(f"{key} 必须是字符串")
+        path = os.path.join(self.output_dir, path)
+        if self.allow_any_output:
+            return path
+        root = os.path.realpath(self.output_dir)
+        resolved = os.path.realpath(path)
+        if os.path.commonpath([root, resolved]) != root:
+            raise ValueError(f"{key} 必须在输出目录 {self.output_dir} 中: {path}")
+        return path
+    
+    def submit(self, job, callback):
+        """
+        提交一个任务，完成时在后台线程中调用 callback(结果)
+        
+        Args:
+            job (dict): 任务描述，包含 input，可选 id、output 和转换选项
+            callback (callable): 接收结果字典
+        """
+        with self._lock:
+            self._counter += 1
+            if isinstance(job, dict) and job.get('id') is not None:
+                job_id = job['id']
+            else:
+                job_id = self._counter
+            self._stats['submitted'] += 1
+            self._stats['active'] += 1
+        
+        submitted = time.perf_counter()
+        
+        def finish(result):
+            result['id'] = result.pop('index', job_id)
+            result['total'] = time.perf_counter() - submitted
+            with self._lock:
+                self._stats['active'] -= 1
+                self._stats['succeeded' if result['ok'] else 'failed'] += 1
+                self._stats['book_time'] += result['elapsed']
+            callback(result)
+        
+        try:
+            _, input_file, output, options = self._make_task(job)
+        except ValueError as e:
+            finish({'index': job_id, 'input': job.get('input') if isinstance(job, dict) else None,
+                    'output': None, 'ok': False, 'error': f"ValueError: {e}", 'elapsed': 0.0})
+            return
+        
+        def fail(error):
+            finish({'index': job_id, 'input': input_file, 'output': output, 'ok': False,
+                    'error': f"{type(error).__name__}: {error}", 'elapsed': 0.0})
+        
+        def done(future):
+            try:
+                result = future.result()
+            except Exception as e:
+                # 工作进程异常退出
+                if isinstance(e, BrokenProcessPool):
+                    self._pool_broken(executor)
+                fail(e)
+                return
+            finish(result)
+        
+        task = (job_id, input_file, output, options)
+        executor = self.executor
+        try:
+            try:
+                future = executor.submit(_convert_one, task)
+            except BrokenProcessPool:
+                executor = self._replace_pool(executor)
+                future = executor.submit(_convert_one, task)
+        except Exception as e:
+            fail(e)
+            return
+        future.add_done_callback(done)
+    
+    def run(self, jobs):
+        """
+        提交一组任务并等待全部完成
+        
+        Args:
+            jobs (list): 任务描述
+        
+        Returns:
+            list: 每个任务的结果，顺序与 jobs 一致
+        """
+        results = [None] * len(jobs)
+        remaining = [len(jobs)]
+        finished = threading.Condition()
+        
+        def collect(position):
+            def callback(result):
+                with finished:
+                    results[position] = result
+                    remaining[0] -= 1
+                    finished.notify_all()
+            return callback
+        
+        for position, job in enumerate(jobs):
+            self.submit(job, collect(position))
+        with finished:
+            while remaining[0]:
+                finished.wait()
+        return results
+    
+    def stats(self):
+        """返回服务状态和任务统计"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['workers'] = self.jobs
+        stats['uptime'] = time.time() - self.started
+        stats['pid'] = os.getpid()
+        return stats
+
+
+def serve_lines(server, lines, write):
+    """
+    处理JSON行形式的任务，每行一个任务，结果按完成顺序逐行写出
+    
+    一行 {"cmd": "stats"} 返回服务统计。
+    
+    Args:
+        server (JobServer): 任务服务
+        lines: 输入行的可迭代对象
+        write (callable): 写出一行结果
+    """
+    lock = threading.Lock()
+    pending = [0]
+    idle = threading.Condition(lock)
+    
+    def emit(result):
+        line = json.dumps(result, ensure_ascii=False) + '\n'
+        with lock:
+            write(line)
+    
+    def callback(result):
+        emit(result)
+        with idle:
+            pending[0] -= 1
+            idle.notify_all()
+    
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            emit({'id': None, 'ok': False, 'error': f"无效的JSON: {e}"})
+            continue
+        if isinstance(job, dict) and job.get('cmd') == 'stats':
+            emit(server.stats())
+            continue
+        with idle:
+            pending[0] += 1
+        server.submit(job, callback)
+    
+    # 输入结束后等待所有任务完成
+    with idle:
+        while pending[0]:
+            idle.wait()
+
+
+def serve_stdio(server, stdin=None, stdout=None):
+    """从标准输入读取JSON行任务，结果写到标准输出"""
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    
+    def write(line):
+        stdout.write(line)
+        stdout.flush()
+    
+    serve_lines(server, stdin, write)
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_unix_server(server, path):
+    """
+    创建在 unix socket 上接收JSON行任务的服务，每个连接独立处理
+    
+    Args:
+        server (JobServer): 任务服务
+        path (str): socket 路径
+    
+    Returns:
+        socketserver.UnixStreamServer: 调用 serve_forever() 开始服务
+    """
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            lines = (line.decode('utf-8') for line in self.rfile)
+            
+            def write(line):
+                self.wfile.write(line.encode('utf-8'))
+                self.wfile.flush()
+            
+            serve_lines(server, lines, write)
+    
+    if os.path.exists(path):
+        os.unlink(path)
+    return _ThreadingUnixServer(path, Handler)
+
+
+def make_http_server(server, host='127.0.0.1', port=8000):
+    """
+    创建本地HTTP服务
+    
+    POST /convert 提交一个任务(JSON对象)或一组任务(JSON数组)，等待完成后返回结果；
+    GET /health 返回进程池状态 (见 JobServer.health)，进程池不可用时状态码为503；GET /stats 返回任务统计。
+    
+    Args:
+        server (JobServer): 任务服务
+        host (str): 监听地址
+        port (int): 监听端口，0 表示自动分配
+    
+    Returns:
+        HTTPServer: 调用 serve_forever() 开始服务
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        
+        def do_GET(self):
+            if self.path == '/health':
+                health = server.health()
+                self._reply(200 if health['status'] == 'ok' else 503, health)
+            elif self.path == '/stats':
+                self._reply(200, server.stats())
+            else:
+                self._reply(404, {'error': '未知的路径'})
+        
+        def do_POST(self):
+            if self.path != '/convert':
+                self._reply(404, {'error': '未知的路径'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length).decode('utf-8'))
+            except ValueError as e:
+                self._reply(400, {'error': f"无效的JSON: {e}"})
+                return
+            
+            if isinstance(body, list):
+                self._reply(200, server.run(body))
+            else:
+                result = server.run([body])[0]
+                self._reply(200 if result['ok'] else 422, result)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    return _ThreadingHTTPServer((host, port), Handler)
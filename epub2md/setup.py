@@ -35,12 +35,15 @@ setup(
         ],
     },
     install_requires=[
-        'ebooklib>=0.17.1',
         'beautifulsoup4>=4.9.0',
         'html2text>=2020.1.16',
         'Pillow>=7.0.0',
         'click>=7.0',
     ],
+    extras_require={
+        # 写入 .tar.zst 归档
+        'zstd': ['zstandard>=0.15'],
+    },
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: End Users/Desktop',
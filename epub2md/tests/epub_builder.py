@@ -0,0 +1,109 @@
+"""
+测试用EPUB构建工具
+"""
+import zipfile
+from xml.sax.saxutils import escape
+
+CHAPTER_TEMPLATE = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>{title}</title></head>'
+    '<body>{body}</body></html>'
+)
+
+
+def chapter_html(title, body):
+    """生成章节XHTML"""
+    return CHAPTER_TEMPLATE.format(title=escape(title), body=body)
+
+
+def build_epub(path, chapters, images=(), toc=None, metadata=None, opf_dir='OEBPS', use_nav=False):
+    """
+    构建一个最小的EPUB文件
+    
+    Args:
+        path: 输出路径
+        chapters: [(id, href, html)] 列表，按spine顺序
+        images: [(id, href, media_type, data)] 列表
+        toc: [(title, href, children)] 目录树，默认每个章节一项
+        metadata: 元数据字典
+        opf_dir: OPF所在目录
+        use_nav: 使用EPUB3导航文档代替NCX
+    """
+    metadata = metadata or {'title': 'Test Book', 'creator': 'Test Author', 'language': 'zh-CN'}
+    if toc is None:
+        toc = [('Chapter %d' % (i + 1), href, []) for i, (_, href, _) in enumerate(chapters)]
+    prefix = opf_dir + '/' if opf_dir else ''
+    
+    manifest = []
+    for item_id, href, _ in chapters:
+        manifest.append('<item id="%s" href="%s" media-type="application/xhtml+xml"/>' % (item_id, href))
+    for item_id, href, media_type, _ in images:
+        manifest.append('<item id="%s" href="%s" media-type="%s"/>' % (item_id, href, media_type))
+    if use_nav:
+        manifest.append('<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>')
+    else:
+        manifest.append('<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>')
+    
+    spine = ''.join('<itemref idref="%s"/>' % item_id for item_id, _, _ in chapters)
+    dc = ''.join('<dc:%s>%s</dc:%s>' % (key, escape(value), key) for key, value in metadata.items())
+    
+    opf = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+        '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">%s</metadata>'
+        '<manifest>%s</manifest>'
+        '<spine%s>%s</spine>'
+        '</package>'
+    ) % (dc, ''.join(manifest), '' if use_nav else ' toc="ncx"', spine)
+    
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        zf.writestr('META-INF/container.xml', (
+            '<?xml version="1.0"?>'
+            '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="%scontent.opf" media-type="application/oebps-package+xml"/>'
+            '</rootfiles></container>'
+        ) % prefix)
+        zf.writestr(prefix + 'content.opf', opf)
+        if use_nav:
+            zf.writestr(prefix + 'nav.xhtml', _build_nav(toc))
+        else:
+            zf.writestr(prefix + 'toc.ncx', _build_ncx(toc))
+        for _, href, html in chapters:
+            zf.writestr(prefix + href, html, compress_type=zipfile.ZIP_DEFLATED)
+        for _, href, _, data in images:
+            zf.writestr(prefix + href, data)
+
+
+def _build_ncx(toc):
+    counter = [0]
+    
+    def nav_points(entries):
+        parts = []
+        for title, href, children in entries:
+            counter[0] += 1
+            parts.append(
+                '<navPoint id="np%d"><navLabel><text>%s</text></navLabel><content src="%s"/>%s</navPoint>'
+                % (counter[0], escape(title), href, nav_points(children))
+            )
+        return ''.join(parts)
+    
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1"><navMap>%s</navMap></ncx>'
+    ) % nav_points(toc)
+
+
+def _build_nav(toc):
+    def items(entries):
+        parts = []
+        for title, href, children in entries:
+            sub = '<ol>%s</ol>' % items(children) if children else ''
+            parts.append('<li><a href="%s">%s</a>%s</li>' % (href, escape(title), sub))
+        return ''.join(parts)
+    
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops"><body>'
+        '<nav epub:type="toc"><ol>%s</ol></nav></body></html>'
+    ) % items(toc)
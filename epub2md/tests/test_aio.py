@@ -0,0 +1,90 @@
+"""
+异步接口测试
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import epub2md
+from tests.epub_builder import build_epub, chapter_html
+
+
+class TestAsyncAPI(unittest.TestCase):
+    """测试异步接口"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.epub_path = os.path.join(self.temp_dir, 'book.epub')
+        chapters = [('c%d' % i, 'Text/c%d.xhtml' % i, chapter_html('C%d' % i, '<h1>第%d章</h1><p>正文</p>' % i))
+                    for i in range(1, 4)]
+        build_epub(self.epub_path, chapters)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+    
+    def tearDown(self):
+        """测试后清理"""
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        shutil.rmtree(self.temp_dir)
+    
+    def test_convert_async(self):
+        """测试异步转换与同步转换输出一致"""
+        output = os.path.join(self.temp_dir, 'async')
+        result = self.loop.run_until_complete(epub2md.convert_async(self.epub_path, output, image_mode='copy'))
+        expected = epub2md.convert_book(self.epub_path, os.path.join(self.temp_dir, 'sync'), image_mode='copy')
+        
+        self.assertEqual(result, output)
+        self.assertEqual(sorted(os.listdir(result)), sorted(os.listdir(expected)))
+    
+    def test_limit(self):
+        """测试同时在途的书籍数不超过限制"""
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+        
+        def fake_convert(input_file, output, **options):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.05)
+            with lock:
+                state['running'] -= 1
+            return output
+        
+        with patch('epub2md.aio.convert_book', side_effect=fake_convert):
+            results = self.loop.run_until_complete(epub2md.convert_many_async(
+                [self.epub_path] * 6, os.path.join(self.temp_dir, 'out'), limit=2))
+        
+        self.assertEqual(state['peak'], 2)
+        self.assertEqual(len(set(results)), 6)
+    
+    def test_iter_chapters_async(self):
+        """测试异步迭代章节与同步结果一致"""
+        async def collect():
+            return [chapter async for chapter in epub2md.iter_chapters_async(self.epub_path)]
+        
+        self.assertEqual(self.loop.run_until_complete(collect()), list(epub2md.iter_chapters(self.epub_path)))
+    
+    def test_iter_chapters_async_cache(self):
+        """测试使用缓存时生成器始终在同一个线程中推进和关闭"""
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+        
+        async def collect():
+            chapters = []
+            async for chapter in epub2md.iter_chapters_async(self.epub_path, cache_dir=cache_dir):
+                chapters.append(chapter)
+                # 其他任务占用默认执行器时，下一个章节也不能换到别的线程
+                await self.loop.run_in_executor(None, time.sleep, 0.01)
+            return chapters
+        
+        expected = list(epub2md.iter_chapters(self.epub_path))
+        self.assertEqual(self.loop.run_until_complete(collect()), expected)
+        self.assertEqual(self.loop.run_until_complete(collect()), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+归档输出测试
+"""
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+from click.testing import CliRunner
+from epub2md.archive import _ArchiveSink, archive_format_for, open_archive
+from epub2md.epub_parser import EPUBArchive
+from epub2md.main import main
+from epub2md.pipeline import convert_book
+from tests.epub_builder import build_epub, chapter_html
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_tree(root):
+    """读取目录中的所有文件，返回相对路径到内容的映射"""
+    files = {}
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, root).replace(os.sep, '/')] = f.read()
+    return files
+
+
+class TestArchive(unittest.TestCase):
+    """测试直接写入zip/tar归档"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.epub_path = os.path.join(self.temp_dir, 'book.epub')
+        chapters = [('c%d' % i, 'Text/c%d.xhtml' % i, chapter_html(
+            'C%d' % i, '<h1>第%d章</h1><p>正文<img src="../Images/a.png"/></p>' % i)) for i in range(1, 4)]
+        build_epub(self.epub_path, chapters, [('img-a', 'Images/a.png', 'image/png', b'png')])
+        
+        self.expected = read_tree(convert_book(self.epub_path, os.path.join(self.temp_dir, 'out'),
+                                               image_mode='copy'))
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_archive_format_for(self):
+        """测试根据文件名确定归档格式"""
+        self.assertEqual(archive_format_for('out.zip'), 'zip')
+        self.assertEqual(archive_format_for('out.TAR.GZ'), 'tar.gz')
+        self.assertEqual(archive_format_for('out.tar.zst'), 'tar.zst')
+        self.assertEqual(archive_format_for('-'), 'tar')
+        with self.assertRaises(ValueError):
+            archive_format_for('out.rar')
+    
+    def test_same_layout(self):
+        """测试zip和tar归档与输出目录的布局和内容相同，且不创建输出目录"""
+        for name in ('out.zip', 'out.tar', 'out.tar.gz', 'out.tar.xz'):
+            with self.subTest(archive=name):
+                archive = os.path.join(self.temp_dir, name)
+                output = os.path.join(self.temp_dir, 'unused')
+                result = convert_book(self.epub_path, output, jobs=2, image_mode='copy', archive=archive)
+                
+                self.assertEqual(result, archive)
+                self.assertFalse(os.path.exists(output))
+                if name.endswith('.zip'):
+                    with zipfile.ZipFile(archive) as zip_file:
+                        files = {info.filename: zip_file.read(info) for info in zip_file.infolist()}
+                        self.assertEqual(zip_file.getinfo('images/a.png').compress_type, zipfile.ZIP_STORED)
+                else:
+                    with tarfile.open(archive) as tar_file:
+                        files = {member.name: tar_file.extractfile(member).read() for member in tar_file}
+                self.assertEqual(files, self.expected)
+    
+    def test_single_file(self):
+        """测试单文件模式以输出文件名作为成员名"""
+        buffer = io.BytesIO()
+        convert_book(self.epub_path, 'book.md', single_file=True, image_mode='copy', archive=buffer,
+                     archive_format='zip')
+        
+        with zipfile.ZipFile(io.BytesIO(buffer.getvalue())) as zip_file:
+            self.assertEqual(sorted(zip_file.namelist()), ['book.md', 'images/a.png'])
+            self.assertIn('# Chapter 1', zip_file.read('book.md').decode('utf-8'))
+    
+    def test_images_streamed(self):
+        """测试原样输出的图片从EPUB按块复制到归档，不整个读入内存"""
+        for name in ('out.zip', 'out.tar'):
+            with self.subTest(archive=name):
+                archive = os.path.join(self.temp_dir, name)
+                with patch.object(EPUBArchive, 'read', autospec=True, side_effect=EPUBArchive.read) as read:
+                    convert_book(self.epub_path, 'unused', image_mode='copy', archive=archive)
+                    read_hrefs = {call.args[1] for call in read.call_args_list}
+                self.assertNotIn('Images/a.png', read_hrefs)
+                if name.endswith('.zip'):
+                    with zipfile.ZipFile(archive) as zip_file:
+                        self.assertEqual(zip_file.read('images/a.png'), b'png')
+                else:
+                    with tarfile.open(archive) as tar_file:
+                        self.assertEqual(tar_file.extractfile('images/a.png').read(), b'png')
+    
+    def test_sink_requires_finish(self):
+        """测试没有实现 _finish 的归档输出在创建时就报错"""
+        class IncompleteSink(_ArchiveSink):
+            pass
+        
+        with self.assertRaises(TypeError):
+            IncompleteSink('-', io.BytesIO())
+    
+    def test_abort_removes_archive(self):
+        """测试失败时删除不完整的归档"""
+        archive = os.path.join(self.temp_dir, 'broken.zip')
+        sink = open_archive(archive)
+        sink.write('README.md', b'partial')
+        sink.abort()
+        self.assertFalse(os.path.exists(archive))
+    
+    def test_cli_stdout(self):
+        """测试通过管道写到标准输出，详细信息不混入归档"""
+        process = subprocess.run([sys.executable, '-m', 'epub2md.main', self.epub_path, '--archive', '-',
+                                  '--images', 'copy', '--no-cache', '-v'],
+                                 env=dict(os.environ, PYTHONPATH=PACKAGE_ROOT), cwd=self.temp_dir,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertIn('转换完成', process.stderr.decode('utf-8'))
+        with tarfile.open(fileobj=io.BytesIO(process.stdout)) as tar_file:
+            files = {member.name: tar_file.extractfile(member).read() for member in tar_file}
+        self.assertEqual(files, self.expected)
+    
+    def test_cli_rejects_image_store(self):
+        """测试 --archive 不能与 --image-store 一起使用"""
+        result = CliRunner().invoke(main, [self.epub_path, '--archive', os.path.join(self.temp_dir, 'out.zip'),
+                                           '--image-store', os.path.join(self.temp_dir, 'store')])
+        self.assertNotEqual(result.exit_code, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
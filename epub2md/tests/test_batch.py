@@ -0,0 +1,101 @@
+"""
+批量转换测试
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from click.testing import CliRunner
+from epub2md.batch import _convert_one, collect_inputs, plan_outputs, convert_many
+from epub2md.main import main
+from tests.epub_builder import build_epub, chapter_html
+
+
+def _crash_on_b(task):
+    """转换 b.epub 时工作进程异常退出，模拟工作进程被杀掉"""
+    if os.path.basename(task[1]) == 'b.epub':
+        os._exit(1)
+    return _convert_one(task)
+
+
+class TestBatchConversion(unittest.TestCase):
+    """测试批量转换"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.books = os.path.join(self.temp_dir, 'books')
+        os.makedirs(os.path.join(self.books, 'sub'))
+        for name in ('a.epub', 'sub/b.epub', 'sub/a.epub'):
+            build_epub(os.path.join(self.books, name), [
+                ('c1', 'c1.xhtml', chapter_html('C1', '<h1>%s</h1><p>正文</p>' % name)),
+            ])
+        with open(os.path.join(self.books, 'broken.epub'), 'wb') as f:
+            f.write(b'not a zip file')
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_collect_inputs(self):
+        """测试展开目录和通配符"""
+        files = collect_inputs([self.books, os.path.join(self.books, '*.epub')])
+        
+        self.assertEqual([os.path.relpath(path, self.books) for path in files],
+                         ['a.epub', 'broken.epub', os.path.join('sub', 'a.epub'), os.path.join('sub', 'b.epub')])
+    
+    def test_plan_outputs(self):
+        """测试重名的书输出到不同位置"""
+        outputs = plan_outputs(['x/a.epub', 'y/a.epub', 'b.epub'], 'out', single_file=True)
+        
+        self.assertEqual(outputs, [os.path.join('out', 'a.md'), os.path.join('out', 'a_2.md'),
+                                   os.path.join('out', 'b.md')])
+    
+    def test_failure_is_isolated(self):
+        """测试损坏的书不影响其他书的转换"""
+        output_dir = os.path.join(self.temp_dir, 'out')
+        progress = []
+        results = convert_many(collect_inputs([self.books]), output_dir, jobs=2,
+                               progress=lambda result, done, total: progress.append((done, total)))
+        
+        self.assertEqual([result['ok'] for result in results], [True, False, True, True])
+        self.assertIn('ValueError', results[1]['error'])
+        self.assertEqual(progress, [(1, 4), (2, 4), (3, 4), (4, 4)])
+        self.assertEqual(sorted(os.listdir(output_dir)), ['a', 'a_2', 'b'])
+    
+    def test_worker_crash_is_isolated(self):
+        """测试工作进程异常退出时只有导致退出的书失败，其他书在新的进程池中转换"""
+        inputs = collect_inputs([self.books])
+        inputs.remove(os.path.join(self.books, 'broken.epub'))
+        inputs += [os.path.join(self.books, 'a.epub')] * 3
+        output_dir = os.path.join(self.temp_dir, 'out')
+        with patch('epub2md.batch._convert_one', _crash_on_b):
+            results = convert_many(inputs, output_dir, jobs=2)
+        
+        failed = [os.path.basename(result['input']) for result in results if not result['ok']]
+        self.assertEqual(failed, ['b.epub'])
+        self.assertIn('BrokenProcessPool', [result for result in results if not result['ok']][0]['error'])
+        # 被一同终止的转换可能留下隐藏的临时目录
+        outputs = [name for name in os.listdir(output_dir) if not name.startswith('.')]
+        self.assertEqual(sorted(outputs), ['a', 'a_2', 'a_3', 'a_4', 'a_5'])
+    
+    def test_cli(self):
+        """测试默认命令和批量命令"""
+        runner = CliRunner()
+        book = os.path.join(self.books, 'a.epub')
+        output = os.path.join(self.temp_dir, 'single')
+        
+        result = runner.invoke(main, [book, '-o', output, '--no-cache'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertTrue(os.path.exists(os.path.join(output, 'README.md')))
+        
+        result = runner.invoke(main, ['convert-many', os.path.join(self.books, 'sub'), '-j', '1',
+                                      '-o', os.path.join(self.temp_dir, 'many'),
+                                      '--cache-dir', os.path.join(self.temp_dir, 'cache')])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('成功 2', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
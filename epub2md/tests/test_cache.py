@@ -0,0 +1,75 @@
+"""
+章节缓存测试
+"""
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from epub2md.cache import ChapterCache
+from epub2md.converter import HTMLToMarkdownConverter
+from tests.test_converter import make_book_data
+
+
+class TestChapterCache(unittest.TestCase):
+    """测试章节缓存"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_key(self):
+        """测试缓存键由HTML和转换引擎决定"""
+        key = ChapterCache.key('<p>a</p>', 'html2text')
+        
+        self.assertEqual(key, ChapterCache.key('<p>a</p>', 'html2text'))
+        self.assertNotEqual(key, ChapterCache.key('<p>b</p>', 'html2text'))
+        self.assertNotEqual(key, ChapterCache.key('<p>a</p>', 'fast'))
+    
+    def test_hit_skips_conversion(self):
+        """测试命中缓存时不再转换章节"""
+        expected = HTMLToMarkdownConverter(make_book_data()).convert()['content']
+        
+        with ChapterCache(self.temp_dir) as cache:
+            first = HTMLToMarkdownConverter(make_book_data(), cache=cache).convert()['content']
+        
+        with ChapterCache(self.temp_dir) as cache:
+            with patch.object(HTMLToMarkdownConverter, '_render_chapter') as render:
+                second = HTMLToMarkdownConverter(make_book_data(), cache=cache).convert()['content']
+                render.assert_not_called()
+            self.assertEqual(cache.hits, len(expected))
+        
+        self.assertEqual(first, expected)
+        self.assertEqual(second, expected)
+    
+    def test_parallel_with_partial_hits(self):
+        """测试并行转换时命中与未命中的章节顺序不变"""
+        expected = HTMLToMarkdownConverter(make_book_data(8)).convert()['content']
+        
+        with ChapterCache(self.temp_dir) as cache:
+            HTMLToMarkdownConverter(make_book_data(3), cache=cache).convert()
+        
+        with ChapterCache(self.temp_dir) as cache:
+            result = HTMLToMarkdownConverter(make_book_data(8), jobs=2, cache=cache).convert()['content']
+            self.assertEqual((cache.hits, cache.misses), (3, 5))
+        
+        self.assertEqual(list(result.items()), list(expected.items()))
+    
+    def test_lru_eviction(self):
+        """测试超出大小上限时淘汰最久未使用的条目"""
+        with ChapterCache(self.temp_dir, max_size=250) as cache:
+            for name in 'abc':
+                cache.put(name, name * 100)
+            cache.get('a')
+        
+        with ChapterCache(self.temp_dir) as cache:
+            self.assertEqual(cache.get('a'), 'a' * 100)
+            self.assertIsNone(cache.get('b'))
+            self.assertEqual(cache.get('c'), 'c' * 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+HTML到Markdown转换器测试
+"""
+import random
+import re
+import unittest
+from epub2md.converter import HTMLToMarkdownConverter
+from epub2md.resource import ImageResolver
+from tests.epub_builder import chapter_html
+
+
+def make_book_data(count=6):
+    """构造转换器输入"""
+    content = {}
+    for i in range(count):
+        content['item%d' % i] = chapter_html(
+            'Chapter %d' % i,
+            '<h1>Chapter %d</h1><p>第一段 <b>粗体</b> <i>斜体</i></p>'
+            '<ul><li>one</li><li>two</li></ul><p><img src="../Images/p%d.png"/></p>' % (i, i)
+        )
+    return {
+        'metadata': {'title': 'Test Book'},
+        'toc': [],
+        'spine': list(content),
+        'content': content,
+        'images': {}
+    }
+
+
+def postprocess_regex(markdown):
+    """后处理的参考实现: 依次执行四次正则替换"""
+    markdown = re.sub(r'^(#+)(.*?)$', r'\1 \2', markdown, flags=re.MULTILINE)
+    markdown = re.sub(r'^(\s*[-*+])\s{2,}', r'\1 ', markdown, flags=re.MULTILINE)
+    markdown = re.sub(r'([^\n])\n([^\n])', r'\1\n\n\2', markdown)
+    markdown = re.sub(r'\n{3,}', '\n\n', markdown)
+    return markdown
+
+
+class TestHTMLToMarkdownConverter(unittest.TestCase):
+    """测试HTML到Markdown转换器"""
+    
+    def test_convert(self):
+        """测试串行转换"""
+        result = HTMLToMarkdownConverter(make_book_data(1)).convert()
+        
+        markdown = result['content']['item0']
+        self.assertIn('Chapter 0', markdown)
+        self.assertIn('**粗体**', markdown)
+        self.assertIn('![p0.png]', markdown)
+    
+    def test_parallel_matches_serial(self):
+        """测试并行转换与串行转换结果一致且顺序不变"""
+        serial = HTMLToMarkdownConverter(make_book_data()).convert()
+        parallel = HTMLToMarkdownConverter(make_book_data(), jobs=3).convert()
+        
+        self.assertEqual(list(parallel['content'].items()), list(serial['content'].items()))
+
+    def test_image_links(self):
+        """测试图片链接相对于章节路径解析"""
+        book_data = make_book_data(0)
+        book_data['content'] = {
+            'c1': chapter_html('c1', '<p><img src="../Images/a.png"/><img src="../Images/sub/a.png#x"/>'
+                                     '<img src="http://x.com/a.png"/><img src="missing.png"/></p>'),
+            'c2': chapter_html('c2', '<p><img src="sub/a%20(1).png" alt="A"/></p>'),
+        }
+        book_data['hrefs'] = {'c1': 'Text/c1.xhtml', 'c2': 'Images/c2.xhtml'}
+        book_data['spine'] = ['c1', 'c2']
+        book_data['images'] = {
+            'img1': {'file_name': 'a.png', 'href': 'Images/a.png', 'media_type': 'image/png'},
+            'img2': {'file_name': 'a.png', 'href': 'Images/sub/a.png', 'media_type': 'image/png'},
+            'img3': {'file_name': 'a (1).png', 'href': 'Images/sub/a (1).png', 'media_type': 'image/png'},
+        }
+        
+        content = HTMLToMarkdownConverter(book_data).convert()['content']
+        
+        self.assertIn('](images/a.png)', content['c1'])
+        self.assertIn('](images/a_img2.png)', content['c1'])
+        self.assertIn('](http://x.com/a.png)', content['c1'])
+        self.assertIn('](missing.png)', content['c1'])
+        self.assertIn('![A](images/a%20\\(1\\).png)', content['c2'])
+    
+    def test_image_resolver_without_chapter_path(self):
+        """测试章节路径未知时按ID和唯一文件名解析"""
+        images = {
+            'cover': {'file_name': 'cover.jpg', 'href': 'cover.jpg'},
+            'img1': {'file_name': 'a.png', 'href': 'Images/a.png'},
+            'img2': {'file_name': 'a.png', 'href': 'Other/a.png'},
+        }
+        resolver = ImageResolver(images)
+        
+        self.assertEqual(resolver.resolve('cover'), 'images/cover.jpg')
+        self.assertEqual(resolver.resolve('Other/a.png'), 'images/a_img2.png')
+        self.assertEqual(resolver.resolve('../x/cover.jpg'), 'images/cover.jpg')
+        self.assertIsNone(resolver.resolve('x/a.png'))
+    
+    def test_postprocess_matches_regex(self):
+        """测试单次扫描的后处理与四次正则替换结果一致"""
+        converter = HTMLToMarkdownConverter(None)
+        samples = [
+            '', '\n', 'a\nb\nc', '# T\n##x\n', '-  a\n  *   b', '- \n\nfoo', '-\n\n+  \n\n* x',
+            '* \n  - y', 'a\n\n\n\nb\n', 'x\n-\n', '\u3000- 中文\n\n\n', '#\n-\t\t',
+        ]
+        rnd = random.Random(0)
+        alphabet = ['\n', '\n', ' ', '\t', '\u3000', '-', '*', '+', '#', 'a', '中']
+        for _ in range(2000):
+            samples.append(''.join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 24))))
+        
+        for markdown in samples:
+            self.assertEqual(converter._postprocess_markdown(markdown, 'item'), postprocess_regex(markdown),
+                             repr(markdown))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,14 @@
 EPUB解析器测试
 """
 import os
+import errno
+import shutil
+import tempfile
 import unittest
-from unittest.mock import patch, Mock
-from epub2md.epub_parser import EPUBParser
-import ebooklib
-from ebooklib import epub
+import zipfile
+from unittest.mock import patch
+from epub2md.epub_parser import EPUBParser, EPUBArchive
+from tests.epub_builder import build_epub, chapter_html
 
 
 class TestEPUBParser(unittest.TestCase):
@@ -14,72 +17,159 @@ class TestEPUBParser(unittest.TestCase):
     
     def setUp(self):
         """测试前准备"""
-        # 创建模拟的EPUB内容
-        self.mock_book = Mock()
-        self.mock_book.get_metadata.side_effect = self._mock_get_metadata
-        self.mock_book.toc = [
-            ('Chapter 1', 'chapter1.xhtml', []),
-            ('Chapter 2', 'chapter2.xhtml', [
-                ('Section 2.1', 'chapter2.xhtml#section1', [])
-            ])
+        self.temp_dir = tempfile.mkdtemp()
+        self.epub_path = os.path.join(self.temp_dir, 'test.epub')
+        self.chapters = [
+            ('item1', 'Text/chapter1.xhtml', chapter_html('Chapter 1', '<h1>Chapter 1</h1><p>Content</p>')),
+            ('item2', 'Text/chapter2.xhtml', chapter_html('Chapter 2', '<h1>Chapter 2</h1><p>Content</p>')),
         ]
-        self.mock_book.spine = [Mock(get_id=lambda: 'item1'), Mock(get_id=lambda: 'item2')]
-        
-        self.mock_items = [
-            Mock(get_type=lambda: ebooklib.ITEM_DOCUMENT, get_id=lambda: 'item1', 
-                get_content=lambda: b'<html><body><h1>Chapter 1</h1><p>Content</p></body></html>'),
-            Mock(get_type=lambda: ebooklib.ITEM_DOCUMENT, get_id=lambda: 'item2', 
-                get_content=lambda: b'<html><body><h1>Chapter 2</h1><p>Content</p></body></html>'),
-            Mock(get_type=lambda: ebooklib.ITEM_IMAGE, get_id=lambda: 'image1', 
-                get_content=lambda: b'image_data', file_name='image.jpg', media_type='image/jpeg')
+        self.images = [
+            ('image1', 'Images/image.jpg', 'image/jpeg', b'image_data'),
         ]
-        self.mock_book.get_items.return_value = self.mock_items
-    
-    def _mock_get_metadata(self, namespace, name):
-        """模拟获取元数据"""
-        metadata = {
-            'title': [('Test Book', {})],
-            'creator': [('Test Author', {})],
-            'language': [('zh-CN', {})],
-            'identifier': [('12345', {})],
-            'publisher': [('Test Publisher', {})],
-            'date': [('2023-01-01', {})]
+        self.toc = [
+            ('Chapter 1', 'Text/chapter1.xhtml', []),
+            ('Chapter 2', 'Text/chapter2.xhtml', [
+                ('Section 2.1', 'Text/chapter2.xhtml#section1', [])
+            ])
+        ]
+        self.metadata = {
+            'title': 'Test Book',
+            'creator': 'Test Author',
+            'language': 'zh-CN',
+            'identifier': '12345',
+            'publisher': 'Test Publisher',
+            'date': '2023-01-01'
         }
-        return metadata.get(name, [])
     
-    @patch('epub2md.epub_parser.epub.read_epub')
-    def test_parse(self, mock_read_epub):
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def _build(self, **kwargs):
+        build_epub(self.epub_path, self.chapters, self.images, self.toc, self.metadata, **kwargs)
+    
+    def test_parse(self):
         """测试解析方法"""
-        # 设置模拟
-        mock_read_epub.return_value = self.mock_book
+        self._build()
+        
+        with EPUBParser(self.epub_path) as parser:
+            result = parser.parse()
+            
+            # 验证元数据
+            self.assertEqual(result.metadata['title'], 'Test Book')
+            self.assertEqual(result.metadata['creator'], 'Test Author')
+            self.assertEqual(result.metadata['language'], 'zh-CN')
+            
+            # 验证目录
+            self.assertEqual(len(result.toc), 2)
+            self.assertEqual(result.toc[0].title, 'Chapter 1')
+            self.assertEqual(result.toc[1].title, 'Chapter 2')
+            self.assertEqual(len(result.toc[1].children), 1)
+            self.assertEqual(result.toc[1].children[0].href, 'Text/chapter2.xhtml#section1')
+            self.assertEqual(result.toc[1].children[0].level, 1)
+            self.assertEqual([entry.title for entry in result.flat_toc], ['Chapter 1', 'Chapter 2', 'Section 2.1'])
+            
+            # 验证spine
+            self.assertEqual(result.spine, ['item1', 'item2'])
+            
+            # 验证内容
+            self.assertIn('item1', result.chapters)
+            self.assertEqual(result.chapters['item2'].index, 1)
+            self.assertIn('<h1>Chapter 2</h1>', result.chapters['item2'].html)
+            self.assertEqual(result.hrefs['item2'], 'Text/chapter2.xhtml')
+            
+            # 验证图片
+            self.assertIn('image1', result.images)
+            self.assertEqual(result.images['image1'].file_name, 'image.jpg')
+            self.assertEqual(result.images['image1'].media_type, 'image/jpeg')
+            self.assertEqual(result.images['image1'].data, b'image_data')
+            
+            # 以前的字典结构
+            legacy = result.to_dict()
+            self.assertEqual(legacy['toc'][1]['children'][0]['level'], 1)
+            self.assertIn('<h1>Chapter 2</h1>', legacy['content']['item2'])
+            self.assertEqual(legacy['images']['image1']['data'], b'image_data')
+    
+    def test_parse_nav_document(self):
+        """测试解析EPUB3导航文档"""
+        self._build(use_nav=True)
         
-        # 创建解析器
-        parser = EPUBParser('test.epub')
-        result = parser.parse()
+        with EPUBParser(self.epub_path) as parser:
+            result = parser.parse()
         
-        # 验证元数据
-        self.assertEqual(result['metadata']['title'], 'Test Book')
-        self.assertEqual(result['metadata']['creator'], 'Test Author')
-        self.assertEqual(result['metadata']['language'], 'zh-CN')
+        self.assertEqual([entry.title for entry in result.toc], ['Chapter 1', 'Chapter 2'])
+        self.assertEqual(result.toc[1].children[0].title, 'Section 2.1')
+        self.assertNotIn('nav', result.spine)
+    
+    def test_parse_is_lazy(self):
+        """测试解析时不读取章节和图片条目"""
+        self._build()
         
-        # 验证目录
-        self.assertEqual(len(result['toc']), 2)
-        self.assertEqual(result['toc'][0]['title'], 'Chapter 1')
-        self.assertEqual(result['toc'][1]['title'], 'Chapter 2')
-        self.assertEqual(len(result['toc'][1]['children']), 1)
+        with patch.object(EPUBArchive, 'read', autospec=True, side_effect=EPUBArchive.read) as mock_read:
+            with EPUBParser(self.epub_path) as parser:
+                result = parser.parse()
+                read_hrefs = [call.args[1] for call in mock_read.call_args_list]
+                self.assertEqual(read_hrefs, ['toc.ncx'])
+                
+                result.chapters['item1'].html
+                self.assertEqual(mock_read.call_args_list[-1].args[1], 'Text/chapter1.xhtml')
+    
+    def test_copy_to(self):
+        """测试条目原样复制到文件：存储的条目按范围复制 (包括不支持内核复制时)，压缩的条目按块解压"""
+        self._build()
+        data = os.urandom(300000)
+        with zipfile.ZipFile(self.epub_path, 'a') as zf:
+            stored = zipfile.ZipInfo('OEBPS/Images/stored.png')
+            stored.extra = b'\x99\x99\x02\x00ab'
+            zf.writestr(stored, data)
+            zf.writestr('OEBPS/Images/deflated.svg', data, compress_type=zipfile.ZIP_DEFLATED)
         
-        # 验证spine
-        self.assertEqual(result['spine'], ['item1', 'item2'])
+        def unsupported(*args):
+            raise OSError(errno.ENOSYS, '不支持')
         
-        # 验证内容
-        self.assertIn('item1', result['content'])
-        self.assertIn('item2', result['content'])
+        no_kernel_copy = patch.multiple(os, copy_file_range=unsupported, sendfile=unsupported, create=True)
+        archive = EPUBArchive(self.epub_path)
+        try:
+            for href in ('Images/stored.png', 'Images/deflated.svg', 'Images/image.jpg'):
+                for fallback in (False, True):
+                    with self.subTest(href=href, fallback=fallback):
+                        path = os.path.join(self.temp_dir, 'copy')
+                        if fallback:
+                            with no_kernel_copy:
+                                archive.copy_to(href, path)
+                        else:
+                            archive.copy_to(href, path)
+                        with open(path, 'rb') as f:
+                            self.assertEqual(f.read(), archive.read(href))
+        finally:
+            archive.close()
+    
+    def test_parse_invalid_file(self):
+        """测试无效文件"""
+        with open(self.epub_path, 'wb') as f:
+            f.write(b'not a zip file')
         
-        # 验证图片
-        self.assertIn('image1', result['images'])
-        self.assertEqual(result['images']['image1']['file_name'], 'image.jpg')
-        self.assertEqual(result['images']['image1']['media_type'], 'image/jpeg')
+        with self.assertRaises(ValueError):
+            EPUBParser(self.epub_path).parse()
 
+    
+    def test_missing_container_closes_file(self):
+        """测试缺少 container.xml 时关闭已打开的zip文件"""
+        with zipfile.ZipFile(self.epub_path, 'w') as zip_file:
+            zip_file.writestr('mimetype', 'application/epub+zip')
+        
+        opened = []
+        original = zipfile.ZipFile.__init__
+        
+        def init(zip_file, *args, **kwargs):
+            opened.append(zip_file)
+            original(zip_file, *args, **kwargs)
+        
+        with patch.object(zipfile.ZipFile, '__init__', autospec=True, side_effect=init):
+            with self.assertRaises(KeyError):
+                EPUBArchive(self.epub_path)
+        self.assertEqual(len(opened), 1)
+        self.assertIsNone(opened[0].fp)
 
 if __name__ == '__main__':
-    unittest.main() 
\ No newline at end of file
+    unittest.main()
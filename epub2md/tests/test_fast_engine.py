@@ -0,0 +1,59 @@
+"""
+快速转换引擎测试
+"""
+import unittest
+import warnings
+from epub2md.converter import HTMLToMarkdownConverter
+from tests.epub_builder import chapter_html
+
+# 与默认引擎对比的样例章节
+GOLDEN_CHAPTERS = [
+    chapter_html('Entities', '<h1 class="c">Title</h1><p>a &amp; b &lt;c&gt; &nbsp;x&#160;y &#150; &copy; &foo; 1. no</p>'),
+    chapter_html('Headings', '<h2><a href="x.html#y">Linked</a></h2><h3><b>Bold</b></h3>'
+                 '<h1><span>a</span><span>b</span></h1><h4>text<!-- c --></h4><h5><br/></h5><h6>  </h6>'),
+    chapter_html('Lists', '<p>para <b>bold</b><i>it</i> text<em>em</em>x</p><p>* star - dash + plus</p>'
+                 '<ul><li>one</li><li>two<ul><li>nested</li></ul></li></ul><ol start="3"><li>x</li><li>y</li></ol>'),
+    chapter_html('Images', '<p><img src="../Images/a.png"/> <img src="b.jpg" alt=""/> <img src="c.gif" alt="C"/></p>'
+                 '<blockquote><p>quote</p><p>q2<br/>line</p></blockquote><hr/>'
+                 '<pre>  code &lt;x&gt;\n   more</pre><p><code>inline</code></p>'),
+    chapter_html('Malformed', '<div><p>unclosed <b>bold<p>next</div> trailing </b> text'
+                 '<table><tr><th>h</th><th>h2</th></tr><tr><td>1</td><td>2</td></tr></table>'),
+    chapter_html('中文', '<p>中文段落，<strong>加粗</strong>和<em>强调</em>。</p><p>a\n\n   b\tc</p>'
+                 '<h1>第一章　标题</h1><p><a href="http://x.com">http://x.com</a> <a href="#n1"><sup>1</sup></a></p>'),
+    chapter_html('Anchors', '<h1><a id="a1"></a>Anchor title</h1><h2 id="x"><a href="#t">Back</a></h2>'
+                 '<p>x<br>y</br>z</p><dl><dt>term</dt><dd>def</dd></dl><p>&#x41;&#65;&#x1F600; &amp;amp;</p>'),
+    chapter_html('Nested', '<h3><h2>nested x</h1>* c</h3><h2><i><!-- c --></i></h2><p>-</p><p>*</p><p>x</p><p>y</p>'),
+]
+
+
+class TestFastMarkdownEngine(unittest.TestCase):
+    """测试快速转换引擎"""
+    
+    def test_matches_html2text_engine(self):
+        """测试快速引擎与默认引擎输出一致"""
+        default = HTMLToMarkdownConverter(None)
+        fast = HTMLToMarkdownConverter(None, engine='fast')
+        
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for html_content in GOLDEN_CHAPTERS:
+                with self.subTest(html=html_content):
+                    self.assertEqual(fast._convert_chapter(html_content, 'item'),
+                                     default._convert_chapter(html_content, 'item'))
+    
+    def test_engine_is_reusable(self):
+        """测试同一引擎实例连续转换多个章节"""
+        fast = HTMLToMarkdownConverter(None, engine='fast')
+        
+        first = fast._convert_chapter(GOLDEN_CHAPTERS[1], 'item')
+        fast._convert_chapter(GOLDEN_CHAPTERS[4], 'item')
+        self.assertEqual(fast._convert_chapter(GOLDEN_CHAPTERS[1], 'item'), first)
+    
+    def test_unknown_engine(self):
+        """测试未知引擎"""
+        with self.assertRaises(ValueError):
+            HTMLToMarkdownConverter(None, engine='unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
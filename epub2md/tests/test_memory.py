@@ -0,0 +1,123 @@
+"""
+内存预算测试
+"""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image
+from epub2md.epub_parser import EPUBParser
+from epub2md.memory import MemoryBudgetError, estimate_footprint, parse_size, plan_images, plan_memory
+from epub2md.pipeline import convert_book
+from tests.epub_builder import build_epub, chapter_html
+
+
+def png_data(width, height):
+    """生成PNG图片数据"""
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), 'white').save(output, 'PNG')
+    return output.getvalue()
+
+
+class TestMemoryBudget(unittest.TestCase):
+    """测试内存估算和预算"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.epub_path = os.path.join(self.temp_dir, 'book.epub')
+        chapters = [('c%d' % i, 'c%d.xhtml' % i, chapter_html('C%d' % i, '<p>%s</p>' % ('正文' * 5000 * i)))
+                    for i in range(1, 5)]
+        images = [('big', 'big.png', 'image/png', png_data(2000, 1500)),
+                  ('big2', 'big2.png', 'image/png', png_data(2000, 1500)),
+                  ('small', 'small.png', 'image/png', png_data(10, 10))]
+        build_epub(self.epub_path, chapters, images)
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_parse_size(self):
+        """测试解析内存大小"""
+        self.assertEqual(parse_size('512M'), 512 * 1024 ** 2)
+        self.assertEqual(parse_size('1.5GiB'), 3 * 1024 ** 3 // 2)
+        self.assertEqual(parse_size('2048'), 2048)
+        with self.assertRaises(ValueError):
+            parse_size('12x')
+    
+    def test_estimate(self):
+        """测试估算使用清单中的大小和图片尺寸，不解压章节"""
+        with EPUBParser(self.epub_path) as parser:
+            book = parser.parse()
+            serial = estimate_footprint(book, image_mode='optimize')
+            parallel = estimate_footprint(book, jobs=4, image_jobs=4, image_mode='optimize')
+            copy = estimate_footprint(book, image_mode='copy')
+        
+        # 最大的章节约30KB，解码后的大图约12MB
+        self.assertGreater(serial['chapters'], 12 * 30000)
+        self.assertGreater(serial['images'], 2000 * 1500 * 4)
+        self.assertLess(copy['images'], 1024 * 1024)
+        self.assertGreater(parallel['total'], serial['total'])
+    
+    def test_plan_falls_back(self):
+        """测试超出预算时依次降低并行度和改为复制图片，仍然超出时报错"""
+        with EPUBParser(self.epub_path) as parser:
+            book = parser.parse()
+            serial = estimate_footprint(book, image_mode='optimize')
+            copy = estimate_footprint(book, image_mode='copy')
+            
+            plan = plan_memory(book, serial['total'] + 1024 * 1024, jobs=4, image_jobs=4)
+            self.assertEqual(plan, {'jobs': 1, 'image_jobs': 1, 'image_mode': 'optimize'})
+            
+            plan = plan_memory(book, copy['total'] + 1024 * 1024, jobs=4, image_jobs=4)
+            self.assertEqual(plan['image_mode'], 'copy')
+            
+            with self.assertRaises(MemoryBudgetError):
+                plan_memory(book, 1024 * 1024)
+    
+    def test_plan_uses_starting_rss(self):
+        """测试所有策略都与转换开始前的常驻内存比较"""
+        rss = iter(range(100 * 1024 * 1024, 200 * 1024 * 1024, 10 * 1024 * 1024))
+        with EPUBParser(self.epub_path) as parser:
+            book = parser.parse()
+            copy = estimate_footprint(book, image_mode='copy', base=100 * 1024 * 1024)
+            with patch('epub2md.memory.current_rss', side_effect=lambda: next(rss)):
+                plan = plan_memory(book, copy['total'], jobs=4, image_jobs=4)
+        self.assertEqual(plan['image_mode'], 'copy')
+    
+    def test_only_output_images(self):
+        """测试只估算实际输出的图片，没有被引用的图片不读取头部"""
+        with EPUBParser(self.epub_path) as parser:
+            book = parser.parse()
+            small = estimate_footprint(book, image_mode='optimize', images={'small'})
+            self.assertLess(small['images'], 1024 * 1024)
+        
+        # 章节中没有引用图片，转换时不会估算任何图片
+        with patch('epub2md.memory._decoded_size', side_effect=AssertionError('读取了图片头部')):
+            convert_book(self.epub_path, os.path.join(self.temp_dir, 'out'), max_memory=parse_size('64G'))
+    
+    def test_plan_images(self):
+        """测试处理图片前按输出的图片选择处理方式"""
+        base = 100 * 1024 * 1024
+        with EPUBParser(self.epub_path) as parser:
+            book = parser.parse()
+            with patch('epub2md.memory.current_rss', return_value=base):
+                plan = plan_images(book, base + 1024 * 1024, {'big'}, image_jobs=4)
+                self.assertEqual(plan, {'image_jobs': 1, 'image_mode': 'copy'})
+                plan = plan_images(book, base + 1024 * 1024, {'small'}, image_jobs=4)
+                self.assertEqual(plan, {'image_jobs': 4, 'image_mode': 'optimize'})
+                with self.assertRaises(MemoryBudgetError):
+                    plan_images(book, base, {'big'})
+    
+    def test_convert_book(self):
+        """测试转换在写出任何文件之前因超出预算而失败"""
+        output = os.path.join(self.temp_dir, 'out')
+        with self.assertRaises(MemoryBudgetError):
+            convert_book(self.epub_path, output, max_memory=1024 * 1024)
+        self.assertFalse(os.path.exists(output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+数据模型测试
+"""
+import unittest
+from epub2md.model import Book, Chapter, ImageAsset, TocEntry
+
+
+def make_book_dict():
+    """创建字典结构的书籍数据"""
+    return {
+        'metadata': {'title': '测试'},
+        'toc': [
+            {'title': '第一章', 'href': 'Text/c1.xhtml', 'level': 0, 'children': [
+                {'title': '第一节', 'href': 'Text/c1.xhtml#s1', 'level': 1, 'children': []},
+            ]},
+            {'title': '第二章', 'href': 'Text/c2.xhtml', 'level': 0, 'children': []},
+        ],
+        'spine': ['c1', 'c2'],
+        'content': {'c1': '<h1>第一章</h1>', 'c2': '<h1>第二章</h1>'},
+        'hrefs': {'c1': 'Text/c1.xhtml', 'c2': 'Text/c2.xhtml'},
+        'images': {'img': {'data': b'png', 'file_name': 'a.png', 'media_type': 'image/png', 'href': 'Images/a.png'}},
+    }
+
+
+class TestModel(unittest.TestCase):
+    """测试书籍模型与字典结构之间的转换"""
+    
+    def test_from_dict(self):
+        """测试从字典创建书籍"""
+        book = Book.from_dict(make_book_dict())
+        
+        self.assertEqual([entry.title for entry in book.flat_toc], ['第一章', '第一节', '第二章'])
+        self.assertEqual([entry.level for entry in book.flat_toc], [0, 1, 0])
+        self.assertEqual(book.chapters['c2'].index, 1)
+        self.assertEqual(book.chapters['c2'].html, '<h1>第二章</h1>')
+        self.assertEqual(book.content['c1'], '<h1>第一章</h1>')
+        self.assertEqual(book.hrefs, {'c1': 'Text/c1.xhtml', 'c2': 'Text/c2.xhtml'})
+        self.assertEqual(book.images['img'].data, b'png')
+        self.assertEqual(book.images['img']['file_name'], 'a.png')
+        self.assertIs(Book.coerce(book), book)
+    
+    def test_to_dict_round_trip(self):
+        """测试转换回字典结构"""
+        data = make_book_dict()
+        legacy = Book.from_dict(data).to_dict()
+        
+        self.assertEqual(legacy['toc'], data['toc'])
+        self.assertEqual(dict(legacy['content']), data['content'])
+        self.assertEqual(legacy['images']['img'].to_dict(), data['images']['img'])
+        self.assertEqual(legacy['spine'], data['spine'])
+    
+    def test_slots(self):
+        """测试模型对象没有实例字典"""
+        objects = [TocEntry('标题', 'a.xhtml'), ImageAsset('img', 'a.png', 'image/png', data=b''),
+                   Chapter(0, 'c1'), Book()]
+        for obj in objects:
+            with self.subTest(type=type(obj).__name__):
+                self.assertFalse(hasattr(obj, '__dict__'))
+    
+    def test_chapter_equality(self):
+        """测试章节按转换结果比较，不比较来源"""
+        self.assertEqual(Chapter(0, 'c1', '标题', '# 标题', ()), Chapter(0, 'c1', '标题', '# 标题', (), href='c1.xhtml'))
+        self.assertNotEqual(Chapter(0, 'c1', '标题', '# 标题', ()), Chapter(1, 'c1', '标题', '# 标题', ()))
+
+
+if __name__ == '__main__':
+    unittest.main()
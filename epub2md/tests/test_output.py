@@ -0,0 +1,236 @@
+"""
+Markdown输出生成器测试
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+from epub2md.archive import DirectorySink
+from epub2md.converter import HTMLToMarkdownConverter
+from epub2md.epub_parser import EPUBParser
+from epub2md.output import OutputGenerator
+from tests.epub_builder import build_epub, chapter_html
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_result():
+    """构造转换结果，章节ID互为子串以检查精确匹配"""
+    content = {}
+    hrefs = {}
+    for item_id in ('c1', 'c10', 'c2'):
+        content[item_id] = f'{item_id} 正文'
+        hrefs[item_id] = f'Text/{item_id}.xhtml'
+    return {
+        'metadata': {'title': 'Test Book'},
+        'toc': [
+            {'title': '第十章', 'href': 'Text/c10.xhtml', 'level': 0, 'children': []},
+            {'title': '第一章', 'href': 'Text/c1.xhtml', 'level': 0, 'children': [
+                {'title': '第一节', 'href': 'Text/c1.xhtml#s1', 'level': 1, 'children': []},
+            ]},
+            {'title': '外部', 'href': 'Other/c2.xhtml', 'level': 0, 'children': []},
+        ],
+        'spine': ['c1', 'c2', 'c10'],
+        'content': content,
+        'hrefs': hrefs,
+        'images': {}
+    }
+
+
+class TestOutputGenerator(unittest.TestCase):
+    """测试Markdown输出生成器"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_chapter_info(self):
+        """测试章节标题、文件名和顺序按href精确匹配"""
+        generator = OutputGenerator(make_result(), os.path.join(self.temp_dir, 'book'))
+        generator.generate()
+        
+        self.assertEqual(generator.chapter_titles, {'c1': '第一章', 'c2': '第2章', 'c10': '第十章'})
+        self.assertEqual(generator.chapter_files['c10'], '03-第十章.md')
+        self.assertEqual(generator.chapter_positions, {'c1': 0, 'c2': 1, 'c10': 2})
+        
+        with open(os.path.join(self.temp_dir, 'book', 'README.md'), encoding='utf-8') as f:
+            readme = f.read()
+        self.assertIn('- [第十章](03-第十章.md)', readme)
+        self.assertIn('  - [第一节](01-第一章.md)', readme)
+        self.assertIn('- [外部](Other/c2.xhtml)', readme)
+        
+        with open(os.path.join(self.temp_dir, 'book', '02-第2章.md'), encoding='utf-8') as f:
+            chapter = f.read()
+        self.assertIn('[ [← 第一章](01-第一章.md) ] [ [第十章 →](03-第十章.md) ]', chapter)
+    
+    def test_single_file_toc(self):
+        """测试单文件模式下目录链接到章节锚点"""
+        output_path = os.path.join(self.temp_dir, 'book.md')
+        OutputGenerator(make_result(), output_path, single_file=True).generate()
+        
+        with open(output_path, encoding='utf-8') as f:
+            markdown = f.read()
+        self.assertIn('- [第十章](#第十章)', markdown)
+        self.assertIn('<a id="第十章"></a>', markdown)
+    
+    def test_streaming_matches_staged(self):
+        """测试逐章转换写出的结果与先全部转换再输出的结果一致"""
+        epub_path = os.path.join(self.temp_dir, 'book.epub')
+        build_epub(epub_path, [
+            ('c%d' % i, 'Text/c%d.xhtml' % i, chapter_html('C%d' % i, '<h1>第%d章</h1><p>正文</p>' % i))
+            for i in range(4)
+        ])
+        
+        for single_file in (False, True):
+            staged_path = os.path.join(self.temp_dir, 'staged%d' % single_file)
+            stream_path = os.path.join(self.temp_dir, 'stream%d' % single_file)
+            with EPUBParser(epub_path) as parser:
+                book = parser.parse()
+                result = HTMLToMarkdownConverter(book).convert()
+                OutputGenerator(result, staged_path, single_file=single_file).generate()
+                
+                converter = HTMLToMarkdownConverter(book)
+                OutputGenerator(book, stream_path, single_file=single_file).generate(
+                    convert=converter.iter_chapters)
+                self.assertEqual(converter.markdown_content, {})
+            
+            self.assertEqual(self._read_tree(stream_path), self._read_tree(staged_path))
+    
+    def test_failure_leaves_no_partial_output(self):
+        """测试转换中途失败时不留下写了一半的输出，已有的输出目录保持不变"""
+        def failing_convert(item_ids):
+            yield item_ids[0], '第一章正文'
+            raise RuntimeError('转换失败')
+        
+        output_path = os.path.join(self.temp_dir, 'book')
+        with self.assertRaises(RuntimeError):
+            OutputGenerator(make_result(), output_path).generate(convert=failing_convert)
+        self.assertEqual(os.listdir(self.temp_dir), [])
+        
+        os.makedirs(output_path)
+        with open(os.path.join(output_path, 'README.md'), 'w', encoding='utf-8') as f:
+            f.write('旧的输出')
+        with self.assertRaises(RuntimeError):
+            OutputGenerator(make_result(), output_path).generate(convert=failing_convert)
+        self.assertEqual(self._read_tree(output_path), {'README.md': '旧的输出'})
+        self.assertEqual(os.listdir(output_path), ['README.md'])
+    
+    def test_replace_existing_output(self):
+        """测试输出到已有目录时逐个替换生成的文件，目录中的其他文件保留，暂存目录不在输出目录中"""
+        output_path = os.path.join(self.temp_dir, 'book')
+        os.makedirs(output_path)
+        with open(os.path.join(output_path, '04-旧章节.md'), 'w', encoding='utf-8') as f:
+            f.write('旧的输出')
+        with open(os.path.join(output_path, 'README.md'), 'w', encoding='utf-8') as f:
+            f.write('旧的README')
+        
+        listings = []
+        original = DirectorySink.write
+        
+        def write(sink, name, data, compress=True):
+            listings.append((sink.path, sorted(os.listdir(output_path))))
+            original(sink, name, data, compress)
+        
+        with patch.object(DirectorySink, 'write', autospec=True, side_effect=write):
+            OutputGenerator(make_result(), output_path, fsync='all').generate()
+        
+        # 转换期间输出目录保持原样，暂存目录在它旁边
+        for staging, names in listings:
+            self.assertEqual(os.path.dirname(staging), self.temp_dir)
+            self.assertEqual(names, ['04-旧章节.md', 'README.md'])
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['book'])
+        expected = os.path.join(self.temp_dir, 'expected')
+        OutputGenerator(make_result(), expected).generate()
+        tree = self._read_tree(output_path)
+        self.assertEqual(tree.pop('04-旧章节.md'), '旧的输出')
+        self.assertEqual(tree, self._read_tree(expected))
+    
+    def test_stage_inside_mount_point(self):
+        """测试输出目录是挂载点时暂存目录放在输出目录中，完成后删除"""
+        output_path = os.path.join(self.temp_dir, 'book')
+        os.makedirs(output_path)
+        root_dev = os.stat(output_path).st_dev
+        
+        def fake_stat(path, *args, **kwargs):
+            result = real_stat(path, *args, **kwargs)
+            if os.path.abspath(path) == output_path:
+                return os.stat_result((result.st_mode, result.st_ino, root_dev + 1) + tuple(result)[3:])
+            return result
+        
+        real_stat = os.stat
+        listings = []
+        original = DirectorySink.write
+        
+        def write(sink, name, data, compress=True):
+            listings.append(sink.path)
+            original(sink, name, data, compress)
+        
+        with patch('epub2md.archive.os.stat', side_effect=fake_stat), \
+                patch.object(DirectorySink, 'write', autospec=True, side_effect=write):
+            OutputGenerator(make_result(), output_path).generate()
+        
+        self.assertTrue(all(os.path.dirname(staging) == output_path for staging in listings))
+        self.assertEqual(sorted(os.listdir(output_path)), ['01-第一章.md', '02-第2章.md', '03-第十章.md',
+                                                           'README.md', 'images'])
+    
+    def test_failed_close_removes_staging(self):
+        """测试移动文件失败时删除暂存目录"""
+        output_path = os.path.join(self.temp_dir, 'book')
+        with patch('epub2md.archive.os.replace', side_effect=OSError(16, '设备忙')):
+            with self.assertRaises(OSError):
+                OutputGenerator(make_result(), output_path).generate()
+        self.assertEqual(os.listdir(self.temp_dir), ['book'])
+        self.assertEqual(os.listdir(output_path), [])
+    
+    def test_cli_current_directory(self):
+        """测试 -o . 输出到当前目录，目录中已有的其他文件保留"""
+        output_path = os.path.join(self.temp_dir, 'home')
+        os.makedirs(output_path)
+        build_epub(os.path.join(output_path, 'book.epub'),
+                   [('c1', 'Text/c1.xhtml', chapter_html('C1', '<h1>第一章</h1><p>正文</p>'))])
+        with open(os.path.join(output_path, 'important.txt'), 'w', encoding='utf-8') as f:
+            f.write('重要')
+        
+        process = subprocess.run([sys.executable, '-m', 'epub2md.main', 'book.epub', '-o', '.', '--no-cache'],
+                                 env=dict(os.environ, PYTHONPATH=PACKAGE_ROOT), cwd=output_path,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertEqual(sorted(os.listdir(output_path)), ['01-Chapter_1.md', 'README.md', 'book.epub', 'images',
+                                                           'important.txt'])
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['home'])
+        with open(os.path.join(output_path, 'important.txt'), encoding='utf-8') as f:
+            self.assertEqual(f.read(), '重要')
+    
+    def test_permissions_follow_umask(self):
+        """测试输出的目录和文件按当前umask设置权限"""
+        output_path = os.path.join(self.temp_dir, 'book')
+        OutputGenerator(make_result(), output_path).generate()
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(os.stat(output_path).st_mode & 0o777, 0o777 & ~umask)
+        single = os.path.join(self.temp_dir, 'book.md')
+        OutputGenerator(make_result(), single, single_file=True).generate()
+        self.assertEqual(os.stat(single).st_mode & 0o777, 0o666 & ~umask)
+    
+    def _read_tree(self, path):
+        if os.path.isfile(path):
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        files = {}
+        for name in os.listdir(path):
+            if name.endswith('.md'):
+                with open(os.path.join(path, name), encoding='utf-8') as f:
+                    files[name] = f.read()
+        return files
+
+
+if __name__ == '__main__':
+    unittest.main()
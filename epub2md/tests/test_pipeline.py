@@ -0,0 +1,112 @@
+"""
+转换流程和库接口测试
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import epub2md
+from epub2md.converter import HTMLToMarkdownConverter
+from epub2md.epub_parser import EPUBArchive
+from tests.epub_builder import build_epub, chapter_html
+
+
+class TestIterChapters(unittest.TestCase):
+    """测试 iter_chapters 接口"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.epub_path = os.path.join(self.temp_dir, 'book.epub')
+        chapters = [
+            ('cover', 'Text/cover.xhtml', chapter_html('Cover', '<p><img src="../Images/cover.jpg"/></p>')),
+        ]
+        for i in range(1, 5):
+            chapters.append(('c%d' % i, 'Text/c%d.xhtml' % i, chapter_html(
+                'C%d' % i, '<h1>第%d章</h1><p><img src="../Images/a.png"/> <img src="../Images/a.png"/></p>' % i)))
+        images = [
+            ('img-cover', 'Images/cover.jpg', 'image/jpeg', b'jpg'),
+            ('img-a', 'Images/a.png', 'image/png', b'png'),
+        ]
+        toc = [('第%d章' % i, 'Text/c%d.xhtml' % i, []) for i in range(1, 5)]
+        build_epub(self.epub_path, chapters, images, toc)
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_iter_chapters(self):
+        """测试按spine顺序返回章节"""
+        chapters = list(epub2md.iter_chapters(self.epub_path))
+        
+        self.assertEqual([chapter.id for chapter in chapters], ['cover', 'c1', 'c2', 'c3', 'c4'])
+        self.assertEqual([chapter.index for chapter in chapters], [0, 1, 2, 3, 4])
+        self.assertEqual(chapters[0].title, '第1章')
+        self.assertEqual(chapters[2].title, '第2章')
+        self.assertEqual(chapters[0].images, ('images/cover.jpg',))
+        self.assertEqual(chapters[1].images, ('images/a.png',))
+        self.assertIn('![a.png](images/a.png)', chapters[1].markdown)
+    
+    def test_stop_early(self):
+        """测试提前停止时不转换剩余章节"""
+        with patch.object(HTMLToMarkdownConverter, '_render_chapter',
+                          autospec=True, side_effect=HTMLToMarkdownConverter._render_chapter) as render:
+            for chapter in epub2md.iter_chapters(self.epub_path):
+                if chapter.id == 'c1':
+                    break
+            self.assertEqual(render.call_count, 2)
+    
+    def test_parallel(self):
+        """测试并行转换的结果一致"""
+        self.assertEqual(list(epub2md.iter_chapters(self.epub_path, jobs=2)),
+                         list(epub2md.iter_chapters(self.epub_path)))
+
+
+
+class TestImagePruning(unittest.TestCase):
+    """测试只输出被章节引用的图片"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.epub_path = os.path.join(self.temp_dir, 'book.epub')
+        chapters = [('c%d' % i, 'Text/c%d.xhtml' % i, chapter_html(
+            'C%d' % i, '<p>正文<img src="../Images/used%d.png"/></p>' % i)) for i in range(1, 3)]
+        images = [
+            ('used1', 'Images/used1.png', 'image/png', b'png1'),
+            ('used2', 'Images/used2.png', 'image/png', b'png2'),
+            ('alt-cover', 'Images/alt-cover.jpg', 'image/jpeg', b'jpg'),
+            ('ad', 'Images/ad.png', 'image/png', b'ad'),
+        ]
+        build_epub(self.epub_path, chapters, images)
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_unreferenced_images_not_read(self):
+        """测试未引用的图片既不输出也不从归档中读取"""
+        for jobs in (1, 2):
+            with self.subTest(jobs=jobs):
+                output = os.path.join(self.temp_dir, 'out%d' % jobs)
+                with patch.object(EPUBArchive, 'read', autospec=True, side_effect=EPUBArchive.read) as read, \
+                        patch.object(EPUBArchive, 'copy_to', autospec=True, side_effect=EPUBArchive.copy_to) as copy:
+                    epub2md.convert_book(self.epub_path, output, jobs=jobs, image_mode='copy')
+                
+                self.assertEqual(sorted(os.listdir(os.path.join(output, 'images'))), ['used1.png', 'used2.png'])
+                read_hrefs = [call[0][1] for call in read.call_args_list + copy.call_args_list]
+                self.assertIn('Images/used1.png', read_hrefs)
+                self.assertNotIn('Images/alt-cover.jpg', read_hrefs)
+                self.assertNotIn('Images/ad.png', read_hrefs)
+    
+    def test_keep_unreferenced(self):
+        """测试 keep_unreferenced 保留所有图片"""
+        output = os.path.join(self.temp_dir, 'out')
+        epub2md.convert_book(self.epub_path, output, image_mode='copy', keep_unreferenced=True)
+        self.assertEqual(sorted(os.listdir(os.path.join(output, 'images'))),
+                         ['ad.png', 'alt-cover.jpg', 'used1.png', 'used2.png'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+性能分析测试
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from click.testing import CliRunner
+from epub2md.main import main
+from epub2md.pipeline import convert_book
+from epub2md.profiler import Profiler
+from tests.epub_builder import build_epub, chapter_html
+
+
+class TestProfiler(unittest.TestCase):
+    """测试各阶段和各章节的耗时记录"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.epub_path = os.path.join(self.temp_dir, 'book.epub')
+        chapters = [('c%d' % i, 'Text/c%d.xhtml' % i, chapter_html(
+            'C%d' % i, '<h1>第%d章</h1><p>正文<img src="../Images/a.png"/></p>' % i)) for i in range(1, 4)]
+        build_epub(self.epub_path, chapters, [('img-a', 'Images/a.png', 'image/png', b'png')])
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_stages_and_chapters(self):
+        """测试串行和并行转换都记录全部阶段和每个章节"""
+        for jobs in (1, 2):
+            with self.subTest(jobs=jobs):
+                profiler = Profiler()
+                convert_book(self.epub_path, os.path.join(self.temp_dir, 'out%d' % jobs), jobs=jobs,
+                             image_mode='copy', profiler=profiler)
+                report = profiler.report()
+                
+                self.assertEqual(list(report['stages']), ['parse', 'toc', 'decode', 'preprocess', 'html2text',
+                                                          'postprocess', 'rewrite', 'images', 'write'])
+                self.assertEqual(report['stages']['html2text']['calls'], 3)
+                self.assertEqual([chapter['id'] for chapter in report['chapters']], ['c1', 'c2', 'c3'])
+                chapter = report['chapters'][0]
+                self.assertIn('preprocess', chapter['stages'])
+                self.assertIn('write', chapter['stages'])
+                self.assertGreater(chapter['html_size'], chapter['markdown_size'])
+                self.assertAlmostEqual(chapter['seconds'], sum(chapter['stages'].values()))
+    
+    def test_trace_memory(self):
+        """测试记录每个阶段的内存峰值"""
+        profiler = Profiler(trace_memory=True)
+        try:
+            convert_book(self.epub_path, os.path.join(self.temp_dir, 'out'), profiler=profiler)
+            report = profiler.report()
+        finally:
+            profiler.close()
+        
+        for stage in ('parse', 'html2text', 'images', 'write'):
+            self.assertGreater(report['stages'][stage]['peak_memory'], 0)
+            self.assertGreater(report['stages'][stage]['rss'], 0)
+        self.assertGreater(report['max_rss'], 0)
+    
+    def test_cli(self):
+        """测试 --profile 和 --cprofile"""
+        profile = os.path.join(self.temp_dir, 'profile.json')
+        cprofile = os.path.join(self.temp_dir, 'stats.prof')
+        result = CliRunner().invoke(main, [self.epub_path, '-o', os.path.join(self.temp_dir, 'out'), '--no-cache',
+                                           '--profile', profile, '--cprofile', cprofile])
+        
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(profile, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual(len(report['slowest_chapters']), 3)
+        self.assertTrue(os.path.getsize(cprofile))
+
+
+if __name__ == '__main__':
+    unittest.main()
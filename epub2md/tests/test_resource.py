@@ -0,0 +1,139 @@
+"""
+资源处理器测试
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from PIL import Image
+from epub2md.epub_parser import EPUBArchive
+from epub2md.resource import ResourceProcessor, assign_image_names
+from tests.epub_builder import build_epub, chapter_html
+
+
+def make_png(color):
+    """生成一个小PNG图片"""
+    buffer = BytesIO()
+    Image.new('RGB', (16, 16), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def make_images():
+    """构造图片数据，包含重名图片和无法解码的图片"""
+    images = {}
+    for i in range(6):
+        images['img%d' % i] = {
+            'data': make_png((i * 40, 0, 0)),
+            'file_name': 'a.png' if i < 2 else 'p%d.png' % i,
+            'href': 'Images/%d/a.png' % i,
+            'media_type': 'image/png'
+        }
+    images['broken'] = {'data': b'not an image', 'file_name': 'broken.jpg', 'href': 'broken.jpg',
+                        'media_type': 'image/jpeg'}
+    return images
+
+
+class TestResourceProcessor(unittest.TestCase):
+    """测试资源处理器"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def _process(self, name, **kwargs):
+        images = make_images()
+        processor = ResourceProcessor({'images': images}, os.path.join(self.temp_dir, name), **kwargs)
+        return images, processor.process_resources()
+    
+    def test_assign_image_names(self):
+        """测试重名图片的文件名按清单顺序分配"""
+        names = assign_image_names(make_images())
+        
+        self.assertEqual(names['img0'], 'a.png')
+        self.assertEqual(names['img1'], 'a_img1.png')
+    
+    def test_copy_mode(self):
+        """测试copy模式写入原始数据"""
+        images, processed = self._process('copy', image_mode='copy')
+        
+        self.assertEqual(list(processed), list(images))
+        for img_id, info in processed.items():
+            with open(info['output_path'], 'rb') as f:
+                self.assertEqual(f.read(), images[img_id]['data'])
+    
+    def test_parallel_optimize_matches_serial(self):
+        """测试并行优化的结果与串行一致"""
+        _, serial = self._process('serial')
+        _, parallel = self._process('parallel', jobs=4)
+        
+        self.assertEqual([info['processed_file'] for info in parallel.values()],
+                         [info['processed_file'] for info in serial.values()])
+        self.assertEqual(list(parallel), list(serial))
+        for img_id, info in parallel.items():
+            with open(info['output_path'], 'rb') as f, open(serial[img_id]['output_path'], 'rb') as g:
+                self.assertEqual(f.read(), g.read())
+        
+        # 无法解码的图片写入原始数据
+        with open(parallel['broken']['output_path'], 'rb') as f:
+            self.assertEqual(f.read(), b'not an image')
+    
+    def test_image_store(self):
+        """测试相同的图片在存储中只保存一次，并被多本书引用"""
+        store = os.path.join(self.temp_dir, 'store')
+        images = make_images()
+        images['img1']['data'] = images['img0']['data']
+        
+        first = ResourceProcessor({'images': images}, os.path.join(self.temp_dir, 'book1'),
+                                  image_mode='copy', image_store=store).process_resources()
+        second = ResourceProcessor({'images': images}, os.path.join(self.temp_dir, 'book2'),
+                                   image_mode='copy', image_store=store, jobs=3).process_resources()
+        
+        blobs = [name for _, _, files in os.walk(store) for name in files]
+        self.assertEqual(len(blobs), len(images) - 1)
+        self.assertEqual(first['img0']['store_path'], first['img1']['store_path'])
+        for img_id, info in first.items():
+            self.assertTrue(os.path.samefile(info['output_path'], second[img_id]['output_path']))
+            with open(info['output_path'], 'rb') as f:
+                self.assertEqual(f.read(), images[img_id]['data'])
+    
+    def test_image_store_read_only(self):
+        """测试存储中的文件只读，之后不使用存储写入同一输出目录不会改动存储"""
+        store = os.path.join(self.temp_dir, 'store')
+        output = os.path.join(self.temp_dir, 'book')
+        images = make_images()
+        stored = ResourceProcessor({'images': images}, output, image_mode='copy', image_store=store).process_resources()
+        
+        changed = {img_id: dict(image, data=b'changed') for img_id, image in images.items()}
+        ResourceProcessor({'images': changed}, output, image_mode='copy').process_resources()
+        
+        epub_path = os.path.join(self.temp_dir, 'book.epub')
+        build_epub(epub_path, [('c1', 'Text/c1.xhtml', chapter_html('C1', '<p>正文</p>'))],
+                   [('img', 'Images/a.png', 'image/png', b'archived')])
+        target = os.path.join(self.temp_dir, 'linked.png')
+        os.link(stored['img0']['store_path'], target)
+        archive = EPUBArchive(epub_path)
+        try:
+            archive.copy_to('Images/a.png', target)
+        finally:
+            archive.close()
+        
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), b'archived')
+        for img_id, info in stored.items():
+            self.assertEqual(os.stat(info['store_path']).st_mode & 0o777, 0o444)
+            with open(info['store_path'], 'rb') as f:
+                self.assertEqual(f.read(), images[img_id]['data'])
+    
+    def test_unknown_image_mode(self):
+        """测试未知的图片处理方式"""
+        with self.assertRaises(ValueError):
+            ResourceProcessor({'images': {}}, self.temp_dir, image_mode='unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+全文搜索索引测试
+"""
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+from click.testing import CliRunner
+from epub2md.main import main
+from epub2md.output import OutputGenerator
+from epub2md.pipeline import convert_book
+from epub2md.search import SearchIndex, markdown_to_text, segment
+from tests.epub_builder import build_epub, chapter_html
+
+
+class TestMarkdownToText(unittest.TestCase):
+    """测试Markdown转换为纯文本"""
+    
+    def test_markdown_to_text(self):
+        """测试去掉标记并记录标题位置"""
+        markdown = ('# 第一章 #\n\n正文**粗体** _斜体_ [链接](a.md) ![图](images/a.png)\n\n---\n\n'
+                    '## C#\n\n> * 引用\n\n```\ncode *\n```\n')
+        text, headings = markdown_to_text(markdown)
+        
+        self.assertEqual(text, '第一章\n正文粗体 斜体 链接 图\nC#\n引用\ncode *')
+        self.assertEqual([(h['level'], h['title']) for h in headings], [(1, '第一章'), (2, 'C#')])
+        for heading in headings:
+            self.assertTrue(markdown[heading['offset']:].startswith('#'))
+            self.assertTrue(text[heading['text_offset']:].startswith(heading['title']))
+    
+    def test_segment(self):
+        """测试中日韩字符按字切分，其他文字不变"""
+        self.assertEqual(segment('红楼梦 第2回 Dream'), '红\u200b楼\u200b梦 第\u200b2\u200b回 Dream')
+
+
+class TestSearchIndex(unittest.TestCase):
+    """测试转换时写入索引"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.temp_dir, 'index.sqlite')
+        self.books = []
+        for name, text in (('a', '宝玉和黛玉在大观园里读书。<br/>方才'), ('b', 'The quick brown fox')):
+            path = os.path.join(self.temp_dir, name + '.epub')
+            chapters = [('c1', 'Text/c1.xhtml', chapter_html('C1', '<h1>序</h1><p>开头</p>')),
+                        ('c2', 'Text/c2.xhtml', chapter_html('C2', '<h1>正文</h1><h2>一节</h2><p>%s</p>' % text))]
+            toc = [('第一卷', 'Text/c1.xhtml', [('正文', 'Text/c2.xhtml', [])])]
+            build_epub(path, chapters, toc=toc, metadata={'title': '书' + name})
+            self.books.append(path)
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_shared_index(self):
+        """测试多本书共用一个索引，中文按相邻的字匹配"""
+        for path in self.books:
+            convert_book(path, path[:-len('.epub')], index=self.index_path)
+        # 再次转换同一本书替换以前的记录
+        convert_book(self.books[0], os.path.join(self.temp_dir, 'again'), index=self.index_path)
+        
+        with SearchIndex(self.index_path) as index:
+            results = index.search('大观园')
+            self.assertEqual(len(results), 1)
+            result = results[0]
+            self.assertEqual(result['book'], '书a')
+            self.assertEqual(result['output'], os.path.join(self.temp_dir, 'again'))
+            self.assertEqual(result['spine_index'], 1)
+            self.assertEqual(result['toc_path'], ['第一卷', '正文'])
+            self.assertIn('宝玉和黛玉在[大观园]里读书', result['snippet'])
+            
+            self.assertEqual(index.search('观大'), [])
+            # 短语不跨过标点和换行
+            self.assertEqual(index.search('书方'), [])
+            self.assertEqual(len(index.search('读书。')), 1)
+            self.assertEqual(len(index.search('宝玉 读书')), 1)
+            self.assertEqual(index.search('brown')[0]['book'], '书b')
+            
+            headings = json.loads(index.connection.execute(
+                "SELECT headings FROM chapters WHERE item_id = 'c2' LIMIT 1").fetchone()[0])
+            self.assertEqual([heading['title'] for heading in headings], ['正文', '一节'])
+            self.assertEqual(index.connection.execute('SELECT COUNT(*) FROM books').fetchone()[0], 2)
+    
+    def test_failure_keeps_previous_records(self):
+        """测试转换期间和转换失败时保留以前完整的记录，并删除这次写入的记录"""
+        convert_book(self.books[0], os.path.join(self.temp_dir, 'first'), index=self.index_path)
+        
+        def fail(generator, file, item_id, position='top'):
+            # 第一个章节已写入索引，此时搜索仍然只看到以前的记录
+            with SearchIndex(self.index_path) as index:
+                results = index.search('开头')
+                self.assertEqual([result['output'] for result in results], [os.path.join(self.temp_dir, 'first')])
+            raise RuntimeError('失败')
+        
+        with patch.object(OutputGenerator, '_write_nav_links', autospec=True, side_effect=fail):
+            with self.assertRaises(RuntimeError):
+                convert_book(self.books[0], os.path.join(self.temp_dir, 'out'), index=self.index_path)
+        
+        connection = sqlite3.connect(self.index_path)
+        try:
+            self.assertEqual(connection.execute('SELECT COUNT(*) FROM chapters').fetchone()[0], 2)
+            self.assertEqual(connection.execute('SELECT output FROM books').fetchall(),
+                             [(os.path.join(self.temp_dir, 'first'),)])
+        finally:
+            connection.close()
+    
+    def test_cli(self):
+        """测试 convert-many --index"""
+        result = CliRunner().invoke(main, ['convert-many'] + self.books + [
+            '-o', os.path.join(self.temp_dir, 'out'), '-j', '2', '--no-cache', '--index', self.index_path])
+        
+        self.assertEqual(result.exit_code, 0, result.output)
+        with SearchIndex(self.index_path) as index:
+            self.assertEqual(len(index.search('开头')), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+章节选择测试
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from click.testing import CliRunner
+import epub2md
+from epub2md.epub_parser import EPUBArchive
+from epub2md.main import main
+from epub2md.pipeline import convert_book
+from epub2md.selection import parse_chapter_ranges
+from tests.epub_builder import build_epub, chapter_html
+
+
+class TestSelection(unittest.TestCase):
+    """测试按spine位置和目录标题只转换部分章节"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.epub_path = os.path.join(self.temp_dir, 'book.epub')
+        chapters = []
+        for i in range(1, 6):
+            chapters.append(('c%d' % i, 'Text/c%d.xhtml' % i, chapter_html(
+                'C%d' % i, '<h1>第%d章</h1><p>正文<img src="../Images/i%d.png"/></p>' % (i, i))))
+        images = [('img%d' % i, 'Images/i%d.png' % i, 'image/png', b'png%d' % i) for i in range(1, 6)]
+        # c3 不在目录中，属于第二部分
+        toc = [
+            ('第一部分', 'Text/c1.xhtml', []),
+            ('第二部分', 'Text/c2.xhtml', [('第二部分 附录', 'Text/c4.xhtml', [])]),
+            ('第三部分', 'Text/c5.xhtml', []),
+        ]
+        build_epub(self.epub_path, chapters, images, toc)
+    
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir)
+    
+    def test_parse_chapter_ranges(self):
+        """测试解析章节范围"""
+        self.assertEqual(parse_chapter_ranges('1-3'), [(1, 3)])
+        self.assertEqual(parse_chapter_ranges('2, 4-5,7-'), [(2, 2), (4, 5), (7, None)])
+        for spec in ('', '0', '3-1', 'a-b', '1-3-5'):
+            with self.subTest(spec=spec):
+                with self.assertRaises(ValueError):
+                    parse_chapter_ranges(spec)
+    
+    def test_chapters_reads_only_selected(self):
+        """测试只读取选中的章节和它们引用的图片，文件编号保持不变"""
+        output = os.path.join(self.temp_dir, 'out')
+        with patch.object(EPUBArchive, 'read', autospec=True, side_effect=EPUBArchive.read) as read:
+            convert_book(self.epub_path, output, chapters='2-3', cache_dir=None)
+            read_hrefs = {call.args[1] for call in read.call_args_list}
+        
+        self.assertEqual(sorted(os.listdir(output)), ['02-第二部分.md', '03-第3章.md', 'README.md', 'images'])
+        self.assertEqual(sorted(os.listdir(os.path.join(output, 'images'))), ['i2.png', 'i3.png'])
+        self.assertNotIn('Text/c1.xhtml', read_hrefs)
+        self.assertNotIn('Images/i1.png', read_hrefs)
+        with open(os.path.join(output, 'README.md'), encoding='utf-8') as f:
+            readme = f.read()
+        self.assertIn('[第二部分](02-第二部分.md)', readme)
+        self.assertNotIn('第一部分', readme)
+        self.assertNotIn('附录', readme)
+    
+    def test_toc_match(self):
+        """测试目录部分包括下级目录项和目录中没有列出的文档"""
+        chapters = list(epub2md.iter_chapters(self.epub_path, toc_match='^第二部分$'))
+        self.assertEqual([chapter.id for chapter in chapters], ['c2', 'c3', 'c4'])
+        
+        chapters = list(epub2md.iter_chapters(self.epub_path, chapters=[4, 5], toc_match='部分'))
+        self.assertEqual([chapter.id for chapter in chapters], ['c4', 'c5'])
+        
+        with self.assertRaises(ValueError):
+            list(epub2md.iter_chapters(self.epub_path, toc_match='不存在'))
+    
+    def test_cli(self):
+        """测试 --chapters 和 --toc-match"""
+        output = os.path.join(self.temp_dir, 'book.md')
+        result = CliRunner().invoke(main, [self.epub_path, '-o', output, '--single-file', '--no-cache',
+                                           '--toc-match', '第三'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(output, encoding='utf-8') as f:
+            content = f.read()
+        self.assertIn('# 第三部分', content)
+        self.assertNotIn('第2章', content)
+        
+        for option, value in (('--chapters', '3-1'), ('--toc-match', '(')):
+            with self.subTest(option=option):
+                result = CliRunner().invoke(main, [self.epub_path, '--no-cache', option, value])
+                self.assertEqual(result.exit_code, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
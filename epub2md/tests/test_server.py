@@ -0,0 +1,163 @@
+"""
+服务模式测试
+"""
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+from epub2md.server import JobServer, serve_stdio, make_http_server
+from tests.epub_builder import build_epub, chapter_html
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _crash(task):
+    """在工作进程中异常退出，模拟工作进程被杀掉"""
+    os._exit(1)
+
+
+class TestJobServer(unittest.TestCase):
+    """测试服务模式"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """启动一次服务供所有测试使用"""
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.epub_path = os.path.join(cls.temp_dir, 'book.epub')
+        build_epub(cls.epub_path, [('c1', 'c1.xhtml', chapter_html('C1', '<h1>第一章</h1><p>正文</p>'))])
+        cls.server = JobServer(2, os.path.join(cls.temp_dir, 'out'), image_mode='copy', cache_dir=None)
+    
+    @classmethod
+    def tearDownClass(cls):
+        """测试后清理"""
+        cls.server.close()
+        shutil.rmtree(cls.temp_dir)
+    
+    def test_run(self):
+        """测试任务结果按提交顺序返回，错误的任务不影响其他任务"""
+        output = os.path.join(self.temp_dir, 'out', 'single.md')
+        results = self.server.run([
+            {'id': 'a', 'input': self.epub_path, 'output': output, 'single_file': True},
+            {'id': 'b', 'input': os.path.join(self.temp_dir, 'missing.epub')},
+            {'id': 'c', 'input': self.epub_path, 'unknown': 1},
+            {'input': self.epub_path},
+        ])
+        
+        self.assertEqual([result['ok'] for result in results], [True, False, False, True])
+        self.assertEqual(results[0]['id'], 'a')
+        self.assertTrue(os.path.isfile(output))
+        self.assertIn('FileNotFoundError', results[1]['error'])
+        self.assertIn('unknown', results[2]['error'])
+        self.assertEqual(results[3]['output'], os.path.join(self.temp_dir, 'out', 'book'))
+        self.assertGreaterEqual(results[3]['total'], results[3]['elapsed'])
+    
+    def test_stdio(self):
+        """测试JSON行任务"""
+        stdin = io.StringIO('{"id": 1, "input": "%s"}\n\nnot json\n{"cmd": "stats"}\n' % self.epub_path)
+        stdout = io.StringIO()
+        serve_stdio(self.server, stdin, stdout)
+        
+        # 结果按完成顺序写出
+        lines = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0], {'id': None, 'ok': False, 'error': lines[0]['error']})
+        self.assertEqual([line['workers'] for line in lines if 'workers' in line], [2])
+        job = [line for line in lines if line.get('id') == 1][0]
+        self.assertTrue(job['ok'])
+    
+    def test_http(self):
+        """测试HTTP接口"""
+        listener = make_http_server(self.server, port=0)
+        thread = threading.Thread(target=listener.serve_forever)
+        thread.start()
+        base = 'http://127.0.0.1:%d' % listener.server_address[1]
+        try:
+            with urlopen(base + '/health') as response:
+                self.assertEqual(json.load(response), {'status': 'ok', 'workers': 2, 'restarts': 0})
+            
+            job = json.dumps({'input': self.epub_path, 'output': 'http'})
+            with urlopen(Request(base + '/convert', job.encode('utf-8'))) as response:
+                self.assertEqual(json.load(response)['output'], os.path.join(self.temp_dir, 'out', 'http'))
+            
+            # 输出目录以外的路径被拒绝
+            for job in ({'input': self.epub_path, 'output': '/tmp/elsewhere'},
+                        {'input': self.epub_path, 'output': '../elsewhere'},
+                        {'input': self.epub_path, 'index': '/tmp/elsewhere.sqlite'}):
+                with self.subTest(job=job):
+                    with self.assertRaises(HTTPError) as context:
+                        urlopen(Request(base + '/convert', json.dumps(job).encode('utf-8')))
+                    self.assertEqual(context.exception.code, 422)
+                    self.assertIn('输出目录', json.load(context.exception)['error'])
+                    context.exception.close()
+            self.assertFalse(os.path.exists(os.path.join(self.temp_dir, 'elsewhere')))
+            
+            with self.assertRaises(HTTPError) as context:
+                urlopen(Request(base + '/convert', b'{"input": "missing.epub"}'))
+            self.assertEqual(context.exception.code, 422)
+            context.exception.close()
+            
+            with urlopen(base + '/stats') as response:
+                stats = json.load(response)
+            self.assertGreaterEqual(stats['succeeded'], 1)
+            self.assertEqual(stats['active'], 0)
+        finally:
+            listener.shutdown()
+            listener.server_close()
+            thread.join()
+
+    
+    def test_output_outside(self):
+        """测试符号链接指向输出目录以外时也被拒绝，allow_any_output 时允许"""
+        os.makedirs(os.path.join(self.temp_dir, 'out'), exist_ok=True)
+        link = os.path.join(self.temp_dir, 'out', 'link')
+        os.symlink(self.temp_dir, link)
+        try:
+            with self.assertRaises(ValueError):
+                self.server._make_task({'input': self.epub_path, 'output': 'link/escaped'})
+            self.server.allow_any_output = True
+            task = self.server._make_task({'input': self.epub_path, 'output': '/tmp/elsewhere'})
+            self.assertEqual(task[2], '/tmp/elsewhere')
+        finally:
+            self.server.allow_any_output = False
+            os.unlink(link)
+    
+    def test_worker_crash(self):
+        """测试工作进程异常退出时任务失败，进程池被替换，之后的任务正常执行"""
+        with JobServer(1, os.path.join(self.temp_dir, 'crash'), image_mode='copy', cache_dir=None) as server:
+            with patch('epub2md.server._convert_one', _crash):
+                result = server.run([{'input': self.epub_path}])[0]
+            self.assertFalse(result['ok'])
+            self.assertIn('BrokenProcessPool', result['error'])
+            
+            # 进程池已经损坏时提交的任务也会在替换后的进程池中执行
+            results = server.run([{'input': self.epub_path}, {'input': self.epub_path, 'single_file': True}])
+            self.assertEqual([result['ok'] for result in results], [True, True])
+            self.assertEqual(server.health(), {'status': 'ok', 'workers': 1, 'restarts': 1})
+            stats = server.stats()
+            self.assertEqual((stats['active'], stats['failed'], stats['succeeded']), (0, 1, 2))
+    
+    def test_stdio_verbose(self):
+        """测试 --stdio --verbose 时工作进程的输出不混入结果行"""
+        job = json.dumps({'id': 1, 'input': self.epub_path, 'output': os.path.join(self.temp_dir, 'stdio')})
+        process = subprocess.run([sys.executable, '-m', 'epub2md.main', 'serve', '--stdio', '-j', '1',
+                                  '--images', 'copy', '--no-cache', '-v'],
+                                 input=(job + '\n').encode('utf-8'),
+                                 env=dict(os.environ, PYTHONPATH=PACKAGE_ROOT), cwd=self.temp_dir,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertIn('正在解析EPUB文件', process.stderr.decode('utf-8'))
+        lines = [json.loads(line) for line in process.stdout.decode('utf-8').splitlines()]
+        self.assertEqual([(line['id'], line['ok']) for line in lines], [(1, True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+启动开销测试 - 防止依赖库重新在启动时被导入
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from tests.epub_builder import build_epub, chapter_html
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只在转换时才需要的依赖库
+HEAVY_MODULES = ('bs4', 'html2text', 'PIL', 'lxml', 'sqlite3', 'multiprocessing', 'asyncio', 'epub2md.pipeline',
+                 'epub2md.archive', 'epub2md.resource', 'epub2md.converter')
+
+
+def run_python(*args):
+    """在新的解释器中运行，返回 (标准输出, 标准错误)"""
+    env = dict(os.environ, PYTHONPATH=PACKAGE_ROOT)
+    process = subprocess.run([sys.executable] + list(args), env=env, cwd=PACKAGE_ROOT,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        raise AssertionError(process.stderr)
+    return process.stdout, process.stderr
+
+
+def imported_modules(importtime_output):
+    """从 -X importtime 的输出中取出导入的模块及累计耗时(微秒)"""
+    modules = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+class TestStartup(unittest.TestCase):
+    """测试命令行启动时不导入转换所需的库"""
+    
+    def assertNotHeavy(self, modules):
+        loaded = [name for name in modules if name.split('.')[0] in HEAVY_MODULES or name in HEAVY_MODULES]
+        self.assertEqual(loaded, [])
+    
+    def test_cli_startup(self):
+        """测试 --version 和 --help 不导入转换流程和依赖库"""
+        for option in ('--version', '--help'):
+            with self.subTest(option=option):
+                _, stderr = run_python('-X', 'importtime', '-c', 'from epub2md.main import main; main()', option)
+                modules = imported_modules(stderr)
+                self.assertIn('epub2md.main', modules)
+                self.assertNotHeavy(modules)
+    
+    def test_import_package(self):
+        """测试 import epub2md 不导入库接口，访问时才导入"""
+        stdout, _ = run_python('-c', 'import sys, json, epub2md; before = sorted(sys.modules); '
+                                     'epub2md.iter_chapters; print(json.dumps([before, sorted(sys.modules)]))')
+        before, after = json.loads(stdout)
+        self.assertNotHeavy(before)
+        self.assertIn('epub2md.pipeline', after)
+    
+    def test_book_without_images(self):
+        """测试快速引擎转换没有图片的书时不导入BeautifulSoup和PIL"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            epub_path = os.path.join(temp_dir, 'book.epub')
+            build_epub(epub_path, [('c1', 'c1.xhtml', chapter_html('C1', '<h1>第一章</h1><p>正文</p>'))])
+            stdout, _ = run_python('-c', 'import sys, epub2md; epub2md.convert_book(sys.argv[1], sys.argv[2], '
+                                         'engine="fast"); print(" ".join(sys.modules))',
+                                   epub_path, os.path.join(temp_dir, 'out'))
+            modules = stdout.split()
+            self.assertIn('html2text', modules)
+            self.assertNotIn('bs4', modules)
+            self.assertNotIn('PIL', modules)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()